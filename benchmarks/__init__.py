@@ -0,0 +1,7 @@
+"""Hack-n-TAP benchmark suite.
+
+Run with ``python -m benchmarks`` from the repository root; see
+``python -m benchmarks --help``. Synthetic databases are generated once per
+scale and reused; every case runs in its own process so peak RSS is
+per case.
+"""
@@ -0,0 +1,263 @@
+"""``python -m benchmarks``: run the suite, save results, compare with a baseline."""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+
+from tap.model.storage import ENGINES
+
+from . import cases, dataset
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DATA_DIR = os.path.join(HERE, "data")
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies_ns, elapsed):
+    latencies_ns.sort()
+    return {
+        "ops": len(latencies_ns),
+        "ops_per_sec": round(len(latencies_ns) / elapsed, 1) if elapsed else 0.0,
+        "p50_us": round(percentile(latencies_ns, 0.50) / 1000, 2),
+        "p99_us": round(percentile(latencies_ns, 0.99) / 1000, 2),
+        "mean_us": round(sum(latencies_ns) / len(latencies_ns) / 1000, 2) if latencies_ns else 0.0,
+    }
+
+
+def open_storage(storage, db_path):
+    """The dataset at ``db_path`` in the ``storage`` engine (copied for memory and remote)."""
+    from tap.model.database import SQLiteDatabase
+    from tap.model.storage import copy
+
+    if storage == "sqlite":
+        return SQLiteDatabase(db_path)
+    if storage == "remote":
+        from tap.model.remote import RemoteStorage
+        return RemoteStorage("sqlite:///" + os.path.abspath(dataset.ensure_remote(db_path)))
+    from tap.model.memory import MemoryStorage
+    db, source = MemoryStorage(), SQLiteDatabase(db_path)
+    try:
+        copy(source, db)
+    finally:
+        source.close()
+    return db
+
+
+def run_case(name, db_path, rows, budget, max_ops, storage="sqlite"):
+    """Runs in a child process; returns the case's result dict."""
+    db = open_storage(storage, db_path)
+    try:
+        try:
+            setup = cases.CASES[name](db, rows)
+        except cases.Skip as e:
+            return {"skipped": str(e)}
+        op, teardown = setup if isinstance(setup, tuple) else (setup, None)
+        op()  # warm caches and prepared statements
+        latencies = []
+        clock = time.perf_counter_ns
+        start = clock()
+        deadline = start + int(budget * 1e9)
+        try:
+            while len(latencies) < max_ops:
+                t0 = clock()
+                op()
+                t1 = clock()
+                latencies.append(t1 - t0)
+                if t1 >= deadline:
+                    break
+        finally:
+            if teardown is not None:
+                teardown()
+        result = summarize(latencies, (clock() - start) / 1e9)
+    finally:
+        db.close()
+    result["peak_rss_kb"] = peak_rss_kb()
+    return result
+
+
+def run_in_child(name, db_path, rows, budget, max_ops, storage):
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks", "_case", name, db_path, "--storage", storage,
+         "--rows", str(rows), "--budget", str(budget), "--max-ops", str(max_ops)],
+        capture_output=True, text=True, cwd=ROOT,
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    return json.loads(proc.stdout)
+
+
+def run_startup(name, db_path, repeat):
+    samples = sorted(cases.STARTUP_CASES[name](db_path) for _ in range(repeat))
+    return {
+        "runs": repeat,
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 1),
+        "max_ms": round(samples[-1] * 1000, 1),
+    }
+
+
+# ── Baseline comparison ─────────────────────────────────────────────────
+# metric -> True when larger is better
+METRICS = {"p50_us": False, "p99_us": False, "ops_per_sec": True, "p50_ms": False}
+
+
+def compare(current, baseline, threshold):
+    """``[(case, metric, old, new, change)]`` for every metric worse by more than ``threshold``."""
+    regressions = []
+    for name, result in current["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if not old:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in result or not old.get(metric):
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((name, metric, old[metric], result[metric], change))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'case':<24} {'ops/s':>12} {'p50':>10} {'p99':>10} {'rss MiB':>8}  vs baseline")
+    for name, r in results["cases"].items():
+        if "skipped" in r or "error" in r:
+            print(f"{name:<24} {r.get('skipped') or 'ERROR: ' + r['error']}")
+            continue
+        old = (baseline or {}).get("cases", {}).get(name, {})
+        if "p50_ms" in r:
+            line = f"{name:<24} {'':>12} {r['p50_ms']:>8.1f}ms {r['max_ms']:>8.1f}ms {'':>8}"
+            key = "p50_ms"
+        else:
+            rss = f"{r['peak_rss_kb'] / 1024:.0f}" if r.get("peak_rss_kb") else "-"
+            line = (f"{name:<24} {r['ops_per_sec']:>12.0f} {r['p50_us']:>8.1f}us "
+                    f"{r['p99_us']:>8.1f}us {rss:>8}")
+            key = "p50_us"
+        if old.get(key):
+            line += f"  {(r[key] - old[key]) / old[key]:+.0%}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--scale", choices=sorted(dataset.SCALES), default="small")
+    parser.add_argument("--tags", type=int, help="overrides the scale's tag count")
+    parser.add_argument("--rows", type=int, help="overrides the scale's history row count")
+    parser.add_argument("--data", default=DATA_DIR, help="where generated databases are kept")
+    parser.add_argument("--storage", choices=ENGINES, default="sqlite",
+                        help="engine the cases run against (memory and remote get a copy of the dataset)")
+    parser.add_argument("--cases", help="comma-separated case names (default: all)")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per case")
+    parser.add_argument("--max-ops", type=int, default=200_000, help="operations per case at most")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--output", default="bench-results.json", help="results JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--save-baseline", help="also write the results here")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown flagged as a regression (default 0.2)")
+    parser.add_argument("--list", action="store_true", help="list cases and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(list(cases.CASES) + list(cases.STARTUP_CASES)))
+        return 0
+
+    tags, rows = dataset.SCALES[args.scale]
+    tags, rows = args.tags or tags, args.rows if args.rows is not None else rows
+    selected = args.cases.split(",") if args.cases else list(cases.CASES) + list(cases.STARTUP_CASES)
+    unknown = [n for n in selected if n not in cases.CASES and n not in cases.STARTUP_CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        meta = baseline.get("meta", {})
+        if (meta.get("tags"), meta.get("rows")) != (tags, rows):
+            parser.error(f"baseline was measured with {meta.get('tags')} tags / {meta.get('rows')} rows, "
+                         f"not {tags} / {rows}")
+        if meta.get("storage", "sqlite") != args.storage:
+            parser.error(f"baseline was measured on {meta.get('storage', 'sqlite')}, not {args.storage}")
+
+    started = time.perf_counter()
+    db_path = dataset.ensure(args.data, tags, rows,
+                             progress=lambda n: print(f"\r  generating history: {n}/{rows}", end="",
+                                                      file=sys.stderr, flush=True))
+    generated = time.perf_counter() - started
+    if generated > 1:
+        print(file=sys.stderr)
+
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "tags": tags,
+            "rows": rows,
+            "storage": args.storage,
+        },
+        "cases": {},
+    }
+    for name in selected:
+        print(f"  {name}...", file=sys.stderr, flush=True)
+        if name in cases.CASES:
+            results["cases"][name] = run_in_child(name, db_path, rows, args.budget, args.max_ops, args.storage)
+        elif args.storage != "sqlite":
+            results["cases"][name] = {"skipped": "startup cases run on sqlite only"}
+        else:
+            results["cases"][name] = run_startup(name, db_path, args.startup_runs)
+
+    print_results(results, baseline)
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(f"\nresults: {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, old, new, change in regressions:
+            print(f"REGRESSION {name}.{metric}: {old} -> {new} ({change:+.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+def case_main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks _case")
+    parser.add_argument("name")
+    parser.add_argument("db")
+    parser.add_argument("--storage", choices=ENGINES, default="sqlite")
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--budget", type=float, required=True)
+    parser.add_argument("--max-ops", type=int, required=True)
+    args = parser.parse_args(argv)
+    print(json.dumps(run_case(args.name, args.db, args.rows, args.budget, args.max_ops, args.storage)))
+    return 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["_case"]:
+        sys.exit(case_main(sys.argv[2:]))
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Benchmark cases for the hot paths.
+
+A case is a function ``case(db, rows) -> op`` (or ``(op, teardown)``)
+registered with :func:`case`; the runner calls ``op()`` repeatedly and
+times every call. ``db`` is any storage engine (see ``--storage``), so
+cases stick to the :class:`~tap.model.storage.Storage` methods. Startup
+cases time whole processes instead.
+"""
+
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from .dataset import SCRATCH_TS, discard_scratch, tag_id
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {}
+STARTUP_CASES = {}
+
+# Materialising every history row is only sensible on small datasets.
+MAX_FULL_HISTORY = 1_000_000
+
+# A ``tap serve`` not ready by then is killed and the case fails.
+SERVE_READY_TIMEOUT = 60.0
+
+
+class Skip(Exception):
+    pass
+
+
+def case(fn):
+    CASES[fn.__name__] = fn
+    return fn
+
+
+def startup_case(fn):
+    STARTUP_CASES[fn.__name__] = fn
+    return fn
+
+
+def _random_tags(db, count=10_000):
+    rng = random.Random(42)
+    total = db.count_tags()
+    return [tag_id(rng.randrange(total)) for _ in range(count)]
+
+
+def _cycle(values, fn):
+    state = {"i": 0}
+
+    def op():
+        i = state["i"]
+        state["i"] = i + 1
+        return fn(values[i % len(values)])
+    return op
+
+
+# ── Authorization ───────────────────────────────────────────────────────
+@case
+def validate_tag_hit(db, rows):
+    return _cycle(_random_tags(db), db.validate_tag)
+
+
+@case
+def validate_tag_miss(db, rows):
+    return _cycle([f"MISSING{i}" for i in range(10_000)], db.validate_tag)
+
+
+@case
+def get_all_tags(db, rows):
+    return db.get_all_tags
+
+
+@case
+def search_tags_prefix(db, rows):
+    # Dataset names are "Member <n>": two-digit prefixes match ~1% of them.
+    def op(text):
+        return db.search_tags(text, 20), db.count_tags(text)
+    return _cycle([f"member {i}" for i in range(10, 100)], op)
+
+
+# ── History ─────────────────────────────────────────────────────────────
+@case
+def add_history_entry(db, rows):
+    def op():
+        db.add_history_entry("BENCH", "Bench", timestamp=SCRATCH_TS)
+    return op, lambda: discard_scratch(db)
+
+
+@case
+def history_writer_submit(db, rows):
+    from tap.model.history import HistoryWriter
+
+    writer = HistoryWriter(db)
+    writer.start()
+
+    def op():
+        writer.submit("BENCH", "Bench", timestamp=SCRATCH_TS)
+
+    def teardown():
+        writer.close()
+        discard_scratch(db)
+    return op, teardown
+
+
+@case
+def get_history_entries(db, rows):
+    if rows > MAX_FULL_HISTORY:
+        raise Skip(f"more than {MAX_FULL_HISTORY} rows")
+    return db.get_history_entries
+
+
+@case
+def history_first_page(db, rows):
+    return lambda: db.get_history_page(50)
+
+
+@case
+def history_deep_page(db, rows):
+    rng = random.Random(7)
+    cursors = [rng.randrange(1, rows + 1) for _ in range(1000)] if rows else [1]
+    return _cycle(cursors, lambda before: db.get_history_page(50, before_id=before))
+
+
+@case
+def history_by_tag(db, rows):
+    return _cycle(_random_tags(db, 1000), lambda tag: db.get_history_page(50, tag_id=tag))
+
+
+# ── Reports ─────────────────────────────────────────────────────────────
+@case
+def report_user_totals(db, rows):
+    if not hasattr(db, "get_rollups"):
+        raise Skip("needs the SQLite rollups")
+    try:
+        from tap import report
+        report._numpy()
+    except RuntimeError as e:
+        raise Skip(str(e))
+    return lambda: report.user_totals(db)
+
+
+# ── Process startup ─────────────────────────────────────────────────────
+@startup_case
+def import_cli(db_path):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import tap.cli"], check=True, cwd=ROOT)
+    return time.perf_counter() - start
+
+
+@startup_case
+def serve_ready(db_path):
+    """Process start to the first moment a pour is possible."""
+    env = dict(os.environ, TAP_TAPS="bench=loop://")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "tap.cli", "--db", db_path, "serve"],
+                            env=env, stderr=subprocess.PIPE, text=True, cwd=ROOT)
+    ready = []
+    done = threading.Event()
+
+    def watch():
+        # Drains stderr to the end so the process never blocks on a full pipe.
+        for line in proc.stderr:
+            if not ready and "ready:" in line:
+                ready.append(time.perf_counter() - start)
+                done.set()
+        done.set()
+
+    threading.Thread(target=watch, daemon=True).start()
+    done.wait(SERVE_READY_TIMEOUT)
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    if not ready:
+        raise RuntimeError(f"tap serve not ready after {SERVE_READY_TIMEOUT:.0f} s")
+    return ready[0]
@@ -0,0 +1,140 @@
+"""Synthetic databases at a configurable scale.
+
+Rows are generated inside SQLite with recursive CTEs, with the history
+indexes and the rollup trigger dropped during the bulk insert and rebuilt
+afterwards, so 10M history rows take a minute or two rather than hours.
+"""
+
+import os
+import sqlite3
+
+from tap.model import migrations, rollups
+from tap.model.database import SQLiteDatabase
+
+SCALES = {
+    "small": (1_000, 10_000),
+    "medium": (10_000, 1_000_000),
+    "large": (100_000, 10_000_000),
+}
+
+# Two years of pours ending 2025-01-01.
+HISTORY_END = 1735689600
+HISTORY_SPAN = 2 * 365 * 86400
+INSERT_BATCH = 1_000_000
+
+
+def tag_id(i):
+    return f"{i:08X}"
+
+
+def path_for(directory, tags, rows):
+    return os.path.join(directory, f"bench-{tags}-{rows}.db")
+
+
+def ensure(directory, tags, rows, progress=None):
+    """Path of a database with ``tags`` tags and ``rows`` history rows (built if missing)."""
+    os.makedirs(directory, exist_ok=True)
+    path = path_for(directory, tags, rows)
+    if os.path.exists(path):
+        return path
+    tmp = path + ".building"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(tmp + suffix):
+            os.unlink(tmp + suffix)
+    generate(tmp, tags, rows, progress)
+    os.replace(tmp, path)
+    return path
+
+
+def ensure_remote(path, progress=None):
+    """Path of a remote-engine stand-in (``sqlite:///``) holding a copy of the dataset at ``path``."""
+    from tap.model.remote import RemoteStorage
+    from tap.model.storage import copy
+
+    remote = path + "-remote"
+    if os.path.exists(remote):
+        return remote
+    tmp = remote + ".building"
+    if os.path.exists(tmp):
+        os.unlink(tmp)
+    source, target = SQLiteDatabase(path), RemoteStorage("sqlite:///" + os.path.abspath(tmp))
+    try:
+        copy(source, target, progress=progress)
+    finally:
+        source.close()
+        target.close()
+    os.replace(tmp, remote)
+    return remote
+
+
+def generate(path, tags, rows, progress=None):
+    SQLiteDatabase(path).close()  # schema, triggers, admin
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute('''
+            WITH RECURSIVE c(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM c WHERE i + 1 < ?)
+            INSERT INTO tags (id, name, registered_at)
+            SELECT printf('%08X', i), 'Member ' || i, '2023-01-01 00:00:00' FROM c
+        ''', (tags,))
+        conn.execute('''
+            WITH RECURSIVE c(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM c WHERE i + 1 < ?)
+            INSERT INTO names (id, name) SELECT i + 1, 'Member ' || i FROM c
+        ''', (tags,))
+        conn.execute("DROP TRIGGER history_rollups")
+        indexes = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'history' AND sql IS NOT NULL"
+        ).fetchall()
+        for (name,) in indexes:
+            conn.execute(f"DROP INDEX {name}")
+        conn.commit()
+
+        done = 0
+        while done < rows:
+            count = min(INSERT_BATCH, rows - done)
+            # Multiplicative hashing spreads pours over all members.
+            conn.execute('''
+                WITH RECURSIVE c(i) AS (SELECT :first UNION ALL SELECT i + 1 FROM c WHERE i + 1 < :last)
+                INSERT INTO history (tag_id, ts, name_id)
+                SELECT printf('%08X', (i * 2654435761) % :tags),
+                       :start + i * :span / :rows,
+                       (i * 2654435761) % :tags + 1
+                FROM c
+            ''', {
+                "first": done, "last": done + count, "tags": tags, "rows": rows,
+                "start": HISTORY_END - HISTORY_SPAN, "span": HISTORY_SPAN,
+            })
+            conn.commit()
+            done += count
+            if progress is not None:
+                progress(done)
+
+        for statement in migrations.HISTORY_INDEXES:
+            conn.execute(statement)
+        rollups.rebuild(conn)
+        rollups.ensure(conn)
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+# Write cases stamp their rows in 2100 so the rows and their rollup
+# buckets can be removed afterwards without touching the dataset.
+SCRATCH_TS = 4102444800
+
+
+def discard_scratch(db):
+    from tap.model.remote import RemoteStorage
+
+    if isinstance(db, RemoteStorage):
+        db.execute("DELETE FROM tap_history WHERE ts >= ?", (SCRATCH_TS,))
+        return
+    if not isinstance(db, SQLiteDatabase):
+        return  # in memory: gone with the process
+    with db.lock:
+        db.conn.execute("DELETE FROM history WHERE ts >= ?", (SCRATCH_TS,))
+        db.conn.execute("DELETE FROM rollups WHERE bucket >= '2100'")
+        db.conn.commit()
+
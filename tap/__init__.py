@@ -1 +1,5 @@
 # Hack-n-TAP – RFID Reader System
+import time
+
+# Reference point for the startup time ``tap serve`` reports.
+IMPORTED_AT = time.perf_counter()
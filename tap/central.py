@@ -0,0 +1,213 @@
+"""Stand-in central server for :mod:`tap.sync` (testing and small setups).
+
+Keeps the shared member base and everyone's pours in one SQLite file and
+serves the sync protocol over HTTP:
+
+``GET /tags?since=N&limit=M``
+    Tag changes after sequence ``N``:
+    ``{"seq": last, "more": bool, "changes": [[seq, tag_id, name, registered_at, deleted, changed_at], ...]}``.
+``POST /tags`` ``{"node": id, "changes": [[tag_id, name, registered_at, deleted, changed_at], ...]}``
+    Applied unless the server already holds a newer change of that tag.
+``POST /history`` ``{"node": id, "rows": [[local_id, tag_id, ts, name, tap, ml], ...]}``
+    Stored once per ``(node, local_id)``; replays are ignored. ``ml`` is
+    the measured volume (``null`` for timed doses; older nodes omit it).
+
+Request and response bodies may be gzip-compressed. A production server
+implements the same three endpoints in front of the real database.
+
+``python -m tap.central --port 8765 --db central.db``
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from .sync import decode_body, encode_body
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS members (
+        tag_id TEXT PRIMARY KEY,
+        name TEXT,
+        registered_at TEXT,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at INTEGER NOT NULL,
+        seq INTEGER NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_members_seq ON members (seq)",
+    '''
+    CREATE TABLE IF NOT EXISTS pours (
+        node TEXT NOT NULL,
+        local_id INTEGER NOT NULL,
+        tag_id TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        name TEXT,
+        tap TEXT,
+        ml REAL,
+        received_at INTEGER NOT NULL,
+        PRIMARY KEY (node, local_id)
+    ) WITHOUT ROWID
+    ''',
+)
+
+
+class CentralStore:
+    def __init__(self, path=":memory:"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+            if "ml" not in {row[1] for row in self.conn.execute("PRAGMA table_info(pours)")}:
+                self.conn.execute("ALTER TABLE pours ADD COLUMN ml REAL")
+            self.conn.commit()
+            self.seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM members").fetchone()[0]
+
+    def changes_since(self, since, limit):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, tag_id, name, registered_at, deleted, changed_at FROM members "
+                "WHERE seq > ? ORDER BY seq LIMIT ?", (since, limit + 1)).fetchall()
+        more = len(rows) > limit
+        rows = [list(row) for row in rows[:limit]]
+        return {"seq": rows[-1][0] if rows else since, "more": more, "changes": rows}
+
+    def apply(self, changes):
+        applied = 0
+        with self.lock:
+            for tag_id, name, registered_at, deleted, changed_at in changes:
+                row = self.conn.execute("SELECT changed_at FROM members WHERE tag_id = ?",
+                                        (tag_id,)).fetchone()
+                if row is not None and row[0] > changed_at:
+                    continue  # a newer edit already won
+                self.seq += 1
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO members (tag_id, name, registered_at, deleted, changed_at, seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (tag_id, name, registered_at, 1 if deleted else 0, changed_at, self.seq))
+                applied += 1
+            self.conn.commit()
+        return applied
+
+    def add_pours(self, node, rows):
+        now = int(time.time())
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO pours (node, local_id, tag_id, ts, name, tap, ml, received_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(node, *row[:5], row[5] if len(row) > 5 else None, now) for row in rows])
+            self.conn.commit()
+            accepted = self.conn.total_changes - before
+        return {"accepted": accepted, "duplicates": len(rows) - accepted}
+
+    def pour_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pours").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def make_server(store, port=0, addr="127.0.0.1", token=None):
+    """An HTTP server for ``store`` (call ``serve_forever``; ``server_port`` is the bound port)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _authorized(self):
+            if token and self.headers.get("Authorization") != f"Bearer {token}":
+                self.send_error(401)
+                return False
+            return True
+
+        def _reply(self, payload):
+            gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+            body = encode_body(payload) if gzipped else json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _payload(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return decode_body(self.rfile.read(length), self.headers.get("Content-Encoding"))
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path != "/tags":
+                self.send_error(404)
+                return
+            if not self._authorized():
+                return
+            query = parse_qs(url.query)
+            try:
+                since = int(query.get("since", ["0"])[0])
+                limit = min(int(query.get("limit", ["500"])[0]), 5000)
+            except ValueError:
+                self.send_error(400)
+                return
+            self._reply(store.changes_since(since, limit))
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            if path not in ("/tags", "/history"):
+                self.send_error(404)
+                return
+            if not self._authorized():
+                return
+            try:
+                payload = self._payload()
+                node = str(payload["node"])
+                if path == "/tags":
+                    result = {"applied": store.apply(payload["changes"])}
+                else:
+                    result = store.add_pours(node, payload["rows"])
+            except (KeyError, TypeError, ValueError, OSError) as e:
+                self.send_error(400, str(e))
+                return
+            self._reply(result)
+
+        def log_message(self, format, *args):
+            logger.debug("%s %s", self.address_string(), format % args)
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m tap.central",
+                                     description="Stand-in central server for tap sync.")
+    parser.add_argument("--db", default="central.db")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--addr", default="127.0.0.1")
+    parser.add_argument("--token", help="require this bearer token")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    store = CentralStore(args.db)
+    server = make_server(store, args.port, args.addr, args.token)
+    logger.info("central server on http://%s:%d (%s)", args.addr, server.server_port, args.db)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
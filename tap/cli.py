@@ -0,0 +1,239 @@
+"""Command-line entry point (``tap``).
+
+Without a subcommand the interactive terminal app starts. Subcommands
+import what they need lazily so each one only pays for its own modules.
+"""
+
+import argparse
+import sys
+
+from . import config
+from .model.storage import ENGINES
+
+
+def sqlite_path(args):
+    """The SQLite file of a command that only works on SQLite."""
+    if args.storage != "sqlite":
+        raise SystemExit(f"   '{args.command}' só funciona com TAP_STORAGE=sqlite.")
+    return args.db or config.DB_PATH
+
+
+def cmd_migrate(args):
+    from .model import migrations
+    from .model.pool import ConnectionManager
+
+    pool = ConnectionManager(sqlite_path(args))
+    try:
+        copied = migrations.migrate_history(
+            pool, batch_size=args.batch_size, pause=args.pause,
+            progress=lambda n: print(f"\r   {n} registros convertidos", end="", flush=True),
+        )
+    finally:
+        pool.close()
+    print()
+    if copied:
+        print(f"   Histórico migrado para o esquema compacto ({copied} registros).")
+    else:
+        print("   Nada a migrar: o histórico já está no esquema compacto.")
+    return 0
+
+
+def cmd_report(args):
+    from . import report
+    from .model.database import SQLiteDatabase
+
+    db = SQLiteDatabase(sqlite_path(args))
+    try:
+        totals = report.user_totals(db, args.since, args.until)
+        hours = report.peak_hours(db, args.since, args.until)
+    finally:
+        db.close()
+
+    print(f"   {'TAG':<20} {'NOME':<24} DOSES")
+    for row in totals[:args.top]:
+        print(f"   {row['tag_id']:<20} {row['name']:<24} {row['pours']}")
+    if not totals:
+        print("   Nenhuma dose no período.")
+    print()
+    peak = max(int(hours.max()), 1)
+    for hour, count in enumerate(hours):
+        print(f"   {hour:02d}h {'#' * int(40 * count / peak):<40} {count}")
+
+    if args.csv:
+        report.write_csv(args.csv, totals)
+        print(f"\n   CSV salvo em {args.csv}")
+    if args.png:
+        report.write_png(args.png, totals, hours, top=args.top)
+        print(f"   Gráfico salvo em {args.png}")
+    return 0
+
+
+def cmd_rebuild_rollups(args):
+    from .model.database import SQLiteDatabase
+
+    db = SQLiteDatabase(sqlite_path(args))
+    try:
+        db.rebuild_rollups()
+    finally:
+        db.close()
+    print("   Agregados recalculados a partir do histórico.")
+    return 0
+
+
+def cmd_archive(args):
+    from .model import archive
+    from .model.database import SQLiteDatabase
+
+    days = config.AUDIT_RETENTION_DAYS if args.days is None else args.days
+    if days <= 0 and not args.vacuum:
+        print("   Defina TAP_AUDIT_RETENTION_DAYS ou use --days.", file=sys.stderr)
+        return 2
+    db = SQLiteDatabase(sqlite_path(args))
+    try:
+        if args.vacuum:
+            archive.enable_incremental_vacuum(db)
+            print("   Banco compactado; o espaço do histórico arquivado volta aos poucos daqui em diante.")
+        if days > 0:
+            summary = archive.archive_history(db, days)
+    finally:
+        db.close()
+    if days > 0:
+        months = ", ".join(summary['months']) or "nenhum mês"
+        print(f"   {summary['archived']} doses com mais de {days} dias arquivadas ({months}), "
+              f"{summary['freed_pages']} páginas liberadas.")
+    return 0
+
+
+def cmd_import(args):
+    from . import transfer
+    from .model.storage import open_storage
+
+    db = open_storage(args.storage, args.db)
+    try:
+        counts = db.import_tags(transfer.read_tags(args.file, args.format), chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    print(f"   {counts['inserted']} inseridas, {counts['updated']} atualizadas, "
+          f"{counts['unchanged']} sem alteração, {counts['rejected']} rejeitadas.")
+    return 1 if counts['rejected'] else 0
+
+
+def cmd_export(args):
+    from . import transfer
+    from .model.storage import open_storage
+
+    db = open_storage(args.storage, args.db)
+    try:
+        count = transfer.write_tags(args.file, db.export_tags(), args.format)
+    finally:
+        db.close()
+    if args.file != "-":
+        print(f"   {count} tags exportadas para {args.file}")
+    return 0
+
+
+def cmd_sync(args):
+    from .model.database import SQLiteDatabase
+    from .sync import SyncClient, SyncError, Syncer
+
+    if not (args.url or config.SYNC_URL):
+        print("   Defina TAP_SYNC_URL ou use --url.", file=sys.stderr)
+        return 2
+    db = SQLiteDatabase(sqlite_path(args))
+    try:
+        counts = Syncer(db, SyncClient(args.url)).sync_once()
+    except SyncError as e:
+        print(f"   Falha na sincronização: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    print(f"   {counts['tags_pushed']} alterações de tags enviadas, {counts['tags_pulled']} recebidas, "
+          f"{counts['history_pushed']} doses enviadas.")
+    return 0
+
+
+def cmd_serve(args):
+    import logging
+    from .serve import serve
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return serve(args.db, args.storage)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="tap", description="Hack-n-TAP – RFID Reader System")
+    parser.add_argument("--storage", choices=ENGINES, default=config.STORAGE,
+                        help=f"motor de armazenamento (padrão: TAP_STORAGE, {config.STORAGE})")
+    parser.add_argument("--db", help="arquivo SQLite ou URL do servidor "
+                                     "(padrão: TAP_DB_PATH ou TAP_DB_URL)")
+    parser.add_argument("--profile", action="store_true",
+                        help="grava um relatório de desempenho em TAP_PROFILE_DIR "
+                             "(SIGUSR1 liga/desliga o cProfile; memória e SQL sempre)")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("serve", help="validação sem terminal (serviço), direto ao ligar")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("migrate", help="converte o histórico legado para o esquema compacto")
+    p.add_argument("--batch-size", type=int, default=5000, help="registros por transação")
+    p.add_argument("--pause", type=float, default=0.0, help="segundos entre lotes")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("report", help="relatório de consumo por usuário e por hora")
+    p.add_argument("--since", help="data inicial (AAAA-MM-DD, inclusiva)")
+    p.add_argument("--until", help="data final (AAAA-MM-DD, exclusiva)")
+    p.add_argument("--top", type=int, default=20, help="usuários exibidos")
+    p.add_argument("--csv", help="salva os totais por usuário em CSV (ex: consumo.csv)")
+    p.add_argument("--png", help="salva o gráfico em PNG (ex: grafico.png)")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("rebuild-rollups", help="recalcula os agregados de consumo a partir do histórico")
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("archive", help="move o histórico antigo para arquivos mensais comprimidos")
+    p.add_argument("--days", type=int, help="dias mantidos no banco (padrão: TAP_AUDIT_RETENTION_DAYS)")
+    p.add_argument("--vacuum", action="store_true",
+                   help="compacta o banco e ativa o vacuum incremental (uma vez, em bancos antigos)")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("import", help="importa tags de um arquivo CSV ou JSONL")
+    p.add_argument("file", help="arquivo com tag_id,name[,registered_at] ('-' para stdin)")
+    p.add_argument("--format", choices=("csv", "jsonl"), help="padrão: pela extensão do arquivo")
+    p.add_argument("--chunk-size", type=int, default=500, help="linhas por executemany")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="exporta as tags para CSV ou JSONL")
+    p.add_argument("file", help="arquivo de saída ('-' para stdout)")
+    p.add_argument("--format", choices=("csv", "jsonl"), help="padrão: pela extensão do arquivo")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("sync", help="sincroniza tags e histórico com o servidor central agora")
+    p.add_argument("--url", help="padrão: TAP_SYNC_URL")
+    p.set_defaults(func=cmd_sync)
+
+    return parser
+
+
+def run(args, profiler=None):
+    if args.command is None:
+        from .main import MinimalRFIDApp
+        MinimalRFIDApp(db_file=args.db, storage=args.storage, profiler=profiler).run()
+        return 0
+    return args.func(args)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.profile:
+        return run(args)
+    from .profiling import Profiler
+
+    profiler = Profiler().start()
+    try:
+        return run(args, profiler)
+    finally:
+        print(f"   Relatório de desempenho salvo em {profiler.close()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Runtime settings read from the environment (see ``env.example``)."""
+
+import os
+
+
+def env_str(name, default=""):
+    value = os.environ.get(name)
+    return value.strip() if value is not None and value.strip() else default
+
+
+def env_int(name, default):
+    try:
+        return int(env_str(name, str(default)))
+    except ValueError:
+        return default
+
+
+def env_float(name, default):
+    try:
+        return float(env_str(name, str(default)))
+    except ValueError:
+        return default
+
+
+# ── Validation engine ───────────────────────────────────────────────────
+POUR_SECONDS = env_float("TAP_POUR_SECONDS", 10.0)
+BUSY_POLICY = env_str("TAP_BUSY_POLICY", "queue")  # queue | reject | extend
+MAX_PENDING = env_int("TAP_MAX_PENDING", 8)
+UI_INTERVAL = env_float("TAP_UI_INTERVAL", 0.1)
+# Longest wait for a tag lookup on a remote engine; past it the read is refused.
+LOOKUP_TIMEOUT = env_float("TAP_LOOKUP_TIMEOUT", 2.0)
+# Flow meter on the valve port (see tap.flow); 0 keeps timed doses.
+FLOW_PULSES_PER_LITRE = env_float("TAP_FLOW_PULSES_PER_LITRE", 0.0)  # YF-S201: ~450
+POUR_ML = env_float("TAP_POUR_ML", 300.0)  # dose with a flow meter; POUR_SECONDS caps it
+
+# ── Limits ──────────────────────────────────────────────────────────────
+# Per tag; 0 disables. The first name is shared with the web settings.
+MAX_VALIDATIONS_PER_MINUTE = env_int("TAP_MAX_VALIDATIONS_PER_MINUTE",
+                                     env_int("MAX_VALIDATIONS_PER_MINUTE", 0))
+DAILY_QUOTA = env_int("TAP_DAILY_QUOTA", 0)  # doses per tag per local day
+LIMIT_SNAPSHOT_SECONDS = env_float("TAP_LIMIT_SNAPSHOT_SECONDS", 30.0)
+
+# ── Multi-tap ───────────────────────────────────────────────────────────
+# "name=port,name=port"; empty runs a single tap on the detected port.
+TAPS = env_str("TAP_TAPS")
+VALVE_BAUD = env_int("TAP_VALVE_BAUD", 9600)
+VALVE_WRITE_TIMEOUT = env_float("TAP_VALVE_WRITE_TIMEOUT", 1.0)
+VALVE_RECONNECT_SECONDS = env_float("TAP_VALVE_RECONNECT_SECONDS", 5.0)  # max backoff
+VALVE_PROTOCOL = env_str("TAP_VALVE_PROTOCOL", "raw")  # raw | framed (acknowledged)
+VALVE_ACK_TIMEOUT = env_float("TAP_VALVE_ACK_TIMEOUT", 0.2)
+VALVE_RETRIES = env_int("TAP_VALVE_RETRIES", 3)
+VALVE_HEARTBEAT = env_float("TAP_VALVE_HEARTBEAT", 2.0)
+VALVE_BOOT_SECONDS = env_float("TAP_VALVE_BOOT_SECONDS", 3.0)
+
+# ── RFID reader ─────────────────────────────────────────────────────────
+READER = env_str("TAP_READER", "keyboard")  # keyboard | serial
+READER_PORT = env_str("TAP_READER_PORT")  # empty: same port as the valve
+READER_BAUD = env_int("TAP_READER_BAUD", 9600)
+READER_FRAMING = env_str("TAP_READER_FRAMING", "line")  # line | stxetx | fixed
+READER_FRAME_LENGTH = env_int("TAP_READER_FRAME_LENGTH", 10)
+DEBOUNCE_SECONDS = env_float("TAP_DEBOUNCE_SECONDS", 1.0)
+
+# ── History writer ──────────────────────────────────────────────────────
+HISTORY_BATCH_SIZE = env_int("TAP_HISTORY_BATCH_SIZE", 64)
+HISTORY_FLUSH_SECONDS = env_float("TAP_HISTORY_FLUSH_SECONDS", 1.0)
+
+# ── Storage ─────────────────────────────────────────────────────────────
+STORAGE = env_str("TAP_STORAGE", "sqlite")  # sqlite | memory | remote
+DB_PATH = env_str("TAP_DB_PATH", "rfid_system.db")  # relative paths follow the working directory
+# Central SQL server for TAP_STORAGE=remote (mysql://, postgresql:// or a
+# sqlite:/// stand-in). The second name is shared with the web settings.
+DB_URL = env_str("TAP_DB_URL", env_str("DATABASE_URL"))
+TAG_SNAPSHOT = env_str("TAP_TAG_SNAPSHOT")  # empty: "<database>-tags"
+DB_OPEN_TIMEOUT = env_float("TAP_DB_OPEN_TIMEOUT", 10.0)  # wait when there is no snapshot
+DB_RETRY_SECONDS = env_float("TAP_DB_RETRY_SECONDS", 5.0)
+
+# ── History retention ───────────────────────────────────────────────────
+# Days of history kept in SQLite; older pours move to monthly archives.
+# 0 keeps everything. The second name is shared with the web settings.
+AUDIT_RETENTION_DAYS = env_int("TAP_AUDIT_RETENTION_DAYS", env_int("AUDIT_RETENTION_DAYS", 0))
+ARCHIVE_DIR = env_str("TAP_ARCHIVE_DIR")  # empty: "<database>-archive"
+ARCHIVE_INTERVAL = env_float("TAP_ARCHIVE_INTERVAL", 3600.0)
+ARCHIVE_BATCH_SIZE = env_int("TAP_ARCHIVE_BATCH_SIZE", 500)  # rows deleted per transaction
+
+# ── Central sync ────────────────────────────────────────────────────────
+SYNC_URL = env_str("TAP_SYNC_URL")  # empty: standalone, no sync
+SYNC_TOKEN = env_str("TAP_SYNC_TOKEN")
+SYNC_INTERVAL = env_float("TAP_SYNC_INTERVAL", 30.0)
+SYNC_BATCH_SIZE = env_int("TAP_SYNC_BATCH_SIZE", 500)
+SYNC_TIMEOUT = env_float("TAP_SYNC_TIMEOUT", 10.0)
+
+# ── Dashboard ───────────────────────────────────────────────────────────
+DASHBOARD_PORT = env_int("TAP_DASHBOARD_PORT", 0)  # 0: no dashboard (needs aiohttp)
+DASHBOARD_ADDR = env_str("TAP_DASHBOARD_ADDR", "0.0.0.0")  # reachable from the lab TV and phones
+DASHBOARD_EVENTS = env_int("TAP_DASHBOARD_EVENTS", 500)  # ring buffer size
+
+# ── Metrics ─────────────────────────────────────────────────────────────
+METRICS_PORT = env_int("TAP_METRICS_PORT", 0)  # 0: no HTTP endpoint
+METRICS_ADDR = env_str("TAP_METRICS_ADDR", "127.0.0.1")
+METRICS_FILE = env_str("TAP_METRICS_FILE")  # empty: no text file
+METRICS_INTERVAL = env_float("TAP_METRICS_INTERVAL", 15.0)
+
+# ── Profiling (tap --profile) ───────────────────────────────────────────
+PROFILE_DIR = env_str("TAP_PROFILE_DIR", "tap-profile")  # one timestamped bundle per run
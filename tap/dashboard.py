@@ -0,0 +1,394 @@
+"""Live web dashboard: recent pours, tap status and pour rates.
+
+The validation engines publish their events into an :class:`EventFeed`,
+an in-memory ring buffer. Publishing is an append under a lock and, only
+while someone is watching, one coalesced wake-up of the dashboard thread.
+Browsers get the buffer once and then follow it over server-sent events
+(``GET /events``); nothing they do touches SQLite or the engines, so the
+hot path costs the same for zero viewers or fifty. The pour rates come
+from per-window timestamp lists kept next to the buffer, so they stay
+right however many events the buffer (or the page) shows.
+
+The server runs aiohttp on its own thread and event loop. aiohttp is
+optional: ``pip install 'hack-n-tap[dashboard]'`` and set ``TAP_DASHBOARD_PORT``.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Per-pour countdown frames; the page animates the pour itself.
+SKIPPED_EVENTS = frozenset({'tick'})
+KEEPALIVE_SECONDS = 15.0
+# Event streams never finish on their own; don't wait for them on shutdown.
+SHUTDOWN_SECONDS = 0.5
+# Events counted for the rates, and the longest rate window (seconds).
+RATE_EVENTS = ('open', 'denied')
+RATE_WINDOW = 3600.0
+
+
+class EventFeed:
+    """Ring buffer of the latest engine events plus the current state of each tap."""
+
+    def __init__(self, size=None):
+        self.events = collections.deque(maxlen=size or config.DASHBOARD_EVENTS)
+        self.taps = {}
+        self.counts = collections.Counter()
+        # Timestamps of the rate events within RATE_WINDOW, oldest first.
+        self.recent = {event: collections.deque() for event in RATE_EVENTS}
+        self.seq = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._viewers = 0
+        self._wake_pending = False
+        self._loop = None
+        self._changed = None
+
+    # ── Producer side (engine threads) ───────────────────────────────
+    def publish(self, event, tap=None, **data):
+        """``on_event`` handler: record the event for the dashboard."""
+        if event in SKIPPED_EVENTS:
+            return
+        now = time.time()
+        with self._lock:
+            self.seq += 1
+            entry = dict(data, seq=self.seq, ts=now, event=event, tap=tap)
+            self.events.append(entry)
+            self.counts[event] += 1
+            if event in self.recent:
+                self.recent[event].append(now)
+                self._prune(now)
+            self._update_tap(entry)
+            wake = self._viewers and not self._wake_pending
+            if wake:
+                self._wake_pending = True
+        if wake:
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _update_tap(self, entry):
+        state = self.taps.setdefault(entry['tap'] or "", {'state': 'idle', 'name': None, 'since': entry['ts']})
+        event = entry['event']
+        if event == 'open':
+            state.update(state='pouring', name=entry['name'], since=entry['ts'],
+                         seconds=entry.get('seconds'))
+        elif event in ('closed', 'ready'):
+            state.update(state='idle', name=None, since=entry['ts'])
+        elif event == 'fault':
+            state.update(state='fault', name=entry['name'], since=entry['ts'])
+        elif event == 'stopped':
+            state.update(state='stopped', name=None, since=entry['ts'])
+        state['last'] = entry['ts']
+
+    def _prune(self, now):
+        for stamps in self.recent.values():
+            while stamps and stamps[0] <= now - RATE_WINDOW:
+                stamps.popleft()
+
+    def seed(self, entries):
+        """Prefill recent pours from history entries (newest first), as ``open`` events."""
+        with self._lock:
+            for row in reversed(entries):
+                self.seq += 1
+                self.events.append({'seq': self.seq, 'ts': row['ts'], 'event': 'open',
+                                    'tap': row['tap'], 'tag_id': row['tag_id'], 'name': row['name'],
+                                    'ml': row.get('ml'), 'seeded': True})
+                self.recent['open'].append(row['ts'])
+            self._prune(time.time())
+
+    # ── Dashboard side ───────────────────────────────────────────────
+    def snapshot(self):
+        with self._lock:
+            self._prune(time.time())
+            return {
+                'seq': self.seq,
+                'started': self.started,
+                'pour_seconds': config.POUR_SECONDS,
+                'taps': {name: dict(state) for name, state in self.taps.items()},
+                'counts': dict(self.counts),
+                'recent': {event: list(stamps) for event, stamps in self.recent.items()},
+                'events': list(self.events),
+            }
+
+    def since(self, seq):
+        """Events after ``seq``, or ``None`` if some already fell off the buffer."""
+        with self._lock:
+            if self.seq == seq:
+                return []
+            if seq > self.seq or not self.events or self.events[0]['seq'] > seq + 1:
+                return None
+            return [e for e in self.events if e['seq'] > seq]
+
+    def attach(self, loop):
+        self._loop = loop
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        with self._lock:
+            self._wake_pending = False
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def follow(self, seq, timeout):
+        """Wait until there is news after ``seq`` (or ``timeout``); returns ``since(seq)``."""
+        # Counted before looking, so a publish in between still wakes us.
+        with self._lock:
+            self._viewers += 1
+        try:
+            changed = self._changed
+            news = self.since(seq)
+            if news == []:
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return []
+                news = self.since(seq)
+            return news
+        finally:
+            with self._lock:
+                self._viewers -= 1
+
+
+def _sse(event, payload, seq=None):
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+def make_app(feed):
+    from aiohttp import web
+
+    async def index(request):
+        return web.Response(text=PAGE, content_type="text/html", charset="utf-8")
+
+    async def state(request):
+        return web.json_response(feed.snapshot(), dumps=lambda o: json.dumps(o, default=str))
+
+    async def events(request):
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+        await response.prepare(request)
+        try:
+            seq = int(request.headers.get("Last-Event-ID", ""))
+            news = feed.since(seq)
+        except ValueError:
+            news = None
+        try:
+            while True:
+                if news is None:
+                    snapshot = feed.snapshot()
+                    seq = snapshot['seq']
+                    await response.write(_sse("state", snapshot, seq))
+                elif not news:
+                    await response.write(b": keepalive\n\n")
+                for entry in news or ():
+                    seq = entry['seq']
+                    await response.write(_sse("pour" if entry['event'] == 'open' else "event", entry, seq))
+                news = await feed.follow(seq, KEEPALIVE_SECONDS)
+        except ConnectionResetError:
+            pass  # viewer went away
+        return response
+
+    app = web.Application()
+    app.router.add_get("/", index)
+    app.router.add_get("/state", state)
+    app.router.add_get("/events", events)
+    return app
+
+
+class Dashboard(threading.Thread):
+    """aiohttp server for ``feed`` on its own thread; ``port`` is the bound port."""
+
+    def __init__(self, feed, port=None, addr=None):
+        super().__init__(name="dashboard", daemon=True)
+        self.feed = feed
+        self.addr = config.DASHBOARD_ADDR if addr is None else addr
+        self.sock = socket.create_server((self.addr, config.DASHBOARD_PORT if port is None else port))
+        self.port = self.sock.getsockname()[1]
+        self.loop = asyncio.new_event_loop()
+        self._runner = None
+        self._ready = threading.Event()
+
+    def start(self):
+        super().start()
+        self._ready.wait(5)
+        return self
+
+    def run(self):
+        from aiohttp import web
+
+        asyncio.set_event_loop(self.loop)
+        self.feed.attach(self.loop)
+        self._runner = web.AppRunner(make_app(self.feed), handle_signals=False,
+                                     shutdown_timeout=SHUTDOWN_SECONDS)
+        self.loop.run_until_complete(self._runner.setup())
+        self.loop.run_until_complete(web.SockSite(self._runner, self.sock).start())
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self._runner.cleanup())
+            # Open event streams are still being cancelled.
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+
+    def stop(self, timeout=5):
+        if self.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.join(timeout)
+
+
+def start_dashboard(db=None):
+    """Serve the dashboard if ``TAP_DASHBOARD_PORT`` is set; returns ``(feed, server)`` or ``(None, None)``."""
+    if not config.DASHBOARD_PORT:
+        return None, None
+    try:
+        import aiohttp  # noqa: F401
+    except ImportError:
+        logger.warning("dashboard: TAP_DASHBOARD_PORT is set but aiohttp is not installed "
+                       "(pip install 'hack-n-tap[dashboard]')")
+        return None, None
+    feed = EventFeed()
+    if db is not None:
+        ready = getattr(db, "ready", None)  # FailoverDatabase opens in the background
+        if ready is not None:
+            ready.wait(1.0)
+        try:
+            feed.seed(db.get_history_page(config.DASHBOARD_EVENTS // 2))
+        except sqlite3.Error as e:
+            logger.warning("dashboard: no recent pours to show yet (%s)", e)
+    try:
+        server = Dashboard(feed).start()
+    except OSError as e:
+        logger.error("dashboard: cannot listen on %s:%d (%s)", config.DASHBOARD_ADDR, config.DASHBOARD_PORT, e)
+        return None, None
+    logger.info("dashboard on http://%s:%d/", server.addr, server.port)
+    return feed, server
+
+
+PAGE = """<!doctype html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Hack-n-TAP</title>
+<style>
+  body { margin: 0; font-family: system-ui, sans-serif; background: #111; color: #eee; }
+  header { padding: 1rem 1.5rem; display: flex; justify-content: space-between; align-items: baseline; }
+  h1 { margin: 0; font-size: 1.6rem; color: #f5b921; }
+  #conn { font-size: .9rem; color: #888; }
+  main { display: grid; gap: 1rem; padding: 0 1.5rem 1.5rem; grid-template-columns: repeat(auto-fit, minmax(18rem, 1fr)); }
+  section { background: #1c1c1c; border-radius: .6rem; padding: 1rem; }
+  h2 { margin: 0 0 .6rem; font-size: 1rem; color: #aaa; text-transform: uppercase; letter-spacing: .05em; }
+  .tap { display: flex; justify-content: space-between; padding: .4rem 0; border-bottom: 1px solid #2a2a2a; }
+  .pouring { color: #5fd35f; } .idle { color: #888; } .fault, .stopped { color: #e55; }
+  .rates { display: flex; gap: 1.5rem; } .rates b { display: block; font-size: 2rem; color: #f5b921; }
+  ol { list-style: none; margin: 0; padding: 0; max-height: 60vh; overflow-y: auto; }
+  li { padding: .35rem 0; border-bottom: 1px solid #2a2a2a; display: flex; justify-content: space-between; }
+  li small { color: #888; }
+  .denied, .limited, .busy { color: #e59a55; }
+</style>
+</head>
+<body>
+<header><h1>🍺 Hack-n-TAP</h1><span id="conn">conectando…</span></header>
+<main>
+  <section><h2>Torneiras</h2><div id="taps"></div></section>
+  <section><h2>Ritmo</h2>
+    <div class="rates">
+      <div><b id="minute">0</b>doses no último minuto</div>
+      <div><b id="hour">0</b>doses na última hora</div>
+      <div><b id="denied">0</b>negadas na última hora</div>
+    </div>
+  </section>
+  <section><h2>Últimas doses</h2><ol id="pours"></ol></section>
+  <section><h2>Eventos</h2><ol id="events"></ol></section>
+</main>
+<script>
+const LABELS = {pouring: "servindo", idle: "livre", fault: "falha na válvula", stopped: "parada"};
+const EVENTS = {denied: "negada", limited: "limite", busy: "ocupada", queued: "na fila",
+                extended: "dose extra", closed: "fechou", fault: "falha", ready: "pronta", stopped: "parada"};
+// Rate windows: timestamps of every pour and denial in the last hour, apart
+// from the (truncated) lists shown.
+let taps = {}, pours = [], recent = {open: [], denied: []};
+const $ = (id) => document.getElementById(id);
+const time = (ts) => new Date(ts * 1000).toLocaleTimeString("pt-BR");
+const esc = (s) => String(s ?? "").replace(/[&<>"]/g, (c) => ({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[c]));
+
+function tapState(e) {
+  const t = taps[e.tap || ""] = taps[e.tap || ""] || {state: "idle"};
+  if (e.event === "open") Object.assign(t, {state: "pouring", name: e.name, since: e.ts, seconds: e.seconds});
+  else if (e.event === "closed" || e.event === "ready") Object.assign(t, {state: "idle", name: null});
+  else if (e.event === "fault") Object.assign(t, {state: "fault", name: e.name});
+  else if (e.event === "stopped") Object.assign(t, {state: "stopped", name: null});
+}
+
+function add(e) {
+  if (e.event === "open") {
+    pours.unshift(e);
+    pours = pours.slice(0, 50);
+  } else {
+    const li = document.createElement("li");
+    li.className = e.event;
+    li.innerHTML = `<span>${EVENTS[e.event] || esc(e.event)} ${esc(e.name || e.tag_id || "")}` +
+                   `${e.tap ? " · " + esc(e.tap) : ""}${e.ml != null ? " · " + Math.round(e.ml) + " ml" : ""}</span>` +
+                   `<small>${time(e.ts)}</small>`;
+    $("events").prepend(li);
+    while ($("events").children.length > 50) $("events").lastChild.remove();
+  }
+}
+
+function render() {
+  const now = Date.now() / 1000;
+  $("taps").innerHTML = Object.keys(taps).sort().map((name) => {
+    const t = taps[name];
+    let detail = LABELS[t.state] || t.state;
+    if (t.state === "pouring") {
+      const left = Math.max(0, Math.ceil((t.seconds || 0) - (now - t.since)));
+      detail += ` · ${esc(t.name)}${t.seconds ? " · " + left + " s" : ""}`;
+    }
+    return `<div class="tap"><span>${esc(name || "Torneira")}</span><span class="${t.state}">${detail}</span></div>`;
+  }).join("") || "<small>sem atividade ainda</small>";
+  $("pours").innerHTML = pours.map((p) =>
+    `<li><span>${esc(p.name || p.tag_id)}${p.tap ? " · " + esc(p.tap) : ""}</span><small>${time(p.ts)}</small></li>`).join("");
+  for (const event in recent) recent[event] = recent[event].filter((ts) => now - ts < 3600);
+  $("minute").textContent = recent.open.filter((ts) => now - ts < 60).length;
+  $("hour").textContent = recent.open.length;
+  $("denied").textContent = recent.denied.length;
+}
+
+const source = new EventSource("events");
+source.addEventListener("state", (m) => {
+  const s = JSON.parse(m.data);
+  taps = s.taps; pours = []; recent = s.recent;
+  $("events").innerHTML = "";
+  s.events.forEach(add);
+  render();
+});
+const live = (m) => {
+  const e = JSON.parse(m.data);
+  if (recent[e.event]) recent[e.event].push(e.ts);
+  add(e); tapState(e); render();
+};
+source.addEventListener("pour", live);
+source.addEventListener("event", live);
+source.onopen = () => { $("conn").textContent = "ao vivo"; };
+source.onerror = () => { $("conn").textContent = "reconectando…"; };
+setInterval(render, 1000);
+</script>
+</body>
+</html>
+"""
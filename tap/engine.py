@@ -0,0 +1,358 @@
+"""Event-driven validation engine.
+
+Tag input, the valve timer, history persistence and UI refresh run as
+separate asyncio tasks, so a pour never stops new reads from being
+processed. Reads that arrive while the valve is open are handled according
+to ``busy_policy``:
+
+* ``queue``  – authorized tags wait for the current pour to finish;
+* ``reject`` – authorized tags are refused until the valve closes;
+* ``extend`` – the current pour is extended by another dose.
+
+Authorized reads first go through the optional ``limiter`` (see
+:mod:`tap.ratelimit`). All deadlines use the loop's monotonic clock.
+Every stage of a pour is timed into ``metrics`` (see :mod:`tap.metrics`).
+
+Lookups on a storage engine with ``remote_lookup`` (a network round trip,
+see :mod:`tap.model.remote`) run on their own thread and are refused after
+``lookup_timeout`` seconds, so a slow or unreachable server delays reads
+but never the valve.
+
+With a ``flow`` meter (see :mod:`tap.flow`) a dose is ``pour_ml``: the
+valve closes as soon as that much has flowed, or at the deadline if it
+never does, and history records the measured volume when the valve
+closes. Without one, a dose is ``pour_seconds`` and history is recorded
+when the valve opens.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from .flow import split_volume
+from .metrics import EngineMetrics
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("queue", "reject", "extend")
+
+
+class ValidationEngine:
+    def __init__(self, db, send_command, pour_seconds=None, busy_policy=None,
+                 max_pending=None, ui_interval=None, on_event=None, record_history=None,
+                 metrics=None, limiter=None, flow=None, pour_ml=None, lookup_timeout=None):
+        self.db = db
+        self.send_command = send_command
+        # e.g. ``HistoryWriter.submit``; defaults to a synchronous insert.
+        self.record_history = record_history or db.add_history_entry
+        self.pour_seconds = config.POUR_SECONDS if pour_seconds is None else pour_seconds
+        self.busy_policy = busy_policy or config.BUSY_POLICY
+        if self.busy_policy not in POLICIES:
+            raise ValueError(f"busy_policy must be one of {POLICIES}, got {self.busy_policy!r}")
+        self.max_pending = config.MAX_PENDING if max_pending is None else max_pending
+        self.ui_interval = config.UI_INTERVAL if ui_interval is None else ui_interval
+        self.on_event = on_event
+        self.metrics = metrics or EngineMetrics()
+        # Optional ``RateLimiter``, consulted before a read can pour.
+        self.limiter = limiter
+        # Optional ``FlowMeter``: doses by volume, ``pour_seconds`` is the cap.
+        self.flow = flow
+        self.pour_ml = config.POUR_ML if pour_ml is None else pour_ml
+        self.lookup_timeout = config.LOOKUP_TIMEOUT if lookup_timeout is None else lookup_timeout
+        # Looked up on the class: FailoverDatabase forwards instance attributes.
+        remote = getattr(type(db), 'remote_lookup', False)
+
+        self.valve_open = False
+        self.opened = None
+        self.deadline = None
+        self.doses = []  # (tag_id, name) of each dose in the pour, with a flow meter
+        self.stats = {'reads': 0, 'granted': 0, 'denied': 0, 'rejected': 0, 'limited': 0, 'pours': 0}
+
+        self._loop = None
+        self._early = []
+        self._tags = None
+        self._pours = None
+        self._history = None
+        self._stopping = None
+        self._stop_requested = False
+        # One thread per engine keeps valve commands ordered and lets a hung
+        # serial write stall only this tap.
+        self._valve_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="valve")
+        self._history_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self._lookup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lookup") if remote else None
+
+    # ── Thread-safe entry points ─────────────────────────────────────
+    def submit(self, tag_id):
+        """Queue a tag read; safe to call from any thread."""
+        loop = self._loop
+        if loop is None:
+            self._early.append(tag_id)
+            return
+        loop.call_soon_threadsafe(self._accept, tag_id)
+
+    def stop(self):
+        loop = self._loop
+        if loop is None:
+            self._stop_requested = True
+            return
+        loop.call_soon_threadsafe(self._stopping.set)
+
+    def _accept(self, tag_id):
+        self._tags.put_nowait((tag_id, self._loop.time()))
+
+    def _emit(self, event, **data):
+        if self.on_event is not None:
+            try:
+                self.on_event(event, **data)
+            except Exception:
+                logger.exception("event handler failed for %s", event)
+
+    # ── Main ─────────────────────────────────────────────────────────
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._tags = asyncio.Queue()
+        self._pours = asyncio.Queue()
+        self._history = asyncio.Queue()
+        self._stopping = asyncio.Event()
+        for tag_id in self._early:
+            self._accept(tag_id)
+        self._early.clear()
+        if self._stop_requested:
+            self._stopping.set()
+
+        tasks = [
+            asyncio.ensure_future(self._input_task()),
+            asyncio.ensure_future(self._valve_task()),
+            asyncio.ensure_future(self._history_task()),
+            asyncio.ensure_future(self._ui_task()),
+        ]
+        self._emit('ready')
+        try:
+            await self._stopping.wait()
+        finally:
+            for task in tasks[:2] + tasks[3:]:
+                task.cancel()
+            await asyncio.gather(*tasks[:2], *tasks[3:], return_exceptions=True)
+            # Let history catch up with every pour that actually happened.
+            await self._history.join()
+            tasks[2].cancel()
+            await asyncio.gather(tasks[2], return_exceptions=True)
+            self._valve_executor.shutdown(wait=True)
+            self._history_executor.shutdown(wait=True)
+            if self._lookup_executor is not None:
+                # A lookup stuck on the network must not hold up the stop.
+                self._lookup_executor.shutdown(wait=False)
+            self._loop = None
+            self._emit('stopped', stats=dict(self.stats))
+
+    # ── Tasks ────────────────────────────────────────────────────────
+    async def _input_task(self):
+        while True:
+            tag_id, received = await self._tags.get()
+            m = self.metrics
+            self.stats['reads'] += 1
+            m.reads.inc()
+            m.queue_wait.observe(self._loop.time() - received)
+            start = time.perf_counter()
+            tag_data = await self._lookup(tag_id)
+            m.lookup.observe(time.perf_counter() - start)
+            if not tag_data:
+                self.stats['denied'] += 1
+                m.denied.inc()
+                self._emit('denied', tag_id=tag_id)
+                continue
+
+            name = tag_data['name']
+            if self.limiter is not None:
+                reason = self.limiter.acquire(tag_id)
+                if reason is not None:
+                    self.stats['limited'] += 1
+                    (m.limited_quota if reason == 'quota' else m.limited_rate).inc()
+                    self._emit('limited', tag_id=tag_id, name=name, reason=reason)
+                    continue
+
+            self.stats['granted'] += 1
+            m.granted.inc()
+            busy = self.valve_open or not self._pours.empty()
+            if not busy:
+                self._pours.put_nowait((tag_id, name, received))
+                self._emit('granted', tag_id=tag_id, name=name)
+            elif self.busy_policy == 'extend' and self.valve_open and self._extend(tag_id, name):
+                self._emit('extended', tag_id=tag_id, name=name,
+                           remaining=self.deadline - self._loop.time())
+            elif self.busy_policy != 'reject' and self._pours.qsize() < self.max_pending:
+                self._pours.put_nowait((tag_id, name, received))
+                self._emit('queued', tag_id=tag_id, name=name, position=self._pours.qsize())
+            else:
+                self.stats['rejected'] += 1
+                m.busy.inc()
+                if self.limiter is not None:
+                    self.limiter.refund(tag_id)
+                self._emit('busy', tag_id=tag_id, name=name)
+
+    async def _lookup(self, tag_id):
+        if self._lookup_executor is None:
+            return self.db.validate_tag(tag_id)
+        lookup = self._loop.run_in_executor(self._lookup_executor, self.db.validate_tag, tag_id)
+        try:
+            return await asyncio.wait_for(lookup, self.lookup_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("lookup of %s took over %.1f s, refusing it", tag_id, self.lookup_timeout)
+            return None
+
+    async def _valve_task(self):
+        try:
+            while True:
+                tag_id, name, received = await self._pours.get()
+                # Flag first: a cancel during the write must still close it.
+                self.valve_open = True
+                start = self.opened = self._loop.time()
+                self.deadline = start + self.pour_seconds
+                reached = self._arm(tag_id, name)
+                if not await self._valve('1', self.metrics.valve_open):
+                    # Unconfirmed open: nothing poured, nothing recorded.
+                    self.valve_open = False
+                    if self.flow is not None:
+                        self.flow.disarm()
+                    if self.limiter is not None:
+                        self.limiter.refund(tag_id)
+                    self._emit('fault', tag_id=tag_id, name=name, command='1')
+                    continue
+                opened = self.opened = self._loop.time()
+                self.deadline += opened - start
+                self.stats['pours'] += 1
+                self.metrics.pours.inc()
+                self.metrics.read_to_open.observe(opened - received)
+                if reached is None:
+                    self._record(tag_id, name)
+                    self._emit('open', tag_id=tag_id, name=name, wait=opened - received,
+                               seconds=self.pour_seconds)
+                else:
+                    self._emit('open', tag_id=tag_id, name=name, wait=opened - received,
+                               seconds=self.pour_seconds, target_ml=self.pour_ml)
+
+                # ``extend`` can push the deadline while we wait.
+                while True:
+                    remaining = self.deadline - self._loop.time()
+                    if remaining <= 0:
+                        break
+                    if reached is None:
+                        await asyncio.sleep(remaining)
+                        continue
+                    try:
+                        await asyncio.wait_for(reached.wait(), remaining)
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+
+                await self._valve('0', self.metrics.valve_close)
+                self.valve_open = False
+                duration = self._loop.time() - opened
+                self.metrics.pour.observe(duration)
+                if reached is None:
+                    self._emit('closed', tag_id=tag_id, name=name, duration=duration)
+                    continue
+                ml = self._settle(opened)
+                if not reached.is_set():
+                    logger.warning("pour for %s stopped at the %.0f s limit after %.0f ml (empty keg?)",
+                                   name, duration, ml)
+                self._emit('closed', tag_id=tag_id, name=name, duration=duration, ml=ml)
+        finally:
+            if self.valve_open:
+                self.valve_open = False
+                try:
+                    self.send_command('0')
+                except ConnectionError as e:
+                    logger.warning("valve close on shutdown failed: %s", e)
+                if self.flow is not None and self.doses:
+                    self._settle(self.opened)
+
+    def _arm(self, tag_id, name):
+        """Start measuring a pour; the event is set once its volume has flowed (``None`` when timed)."""
+        if self.flow is None:
+            return None
+        reached = asyncio.Event()
+        loop = self._loop
+        self.doses = [(tag_id, name)]
+        self.flow.arm(self.pour_ml, lambda: loop.call_soon_threadsafe(reached.set))
+        return reached
+
+    def _extend(self, tag_id, name):
+        """Add a dose to the running pour; false once its target volume was reached."""
+        if self.flow is not None:
+            if not self.flow.extend(self.pour_ml):
+                return False
+            self.doses.append((tag_id, name))
+        else:
+            self._record(tag_id, name)
+        self.deadline += self.pour_seconds
+        return True
+
+    def _settle(self, opened):
+        """Record every dose of the pour with its share of the measured volume; returns the total."""
+        ml = self.flow.disarm()
+        self.metrics.pour_volume.observe(ml)
+        # Entries carry the time the valve opened, as timed doses do.
+        timestamp = time.time() - (self._loop.time() - opened)
+        for (tag_id, name), share in zip(self.doses, split_volume(ml, len(self.doses), self.pour_ml)):
+            self._record(tag_id, name, round(share, 1), timestamp)
+        self.doses = []
+        return ml
+
+    async def _valve(self, command, histogram):
+        """Run ``send_command`` on the valve thread; returns whether it succeeded."""
+        try:
+            await self._loop.run_in_executor(self._valve_executor, self._timed, histogram,
+                                             self.send_command, command)
+        except Exception as e:
+            self.metrics.serial_errors.inc()
+            if isinstance(e, ConnectionError):
+                logger.warning("valve command %r failed: %s", command, e)
+            else:
+                logger.exception("valve command %r failed", command)
+            return False
+        return True
+
+    @staticmethod
+    def _timed(histogram, fn, *args):
+        # Runs on the worker thread, so executor hand-off is not counted.
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def _record(self, tag_id, name, ml=None, timestamp=None):
+        self._history.put_nowait((tag_id, name, ml, timestamp))
+
+    async def _history_task(self):
+        while True:
+            tag_id, name, ml, timestamp = await self._history.get()
+            record = self.record_history
+            if ml is not None:
+                record = functools.partial(record, timestamp=timestamp, ml=ml)
+            try:
+                await self._loop.run_in_executor(
+                    self._history_executor, self._timed, self.metrics.history,
+                    record, tag_id, name)
+            except Exception:
+                self.metrics.history_errors.inc()
+                logger.exception("failed to record history for %s", tag_id)
+            finally:
+                self._history.task_done()
+
+    async def _ui_task(self):
+        while True:
+            await asyncio.sleep(self.ui_interval)
+            if self.valve_open:
+                remaining = max(self.deadline - self._loop.time(), 0.0)
+                if self.flow is None:
+                    self._emit('tick', remaining=remaining, total=self.deadline - self.opened,
+                               pending=self._pours.qsize())
+                else:
+                    self._emit('tick', remaining=remaining, total=self.deadline - self.opened,
+                               pending=self._pours.qsize(), ml=self.flow.ml,
+                               target_ml=self.pour_ml * len(self.doses))
@@ -0,0 +1,135 @@
+"""Flow-meter dosing: pulses from the valve port turned into millilitres.
+
+A hall-effect flow meter (YF-S201 and the like) gives a fixed number of
+pulses per litre. The Arduino counts them in an interrupt and reports
+the count every few tens of milliseconds as a ``~<count>`` line on the
+valve port, between valve replies and forwarded RFID frames::
+
+    ~37
+    ~41
+
+:class:`FlowMeter` sits in front of the tag decoder on the link's
+``on_data``. It takes the pulse lines out of each buffer with one regex
+pass and adds their counts, so a busy meter costs one small step per
+report, never one per pulse, and passes the remaining bytes on. While a
+pour is armed it calls back once the target volume has flowed; the
+engine then closes the valve and records the measured volume.
+
+``TAP_FLOW_PULSES_PER_LITRE`` turns it on; 0 (the default) keeps timed
+doses of ``TAP_POUR_SECONDS``. With a meter, ``TAP_POUR_ML`` is the dose
+and ``TAP_POUR_SECONDS`` the most a pour may last (an empty keg never
+reaches its target).
+"""
+
+import re
+import threading
+
+from . import config
+
+MARKER = b"~"
+PULSE_FRAME = re.compile(rb"~(\d{1,9})\r?\n")
+# A partial frame longer than this is not a frame.
+MAX_FRAME = len(b"~999999999\r\n")
+
+
+def encode_pulses(count):
+    """One pulse report as the firmware sends it."""
+    return b"~%d\n" % count
+
+
+def split_volume(total, doses, dose_ml):
+    """Millilitres of each of ``doses`` consecutive doses in a pour of ``total``.
+
+    Doses are poured in order; the last one also gets what flowed past
+    the target (the valve takes a moment to close).
+    """
+    shares = [min(max(total - i * dose_ml, 0.0), dose_ml) for i in range(doses)]
+    shares[-1] += max(total - doses * dose_ml, 0.0)
+    return shares
+
+
+class FlowMeter:
+    """Pulse counter for one tap, fed from its valve link thread.
+
+    ``sink`` gets the bytes that are not pulse reports (usually a
+    ``TagDecoder.handle``).
+    """
+
+    def __init__(self, pulses_per_litre=None, sink=None):
+        self.pulses_per_litre = pulses_per_litre or config.FLOW_PULSES_PER_LITRE
+        if self.pulses_per_litre <= 0:
+            raise ValueError("pulses_per_litre must be positive")
+        self.sink = sink
+        self.pulses = 0  # since the last arm()
+        self.total_pulses = 0  # since start, drips between pours included
+        self.frames = 0
+        self._target = None  # pulses; None when not armed or already reached
+        self._on_target = None
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    # ── Link thread ──────────────────────────────────────────────────
+    def feed(self, data):
+        """``on_data`` handler: count the pulse reports, pass the rest to ``sink``."""
+        if not self._buffer and MARKER not in data:
+            self._pass(data)
+            return
+        data = self._buffer + data
+        self._buffer = b""
+        # A report cut by the read waits for its newline.
+        cut = data.rfind(MARKER)
+        if cut >= 0 and b"\n" not in data[cut:] and len(data) - cut < MAX_FRAME:
+            data, self._buffer = data[:cut], data[cut:]
+        counts = PULSE_FRAME.findall(data)
+        if counts:
+            self.add(sum(map(int, counts)), len(counts))
+            data = PULSE_FRAME.sub(b"", data)
+        self._pass(data)
+
+    def add(self, pulses, frames=1):
+        """Count ``pulses``; calls the armed ``on_target`` once the target is reached."""
+        callback = None
+        with self._lock:
+            self.pulses += pulses
+            self.total_pulses += pulses
+            self.frames += frames
+            if self._target is not None and self.pulses >= self._target:
+                callback, self._on_target, self._target = self._on_target, None, None
+        if callback is not None:
+            callback()
+
+    def _pass(self, data):
+        if data and self.sink is not None:
+            self.sink(data)
+
+    # ── Engine side ──────────────────────────────────────────────────
+    def arm(self, target_ml, on_target):
+        """Start measuring a pour; ``on_target()`` runs on the link thread when ``target_ml`` has flowed."""
+        with self._lock:
+            self.pulses = 0
+            self._target = self.pulses_for(target_ml)
+            self._on_target = on_target
+
+    def extend(self, ml):
+        """Raise the target by ``ml``; false if it was already reached (too late to extend)."""
+        with self._lock:
+            if self._target is None:
+                return False
+            self._target += self.pulses_for(ml)
+            return True
+
+    def disarm(self):
+        """Stop watching the target; returns the millilitres poured since :meth:`arm`."""
+        with self._lock:
+            self._target = self._on_target = None
+            return self.to_ml(self.pulses)
+
+    @property
+    def ml(self):
+        return self.to_ml(self.pulses)
+
+    def pulses_for(self, ml):
+        return max(1, round(ml * self.pulses_per_litre / 1000))
+
+    def to_ml(self, pulses):
+        return pulses * 1000.0 / self.pulses_per_litre
@@ -0,0 +1,341 @@
+"""Tag-stream replay through the whole validation pipeline.
+
+A stream of ``(seconds, tag_id)`` reads, either synthetic or recorded, is
+typed into a :class:`~tap.simulator.ValveSimulator` as RFID frames. From
+there it takes the same path as the terminal app with
+``TAP_READER=serial``: the valve link, framing and debounce, the
+validation engine, the history writer and valve commands back to the
+simulator. The simulator timestamps every open and close it receives.
+
+The report gives throughput (pours per minute), queueing delay (read to
+valve open, as seen by the engine and end to end from injection) and
+valve-timing accuracy (open time at the device against the dose the
+engine meant to pour). It runs against a scratch copy of the database, so
+the history of a real ``rfid_system.db`` is never touched.
+
+``python -m tap.loadgen --rate 2 --reads 200 --pour-seconds 0.5``
+replays synthetic traffic; ``--stream FILE`` replays a recorded CSV
+(``time,tag_id``) or JSONL stream, ``--from-history DB`` the pours
+recorded in a database.
+"""
+
+import asyncio
+import collections
+import csv
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from . import config
+
+# Gap between repeated reads of a card held on the reader.
+BURST_GAP = 0.05
+
+
+# ── Streams ─────────────────────────────────────────────────────────────
+def synthetic_stream(tags, count, rate, invalid=0.1, duplicates=0.1, burst=3, seed=None):
+    """``count`` reads arriving at ``rate`` per second (Poisson).
+
+    A fraction ``invalid`` are unknown tags; a fraction ``duplicates`` are
+    a burst of ``burst`` reads of the same card, as when it rests on the
+    reader.
+    """
+    rng = random.Random(seed)
+    t = 0.0
+    stream = []
+    while len(stream) < count:
+        t += rng.expovariate(rate) if rate > 0 else 0.0
+        tag_id = f"LOADGEN-BAD-{rng.randrange(10 ** 6):06d}" if rng.random() < invalid else rng.choice(tags)
+        repeats = burst if rng.random() < duplicates else 1
+        stream.extend((t + i * BURST_GAP, tag_id) for i in range(repeats))
+    return sorted(stream)[:count]
+
+
+def read_stream(path):
+    """A recorded stream: CSV with ``time,tag_id`` columns or JSONL objects."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    stream = sorted((float(row["time"]), str(row["tag_id"]).strip()) for row in rows)
+    return _rebase(stream)
+
+
+def history_stream(db, limit=1000):
+    """The last ``limit`` pours recorded in ``db``, at their original pace."""
+    stream = [(entry['ts'], entry['tag_id']) for entry in db.get_history_page(limit)]
+    return _rebase(sorted(stream))
+
+
+def _rebase(stream):
+    if not stream:
+        return []
+    start = stream[0][0]
+    return [(t - start, tag_id) for t, tag_id in stream]
+
+
+def write_stream(path, stream):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("time", "tag_id"))
+        writer.writerows((f"{t:.3f}", tag_id) for t, tag_id in stream)
+
+
+# ── Scratch database ────────────────────────────────────────────────────
+def scratch_db(directory, source=None, tags=100):
+    """Path of a throwaway database: a copy of ``source`` or ``tags`` synthetic users."""
+    from .model.database import SQLiteDatabase
+    from .model.pool import file_uri
+
+    path = os.path.join(directory, "loadgen.db")
+    if source is not None:
+        src = sqlite3.connect(file_uri(source) + "?mode=ro", uri=True)
+        dst = sqlite3.connect(path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        return path
+    db = SQLiteDatabase(path)
+    try:
+        db.import_tags((f"LOADGEN{i:06d}", f"User {i}", None) for i in range(tags))
+    finally:
+        db.close()
+    return path
+
+
+# ── Run ─────────────────────────────────────────────────────────────────
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"n": 0}
+
+    def pick(fraction):
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+    return {"n": len(values), "p50_ms": round(pick(0.5) * 1000, 1), "p95_ms": round(pick(0.95) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1)}
+
+
+class _Recorder:
+    """Collects engine events and matches pours to injected reads."""
+
+    def __init__(self, dose):
+        self.dose = dose
+        self.counts = collections.Counter()
+        self.injected = collections.defaultdict(collections.deque)
+        self.waits = []
+        self.end_to_end = []
+        self.intended = []  # dose per pour, including extensions
+        self._lock = threading.Lock()
+
+    def inject(self, tag_id):
+        with self._lock:
+            self.injected[tag_id].append(time.monotonic())
+
+    def outstanding(self):
+        c = self.counts
+        return c['granted'] + c['queued'] - c['closed'] - c['fault']
+
+    def __call__(self, event, tap=None, **data):
+        now = time.monotonic()
+        self.counts[event] += 1
+        if event == 'open':
+            self.waits.append(data['wait'])
+            self.intended.append(data['seconds'])
+            with self._lock:
+                reads = self.injected.pop(data['tag_id'], None)
+            if reads:
+                self.end_to_end.append(now - reads[0])
+        elif event == 'extended':
+            if self.intended:
+                self.intended[-1] += self.dose
+            with self._lock:
+                self.injected.pop(data['tag_id'], None)
+        elif event in ('denied', 'busy', 'fault'):
+            with self._lock:
+                self.injected.pop(data['tag_id'], None)
+
+
+def valve_timings(commands):
+    """Open durations as seen by the device, from its ``(command, time)`` log."""
+    durations = []
+    opened = None
+    for command, at in commands:
+        if command == "1" and opened is None:
+            opened = at
+        elif command == "0" and opened is not None:
+            durations.append(at - opened)
+            opened = None
+    return durations
+
+
+def run(db_file, stream, speed=1.0, pour_seconds=None, busy_policy=None, protocol="framed",
+        drain_timeout=None):
+    """Replay ``stream`` through a simulated tap; returns the report dict."""
+    from .model.database import SQLiteDatabase
+    from .model.history import HistoryWriter
+    from .simulator import ValveSimulator
+    from .taps import TapDaemon
+
+    pour_seconds = config.POUR_SECONDS if pour_seconds is None else pour_seconds
+    recorder = _Recorder(pour_seconds)
+    sim = ValveSimulator(protocol)
+    sim.start()
+    db = SQLiteDatabase(db_file)
+    history = HistoryWriter(db)
+    history.start()
+    daemon = TapDaemon(db, history, [(None, sim.port)], on_event=recorder, protocol=protocol,
+                       pour_seconds=pour_seconds, busy_policy=busy_policy)
+    tap = daemon.taps[0]
+    done = threading.Event()
+
+    def inject():
+        start = time.monotonic()
+        for t, tag_id in stream:
+            delay = start + t / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            recorder.inject(tag_id)
+            sim.inject_tag(tag_id)
+        done.set()
+
+    async def scenario():
+        runner = asyncio.ensure_future(daemon.run())
+        await asyncio.sleep(0)
+        threading.Thread(target=inject, name="loadgen", daemon=True).start()
+        while not done.is_set():
+            await asyncio.sleep(0.05)
+        # Let the last frames through the debounce, then drain the queue.
+        limit = time.monotonic() + (drain_timeout if drain_timeout is not None
+                                    else pour_seconds * (config.MAX_PENDING + 2) + 5)
+        await asyncio.sleep(0.2)
+        while recorder.outstanding() > 0 and time.monotonic() < limit:
+            await asyncio.sleep(0.05)
+        daemon.stop()
+        await runner
+
+    try:
+        daemon.start()
+        if not tap.link.wait_connected(config.VALVE_BOOT_SECONDS + 1):
+            raise RuntimeError(f"simulated valve on {sim.port} did not answer")
+        started = time.monotonic()
+        asyncio.run(scenario())
+        elapsed = time.monotonic() - started
+    finally:
+        history.close()
+        db.close()
+        sim.stop()
+
+    durations = valve_timings(sim.commands)
+    errors = [actual - intended for actual, intended in zip(durations, recorder.intended)]
+    c = recorder.counts
+    return {
+        "reads_injected": len(stream),
+        "reads_seen": c['granted'] + c['queued'] + c['extended'] + c['busy'] + c['denied'],
+        "granted": c['granted'] + c['queued'] + c['extended'] + c['busy'],
+        "denied": c['denied'],
+        "queued": c['queued'],
+        "busy": c['busy'],
+        "extended": c['extended'],
+        "faults": c['fault'],
+        "pours": c['open'],
+        "unfinished": recorder.outstanding(),
+        "elapsed_s": round(elapsed, 2),
+        "pours_per_minute": round(c['open'] / elapsed * 60, 1) if elapsed else 0.0,
+        "queue_delay": _percentiles(recorder.waits),
+        "inject_to_open": _percentiles(recorder.end_to_end),
+        "valve_error": _percentiles(errors),
+        "mean_valve_error_ms": round(sum(errors) / len(errors) * 1000, 1) if errors else None,
+        "retries": tap.metrics.retries.value,
+        "serial_errors": tap.metrics.serial_errors.value,
+    }
+
+
+def print_report(report):
+    print(f"   reads      {report['reads_injected']} injected, {report['reads_seen']} past debounce"
+          f" ({report['granted']} granted, {report['denied']} denied)")
+    print(f"   pours      {report['pours']} in {report['elapsed_s']} s"
+          f" = {report['pours_per_minute']}/min"
+          f" (queued {report['queued']}, busy {report['busy']}, extended {report['extended']},"
+          f" faults {report['faults']}, unfinished {report['unfinished']})")
+    for key, label in (("queue_delay", "queue"), ("inject_to_open", "end to end"),
+                       ("valve_error", "valve err")):
+        p = report[key]
+        if p["n"]:
+            print(f"   {label:<10} p50 {p['p50_ms']} ms  p95 {p['p95_ms']} ms  max {p['max_ms']} ms")
+    print(f"   serial     {report['retries']} resends, {report['serial_errors']} failed commands")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m tap.loadgen",
+                                     description="Replay tag reads through a simulated tap.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--stream", help="recorded stream, CSV (time,tag_id) or JSONL")
+    source.add_argument("--from-history", metavar="DB", help="replay the pours recorded in DB")
+    parser.add_argument("--db", help="copy users from this database (default: synthetic users)")
+    parser.add_argument("--tags", type=int, default=100, help="synthetic users (default 100)")
+    parser.add_argument("--reads", type=int, default=200, help="synthetic reads (default 200)")
+    parser.add_argument("--rate", type=float, default=1.0, help="synthetic reads per second")
+    parser.add_argument("--invalid", type=float, default=0.1, help="fraction of unknown tags")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="fraction of repeated-read bursts")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up factor")
+    parser.add_argument("--pour-seconds", type=float)
+    parser.add_argument("--policy", choices=("queue", "reject", "extend"))
+    parser.add_argument("--protocol", choices=("framed", "raw"), default="framed")
+    parser.add_argument("--save-stream", metavar="FILE", help="write the replayed stream as CSV")
+    parser.add_argument("--output", metavar="FILE", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="tap-loadgen-")
+    try:
+        source_db = args.db or args.from_history
+        db_file = scratch_db(directory, source_db, args.tags)
+        if args.stream:
+            stream = read_stream(args.stream)
+        elif args.from_history:
+            from .model.database import SQLiteDatabase
+
+            db = SQLiteDatabase(db_file)
+            try:
+                stream = history_stream(db, args.reads)
+            finally:
+                db.close()
+        else:
+            from .model.database import SQLiteDatabase
+
+            db = SQLiteDatabase(db_file)
+            try:
+                tags = list(db.get_all_tags())
+            finally:
+                db.close()
+            if not tags:
+                parser.error("no users to draw tags from")
+            stream = synthetic_stream(tags, args.reads, args.rate, args.invalid, args.duplicates,
+                                      seed=args.seed)
+        if args.save_stream:
+            write_stream(args.save_stream, stream)
+        duration = stream[-1][0] / args.speed if stream else 0.0
+        print(f"   Replaying {len(stream)} reads over {duration:.1f} s...")
+        report = run(db_file, stream, args.speed, args.pour_seconds, args.policy, args.protocol)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
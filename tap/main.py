@@ -1,14 +1,19 @@
 import os
-import re
 import time
-import sys
-import serial
-import platform
-import glob
+import asyncio
+import threading
 import logging
-import shutil
 
-from .model.database import SQLiteDatabase
+from .model.history import HistoryWriter
+from .model.snapshot import FailoverDatabase
+from .model.storage import open_storage
+from . import config
+from .engine import ValidationEngine
+from .flow import FlowMeter
+from .reader import SerialTagReader, TagDecoder
+from .screen import screen, terminal_size, visible_width
+from .taps import detect_serial_port
+from .valve import ValveError, ValveLink
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO, format='%(message)s')
@@ -59,45 +64,39 @@ class C:
 
 
 # ── UI Helpers ───────────────────────────────────────────────────────────
+# Everything is drawn into ``screen`` and reaches the terminal on the next
+# prompt or ``screen.flush()``, as one write of the lines that changed.
 def term_width():
-    return shutil.get_terminal_size((80, 24)).columns
+    return terminal_size().columns
 
 
 def clear():
-    print(C.CLEAR, end="", flush=True)
+    screen.clear()
 
 
 def hline(char="─", color=C.DIM + C.CYAN):
     w = term_width()
-    print(f"{color}{'─' * w}{C.RST}")
+    screen.line(f"{color}{'─' * w}{C.RST}")
 
 
-def box(lines, color=C.CYAN, pad=2):
-    """Draw a Unicode box around a list of strings."""
+def box_lines(lines, color=C.CYAN, pad=2):
+    """A Unicode box around a list of strings, as lines."""
     w = term_width()
     inner = w - 4  # │ + space + content + space + │
-    top = f"{color}╭{'─' * (w - 2)}╮{C.RST}"
-    bot = f"{color}╰{'─' * (w - 2)}╯{C.RST}"
-    print(top)
-    for _ in range(pad // 2):
-        print(f"{color}│{' ' * (w - 2)}│{C.RST}")
+    blank = f"{color}│{' ' * (w - 2)}│{C.RST}"
+    out = [f"{color}╭{'─' * (w - 2)}╮{C.RST}"]
+    out += [blank] * (pad // 2)
     for line in lines:
-        # strip ANSI for length calc
-        visible = _strip_ansi(line)
-        spaces = inner - len(visible)
-        if spaces < 0:
-            spaces = 0
-        print(f"{color}│{C.RST} {line}{' ' * spaces} {color}│{C.RST}")
-    for _ in range(pad // 2):
-        print(f"{color}│{' ' * (w - 2)}│{C.RST}")
-    print(bot)
-
+        spaces = max(inner - visible_width(line), 0)
+        out.append(f"{color}│{C.RST} {line}{' ' * spaces} {color}│{C.RST}")
+    out += [blank] * (pad // 2)
+    out.append(f"{color}╰{'─' * (w - 2)}╯{C.RST}")
+    return out
 
-_ANSI_RE = re.compile(r'\033\[[0-9;]*m')
 
-def _strip_ansi(s):
-    """Remove ANSI escape sequences for length calculation."""
-    return _ANSI_RE.sub('', s)
+def box(lines, color=C.CYAN, pad=2):
+    """Draw a Unicode box around a list of strings."""
+    screen.extend(box_lines(lines, color, pad))
 
 
 def banner():
@@ -110,234 +109,479 @@ def banner():
     ]
     box(art, color=C.BBLUE, pad=2)
     center_text("RFID Reader System  ~  Terminal Edition", C.DIM + C.WHITE)
-    print()
+    screen.line()
 
 
 def center_text(text, color=""):
-    w = term_width()
-    visible = _strip_ansi(text)
-    pad = (w - len(visible)) // 2
-    print(f"{' ' * pad}{color}{text}{C.RST}")
+    pad = (term_width() - visible_width(text)) // 2
+    screen.line(f"{' ' * pad}{color}{text}{C.RST}")
 
 
 def menu_option(key, label, icon=""):
     """Print a styled menu option."""
-    print(f"   {C.BBLUE}{C.BOLD}[{key}]{C.RST}  {icon}  {C.WHITE}{label}{C.RST}")
+    screen.line(f"   {C.BBLUE}{C.BOLD}[{key}]{C.RST}  {icon}  {C.WHITE}{label}{C.RST}")
 
 
 def status_line(label, value, ok=True):
     color = C.BGREEN if ok else C.BRED
     dot = "●" if ok else "○"
-    print(f"   {color}{dot}{C.RST}  {C.DIM}{label}:{C.RST} {C.BOLD}{value}{C.RST}")
+    screen.line(f"   {color}{dot}{C.RST}  {C.DIM}{label}:{C.RST} {C.BOLD}{value}{C.RST}")
+
+
+def note(icon, icon_color, color, msg):
+    return f"   {icon_color}{icon}{C.RST}  {color}{msg}{C.RST}"
 
 
 def success(msg):
-    print(f"\n   {C.BGREEN}✔{C.RST}  {C.GREEN}{msg}{C.RST}")
+    screen.extend(["", note("✔", C.BGREEN, C.GREEN, msg)])
 
 
 def error(msg):
-    print(f"\n   {C.BRED}✘{C.RST}  {C.RED}{msg}{C.RST}")
+    screen.extend(["", note("✘", C.BRED, C.RED, msg)])
 
 
 def warning(msg):
-    print(f"\n   {C.BYELLOW}⚠{C.RST}  {C.YELLOW}{msg}{C.RST}")
+    screen.extend(["", note("⚠", C.BYELLOW, C.YELLOW, msg)])
 
 
 def info(msg):
-    print(f"   {C.BCYAN}ℹ{C.RST}  {C.DIM}{msg}{C.RST}")
+    screen.line(note("ℹ", C.BCYAN, C.DIM, msg))
 
 
 def section_header(title, icon=""):
     clear()
-    print()
+    screen.line()
     hline()
     center_text(f"{icon}  {title}", C.BOLD + C.BCYAN)
     hline()
-    print()
+    screen.line()
 
 
 def prompt(text="› "):
     """Styled input prompt."""
+    screen.line()
     try:
-        return input(f"\n   {C.BYELLOW}{text}{C.RST}").strip()
+        return screen.ask(f"   {C.BYELLOW}{text}{C.RST}").strip()
     except (EOFError, KeyboardInterrupt):
         return ""
 
 
 def pause(text="Pressione Enter para voltar..."):
-    input(f"\n   {C.DIM}{text}{C.RST}")
+    screen.line()
+    screen.ask(f"   {C.DIM}{text}{C.RST}")
+
 
+def show(seconds=0):
+    """Flush the frame, then let it be read for ``seconds``."""
+    screen.flush()
+    if seconds:
+        time.sleep(seconds)
 
-def countdown_bar(seconds, label="TAP LIBERADO"):
-    """Animated progress bar countdown."""
+
+def countdown_frame(remaining, total, label="TAP LIBERADO"):
+    """One line of the countdown bar; the caller decides the pace."""
     w = max(term_width() - 30, 10)
-    for i in range(seconds, 0, -1):
-        pct = i / seconds
-        filled = int(w * pct)
-        bar = f"{C.BGREEN}{'#' * filled}{C.DIM}{'.' * (w - filled)}{C.RST}"
-        sys.stdout.write(
-            f"\r   {C.BOLD}{C.GREEN}>> {label}{C.RST}  {bar}  {C.BYELLOW}{i:2d}s{C.RST} "
-        )
-        sys.stdout.flush()
-        time.sleep(1)
-    # Clear line when done
-    sys.stdout.write(f"\r{' ' * (term_width())}\r")
-    sys.stdout.flush()
+    pct = remaining / total if total else 0
+    filled = int(w * pct)
+    bar = f"{C.BGREEN}{'#' * filled}{C.DIM}{'.' * (w - filled)}{C.RST}"
+    return f"   {C.BOLD}{C.GREEN}>> {label}{C.RST}  {bar}  {C.BYELLOW}{remaining:4.1f}s{C.RST}"
+
+
+def volume_frame(poured, target, label="TAP LIBERADO"):
+    """One line of the volume bar for doses measured by the flow meter."""
+    w = max(term_width() - 32, 10)
+    pct = min(poured / target, 1.0) if target else 0
+    filled = int(w * pct)
+    bar = f"{C.BGREEN}{'#' * filled}{C.DIM}{'.' * (w - filled)}{C.RST}"
+    return f"   {C.BOLD}{C.GREEN}>> {label}{C.RST}  {bar}  {C.BYELLOW}{poured:4.0f} ml{C.RST}"
 
 
 # ── Application ──────────────────────────────────────────────────────────
 class MinimalRFIDApp:
-    def __init__(self):
-        self.db = SQLiteDatabase()
-        self.serial_conn = None
+    def __init__(self, db_file=None, storage=None, profiler=None):
+        self.storage = storage or config.STORAGE
+        # ``tap --profile``: the engine thread is profiled too (see tap.profiling).
+        self.profiler = profiler
+        if self.storage == "sqlite":
+            self.db = FailoverDatabase(db_file or config.DB_PATH).open()
+        else:
+            self.db = open_storage(self.storage, db_file)
+        self.history = HistoryWriter(self.db)
+        self.valve = None
+        self.limiter = None
+        self.feed = None
+        self._live = None
         self.serial_port = None
+        self.reader_conn = None
         self.detect_serial_port()
 
     def detect_serial_port(self):
-        system_os = platform.system()
-        if system_os == "Windows":
-            self.serial_port = "COM15"
-        else:
-            acm_ports = glob.glob('/dev/ttyACM*')
-            usb_ports = glob.glob('/dev/ttyUSB*')
-            all_ports = acm_ports + usb_ports
-            if all_ports:
-                all_ports.sort()
-                self.serial_port = all_ports[0]
-            else:
-                self.serial_port = "/dev/ttyACM0"
-
-    def connect_serial(self):
-        try:
-            if self.serial_conn and self.serial_conn.is_open:
-                info("Serial desconectado")
-            self.serial_conn = serial.Serial(self.serial_port, 9600, timeout=1)
-            return True
-        except Exception as e:
-            return False
-
-    def send_serial_command(self, command):
-        if self.serial_conn and self.serial_conn.is_open:
+        self.serial_port = detect_serial_port()
+
+    def connect_serial(self, timeout=2.0):
+        """Start the valve link; it keeps reconnecting in the background."""
+        if self.valve is None:
+            self.valve = ValveLink(self.serial_port)
+            self.valve.start()
+        return self.valve.wait_connected(timeout)
+
+    def tag_reader_conn(self):
+        """Separate serial link for RFID frames (``TAP_READER_PORT``)."""
+        if self.reader_conn is None or not self.reader_conn.is_open:
+            import serial
             try:
-                self.serial_conn.write(command.encode())
+                self.reader_conn = serial.Serial(config.READER_PORT, config.READER_BAUD, timeout=1)
             except Exception:
-                pass
+                self.reader_conn = None
+        return self.reader_conn
+
+    def send_serial_command(self, command):
+        if self.valve is None:
+            raise ValveError(f"{self.serial_port}: not connected")
+        self.valve.send(command)
 
     # ── Flows ────────────────────────────────────────────────────────
     def validate_tag_flow(self):
+        if config.TAPS:
+            return self.multi_tap_flow()
         section_header("Modo Validacao", "")
 
-        serial_ok = self.serial_conn and self.serial_conn.is_open
+        serial_ok = self.valve is not None and self.valve.connected.is_set()
         status_line("Porta Serial", self.serial_port, ok=serial_ok)
         status_line("Status", "Conectado" if serial_ok else "Desconectado", ok=serial_ok)
 
-        print()
-        info("Aguardando leitura de Tag... (Enter vazio p/ voltar)")
-
-        while True:
-            tag_id = prompt("Tag ID › ")
-            if not tag_id:
-                break
+        flow = FlowMeter() if config.FLOW_PULSES_PER_LITRE > 0 else None
+        engine = ValidationEngine(self.db, self.send_serial_command, on_event=self.show_engine_event,
+                                  record_history=self.history.submit, limiter=self.limiter, flow=flow)
+        reader = None
+        on_data = None
+        if config.READER == 'serial' and not config.READER_PORT:
+            # Tags arrive on the valve port, interleaved with its replies.
+            on_data = TagDecoder(engine.submit).handle
+        elif config.READER == 'serial':
+            conn = self.tag_reader_conn()
+            if conn is not None and conn.is_open:
+                reader = SerialTagReader(conn, engine.submit)
+                reader.start()
+            else:
+                warning("Leitor serial indisponível, usando teclado.")
+        if flow is not None:
+            # Pulse reports share the valve port too.
+            flow.sink, on_data = on_data, flow.feed
+        self.valve.on_data = on_data
+        self.start_live([None], "Aguardando leitura de Tag... (Enter vazio p/ voltar)")
+        try:
+            self.run_with_keyboard(engine)
+        finally:
+            self.valve.on_data = None
+            if reader is not None:
+                reader.stop()
 
-            tag_data = self.db.validate_tag(tag_id)
-            if tag_data:
-                name = tag_data['name']
-                self.db.add_history_entry(tag_id, name)
+    def multi_tap_flow(self):
+        from .taps import TapDaemon, parse_taps
 
-                print()
-                box([
-                    f"{C.BGREEN}{C.BOLD}  ✔  ACESSO LIBERADO{C.RST}",
-                    f"{C.WHITE}     Olá, {C.BOLD}{name}{C.RST}{C.WHITE}!{C.RST}",
-                ], color=C.GREEN, pad=2)
+        section_header("Modo Validacao (várias torneiras)", "")
+        try:
+            taps = parse_taps(config.TAPS)
+        except ValueError as e:
+            error(f"TAP_TAPS inválido: {e}")
+            pause()
+            return
+        daemon = TapDaemon(self.db, self.history, taps, on_event=self.show_engine_event,
+                           limiter=self.limiter)
+        daemon.start()
+        deadline = time.monotonic() + 2.0
+        for tap in daemon.taps:
+            ok = tap.link.wait_connected(max(deadline - time.monotonic(), 0))
+            status_line(f"Torneira {tap.name}", tap.port, ok=ok)
+
+        self.start_live([tap.name for tap in daemon.taps], "Aguardando leituras nas torneiras... (Enter vazio p/ voltar)")
+        self.run_with_keyboard(daemon)
+
+    def run_with_keyboard(self, engine):
+        """Run ``engine`` on its own thread while this one reads keyboard tags.
+
+        Only the main thread reads stdin: when validation ends (empty line,
+        Ctrl-D or Ctrl-C) no reader is left blocked in ``input()`` to take
+        the next line typed at the menu.
+        """
+        def run():
+            try:
+                asyncio.run(engine.run())
+            except Exception:
+                logger.exception("validation engine failed")
 
-                self.send_serial_command('1')
-                countdown_bar(10)
-                self.send_serial_command('0')
+        if self.profiler is not None:
+            run = self.profiler.thread(run)
+        thread = threading.Thread(target=run, name="validation", daemon=True)
+        thread.start()
+        self.keyboard_tags(engine)
+        try:
+            thread.join()
+        except KeyboardInterrupt:
+            engine.stop()
+            thread.join()
 
-                info("TAP Fechado. Aguardando nova leitura...")
+    def keyboard_tags(self, engine):
+        """Feed keyboard-wedge reads into the engine until an empty line."""
+        while True:
+            try:
+                # The prompt stays on one line below the live area.
+                tag_id = screen.ask(f"   {C.BYELLOW}Tag ID › {C.RST}", keep=False).strip()
+            except (EOFError, KeyboardInterrupt):
+                tag_id = ""
+            if not tag_id:
+                engine.stop()
+                return
+            engine.submit(tag_id)
+
+    # ── Live validation area ─────────────────────────────────────────
+    # A fixed-height area under the header: the last access box, a
+    # message and one countdown bar per tap. Events redraw it in place.
+    LIVE_BOX = 7
+
+    def start_live(self, taps, message):
+        screen.line()
+        self._live = {'start': len(screen.lines), 'taps': taps, 'box': [], 'bars': {},
+                      'message': note("ℹ", C.BCYAN, C.DIM, message)}
+        self.update_live()
+        screen.line()
+
+    def update_live(self, box=None, message=None, tap=None, bar=None):
+        live = self._live
+        with screen.lock:
+            if box is not None:
+                live['box'] = box
+            if message is not None:
+                live['message'] = message
+            if bar is not None:
+                live['bars'][tap] = bar
+            lines = (live['box'] + [""] * self.LIVE_BOX)[:self.LIVE_BOX]
+            lines += ["", live['message']] + [live['bars'].get(name, "") for name in live['taps']]
+            screen.region(live['start'], len(lines), lines)
+        screen.flush()
+
+    def show_engine_event(self, event, tap=None, **data):
+        if self.feed is not None:
+            self.feed.publish(event, tap=tap, **data)
+        if self._live is None:
+            return
+        waiting = note("ℹ", C.BCYAN, C.DIM, "Aguardando leitura...")
+        if event == 'open':
+            lines = [
+                f"{C.BGREEN}{C.BOLD}  ✔  ACESSO LIBERADO{C.RST}",
+                f"{C.WHITE}     Olá, {C.BOLD}{data['name']}{C.RST}{C.WHITE}!{C.RST}",
+            ]
+            if tap is not None:
+                lines.append(f"{C.DIM}     Torneira {tap}{C.RST}")
+            if data.get('target_ml'):
+                lines.append(f"{C.DIM}     Dose de {data['target_ml']:.0f} ml{C.RST}")
+            self.update_live(box=box_lines(lines, color=C.GREEN, pad=2), message="")
+        elif event == 'tick':
+            label = f"TAP {tap.upper()}" if tap else "TAP LIBERADO"
+            if 'ml' in data:
+                bar = volume_frame(data['ml'], data['target_ml'], label)
+            else:
+                bar = countdown_frame(data['remaining'], data['total'], label)
+            self.update_live(tap=tap, bar=bar)
+        elif event == 'closed':
+            self.update_live(tap=tap, bar="",
+                             message=note("ℹ", C.BCYAN, C.DIM, "TAP Fechado. Aguardando nova leitura..."))
+        elif event == 'denied':
+            self.update_live(box=box_lines([
+                f"{C.BRED}{C.BOLD}  ✘  ACESSO NEGADO{C.RST}",
+                f"{C.DIM}     Tag não cadastrada{C.RST}",
+            ], color=C.RED, pad=2), message=waiting)
+        elif event == 'queued':
+            self.update_live(message=note("ℹ", C.BCYAN, C.DIM, f"{data['name']} na fila (posição {data['position']})"))
+        elif event == 'extended':
+            self.update_live(message=note("ℹ", C.BCYAN, C.DIM, f"Dose extra para {data['name']}"))
+        elif event == 'busy':
+            self.update_live(message=note("⚠", C.BYELLOW, C.YELLOW, "TAP ocupado, aguarde o fim da dose."))
+        elif event == 'limited':
+            if data['reason'] == 'quota':
+                text = f"{data['name']}: cota diária de {config.DAILY_QUOTA} doses atingida."
             else:
-                print()
-                box([
-                    f"{C.BRED}{C.BOLD}  ✘  ACESSO NEGADO{C.RST}",
-                    f"{C.DIM}     Tag não cadastrada{C.RST}",
-                ], color=C.RED, pad=2)
-                time.sleep(2)
-                info("Aguardando leitura...")
+                text = f"{data['name']}: muitas leituras, aguarde um pouco."
+            self.update_live(message=note("⚠", C.BYELLOW, C.YELLOW, text))
+        elif event == 'fault':
+            self.update_live(message=note("✘", C.BRED, C.RED, f"Válvula sem resposta, dose de {data['name']} não liberada."))
+        elif event == 'stopped':
+            self._live = None
 
     def manage_users_flow(self):
+        page_size = max(terminal_size().lines - 16, 5)
+        query = ""
+        # Keyset cursors of the pages already seen, for going back.
+        cursors = [None]
         while True:
             section_header("Gerenciar Usuarios", "")
-            users = self.db.get_all_tags()
-
-            info(f"Total cadastrados: {C.BOLD}{len(users)}{C.RST}")
-            print()
+            total = self.db.count_tags(query)
+            # One extra row tells us whether there is a next page.
+            users = self.db.search_tags(query, page_size + 1, before=cursors[-1])
+            has_next = len(users) > page_size
+            users = users[:page_size]
+
+            if query:
+                info(f"Busca {C.BOLD}{query}{C.RST}: {C.BOLD}{total}{C.RST} encontrados")
+            else:
+                info(f"Total cadastrados: {C.BOLD}{total}{C.RST}")
+            screen.line()
 
             if users:
-                # Table header
-                print(f"   {C.DIM}{'TAG':<20} {'NOME':<20} {'REGISTRO'}{C.RST}")
+                screen.line(f"   {C.DIM}{'TAG':<20} {'NOME':<20} {'REGISTRO'}{C.RST}")
                 hline(color=C.DIM + C.BLUE)
-                for tag, data in users.items():
-                    print(
-                        f"   {C.CYAN}{tag:<20}{C.RST} "
-                        f"{C.WHITE}{data['name']:<20}{C.RST} "
-                        f"{C.DIM}{data['registered_at']}{C.RST}"
+                for user in users:
+                    screen.line(
+                        f"   {C.CYAN}{user['tag_id']:<20}{C.RST} "
+                        f"{C.WHITE}{user['name']:<20}{C.RST} "
+                        f"{C.DIM}{user['registered_at']}{C.RST}"
                     )
-                print()
+                screen.line()
+                if has_next or len(cursors) > 1:
+                    info(f"Página {len(cursors)}")
+            elif query:
+                warning("Nenhum usuário encontrado.")
+                screen.line()
 
             hline()
             menu_option("1", "Adicionar Usuário",  "+")
             menu_option("2", "Remover Usuário",    "-")
+            if has_next:
+                menu_option("n", "Próxima página", ">")
+            if len(cursors) > 1:
+                menu_option("p", "Página anterior", "<")
+            menu_option("/", "Buscar por nome ou tag (só / limpa)", "?")
             menu_option("0", "Voltar",             "<")
 
-            op = prompt("Opção › ")
+            op = prompt("Opção ou texto para buscar › ")
             if op == '1':
                 name   = prompt("Nome do novo usuário › ")
                 tag_id = prompt("Passe a tag no leitor (Tag ID) › ")
-                if name and tag_id and self.db.add_tag(tag_id, name):
-                    success("Usuário adicionado com sucesso!")
+                if not (name and tag_id):
+                    error("Informe o nome e a tag.")
                 else:
-                    error("Erro ao adicionar usuário ou Tag já existe.")
+                    ok, message = self.db.add_tag(tag_id, name)
+                    (success if ok else error)(message)
+                    cursors = [None]
                 pause()
             elif op == '2':
                 tag_id = prompt("Tag ID a ser removida › ")
-                if tag_id and self.db.delete_tag(tag_id):
-                    success("Usuário removido.")
-                else:
-                    error("Erro ao remover (Tag não encontrada?).")
+                if tag_id:
+                    ok, message = self.db.remove_tag(tag_id)
+                    (success if ok else error)(message)
+                    cursors = [None]
                 pause()
-            elif op == '0':
+            elif op.lower() == 'n' and has_next:
+                cursors.append(users[-1]['rowid'])
+            elif op.lower() == 'p' and len(cursors) > 1:
+                cursors.pop()
+            elif op in ('0', ''):
                 break
+            else:
+                # Anything else refines the search; every word matches as a prefix.
+                query = op[1:].strip() if op.startswith('/') else op
+                cursors = [None]
 
     def display_history(self):
-        section_header("Historico de Acessos", "")
+        self.history.flush()
+        page_size = max(terminal_size().lines - 14, 5)
+        # Keyset cursors of the pages already seen, for going back.
+        cursors = [None]
+        while True:
+            section_header("Historico de Acessos", "")
+            # One extra row tells us whether there is a next page.
+            entries = self.db.get_history_page(page_size + 1, before_id=cursors[-1])
+            has_next = len(entries) > page_size
+            entries = entries[:page_size]
+            if not entries:
+                info("Nenhum histórico registrado.")
+                pause()
+                return
 
-        entries = self.db.get_history_entries()
-        if not entries:
-            info("Nenhum histórico registrado.")
-        else:
-            print(f"   {C.DIM}{'DATA':<12} {'HORA':<10} {'NOME'}{C.RST}")
+            screen.line(f"   {C.DIM}{'DATA':<12} {'HORA':<10} {'ML':>5}  {'NOME'}{C.RST}")
             hline(color=C.DIM + C.BLUE)
             for e in entries:
-                print(
+                ml = f"{e['ml']:5.0f}" if e.get('ml') is not None else " " * 5
+                screen.line(
                     f"   {C.CYAN}{e['display_date']:<12}{C.RST} "
                     f"{C.DIM}{e['display_time']:<10}{C.RST} "
+                    f"{C.BYELLOW}{ml}{C.RST}  "
                     f"{C.WHITE}{e['name']}{C.RST}"
                 )
-            print()
-            info(f"Exibindo últimos {len(entries)} registros")
+            screen.line()
+            info(f"Página {len(cursors)}  ·  {len(entries)} registros")
 
-        pause()
+            hline()
+            if has_next:
+                menu_option("n", "Próxima página", ">")
+            if len(cursors) > 1:
+                menu_option("p", "Página anterior", "<")
+            menu_option("0", "Voltar", "<")
+
+            op = prompt("Opção › ").lower()
+            if op == 'n' and has_next:
+                cursors.append(entries[-1]['id'])
+            elif op == 'p' and len(cursors) > 1:
+                cursors.pop()
+            elif op in ('0', ''):
+                return
 
     # ── Main Loop ────────────────────────────────────────────────────
     def run(self):
+        from .dashboard import start_dashboard
+        from .metrics import Exporters
+        from .model.archive import start_archiver
+        from .ratelimit import start_limiter
+
+        self.history.start()
+        exporters = Exporters().start()
+        # Limit snapshots, archival and sync are built on SQLite.
+        sqlite = self.storage == "sqlite"
+        self.limiter = start_limiter(self.db if sqlite else None)
+        archiver = start_archiver(self.db) if sqlite else None
+        self.feed, dashboard = start_dashboard(self.db)
+        syncer = None
+        if config.SYNC_URL and sqlite:
+            from .sync import Syncer
+            syncer = Syncer(self.db)
+            syncer.start()
+        try:
+            self.main_loop()
+        finally:
+            if self.valve is not None:
+                self.valve.close()
+            if syncer is not None:
+                syncer.stop(timeout=5)
+            if dashboard is not None:
+                dashboard.stop()
+            if archiver is not None:
+                archiver.stop(timeout=5)
+            if self.limiter is not None:
+                self.limiter.close()
+            exporters.stop()
+            self.history.close()
+            self.db.close()
+            screen.flush()
+
+    def main_loop(self):
         banner()
 
-        serial_ok = self.connect_serial()
-        status_line("Porta Serial", self.serial_port, ok=serial_ok)
-        status_line("Banco de Dados", "SQLite ✔", ok=True)
-        users = self.db.get_all_tags()
-        status_line("Usuários cadastrados", str(len(users)), ok=len(users) > 0)
-        print()
+        if not config.TAPS:
+            serial_ok = self.connect_serial()
+            status_line("Porta Serial", self.serial_port, ok=serial_ok)
+        ready = getattr(self.db, "ready", None)  # FailoverDatabase opens in the background
+        if ready is not None:
+            ready.wait(1.0)
+        if self.db.degraded:
+            snapshot = self.db.snapshot
+            status_line("Banco de Dados", "Indisponível — validando pelo snapshot"
+                        f" ({len(snapshot)} tags)" if snapshot else "Indisponível", ok=False)
+        else:
+            status_line("Banco de Dados", f"{self.db.label} ✔", ok=True)
+            users = self.db.count_tags()
+            status_line("Usuários cadastrados", str(users), ok=users > 0)
+        screen.line()
 
         pause("Pressione Enter para continuar...")
 
@@ -348,7 +592,7 @@ class MinimalRFIDApp:
             hline()
             center_text("MENU PRINCIPAL", C.BOLD + C.BWHITE)
             hline()
-            print()
+            screen.line()
 
             menu_option("1", "Modo Validacao (Aguarda Tags)",  ">")
             menu_option("2", "Gerenciar Usuarios",             ">")
@@ -359,6 +603,9 @@ class MinimalRFIDApp:
 
             if enc == '1':
                 self.validate_tag_flow()
+            elif enc in ('2', '3') and self.db.degraded:
+                error("Banco de dados indisponível: só a validação funciona até ele voltar.")
+                show(1.5)
             elif enc == '2':
                 self.manage_users_flow()
             elif enc == '3':
@@ -366,16 +613,19 @@ class MinimalRFIDApp:
             elif enc == '0':
                 clear()
                 center_text("Ate mais!", C.BOLD + C.BCYAN)
-                print()
-                if self.serial_conn and self.serial_conn.is_open:
+                screen.line()
+                screen.flush()
+                try:
                     self.send_serial_command('0')
+                except ValveError:
+                    pass
                 break
             else:
                 warning("Opção inválida.")
-                time.sleep(1)
-def main():
-    app = MinimalRFIDApp()
-    app.run()
+                show(1)
+def main(argv=None):
+    from .cli import main as cli_main
+    return cli_main(argv)
 
 if __name__ == "__main__":
     main()
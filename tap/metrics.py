@@ -0,0 +1,294 @@
+"""Counters and fixed-bucket histograms with Prometheus text-format export.
+
+Recording costs a lock and a ``bisect`` (well under a microsecond), so
+instrumentation stays on in production. Metrics are exposed either over
+HTTP (``TAP_METRICS_PORT``, ``GET /metrics``) or as a file rewritten
+every ``TAP_METRICS_INTERVAL`` seconds (``TAP_METRICS_FILE``, e.g. for
+node_exporter's textfile collector).
+"""
+
+import bisect
+import logging
+import os
+import threading
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Seconds. Lookups and serial writes live in the sub-millisecond buckets;
+# read-to-open includes queueing behind a running pour.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+POUR_BUCKETS = (1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 60.0, 120.0)
+VOLUME_BUCKETS = (50.0, 100.0, 200.0, 300.0, 400.0, 500.0, 750.0, 1000.0, 1500.0, 2000.0)  # ml
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, _labels(self.labelnames, key), self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labels, labelnames, key):
+        return [f"{name}{labels} {_number(self.value)}"]
+
+
+class Counter(_Family):
+    type = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def render(self, name, labels, labelnames, key):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = _labels(labelnames, key, [("le", _number(bound))])
+            lines.append(f"{name}_bucket{le} {cumulative}")
+        lines.append(f"{name}_sum{labels} {_number(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Histogram(_Family):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = cls(name, *args, **kwargs)
+            elif not isinstance(family, cls):
+                raise ValueError(f"metric {name!r} already registered as a {family.type}")
+            return family
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class EngineMetrics:
+    """The hot-path metrics of one tap (``tap`` label; empty for a single tap)."""
+
+    def __init__(self, tap="", registry=REGISTRY):
+        r = registry
+        labels = ("tap",)
+        self.queue_wait = r.histogram(
+            "tap_queue_wait_seconds", "Tag read to start of validation.", labels).labels(tap)
+        self.lookup = r.histogram(
+            "tap_lookup_seconds", "Authorization lookup (cache or database).", labels).labels(tap)
+        self.read_to_open = r.histogram(
+            "tap_read_to_open_seconds", "Tag read to valve open command written.", labels).labels(tap)
+        self.history = r.histogram(
+            "tap_history_enqueue_seconds", "Handing a pour to the history logger.", labels).labels(tap)
+        writes = r.histogram(
+            "tap_valve_write_seconds", "Serial valve command write.", ("tap", "command"))
+        self.valve_open = writes.labels(tap, "open")
+        self.valve_close = writes.labels(tap, "close")
+        self.pour = r.histogram(
+            "tap_pour_seconds", "Valve open time.", labels, buckets=POUR_BUCKETS).labels(tap)
+        self.pour_volume = r.histogram(
+            "tap_pour_ml", "Volume measured by the flow meter per pour.", labels,
+            buckets=VOLUME_BUCKETS).labels(tap)
+
+        self.reads = r.counter("tap_reads_total", "Tag reads.", labels).labels(tap)
+        self.granted = r.counter("tap_granted_total", "Authorized reads.", labels).labels(tap)
+        self.denied = r.counter("tap_denied_total", "Unknown tags.", labels).labels(tap)
+        self.busy = r.counter("tap_busy_total", "Authorized reads refused while pouring.", labels).labels(tap)
+        self.pours = r.counter("tap_pours_total", "Valve openings.", labels).labels(tap)
+        limited = r.counter("tap_limited_total", "Authorized reads refused by the rate limit or daily quota.",
+                            ("tap", "reason"))
+        self.limited_rate = limited.labels(tap, "rate")
+        self.limited_quota = limited.labels(tap, "quota")
+        self.serial_errors = r.counter(
+            "tap_serial_errors_total", "Failed valve commands.", labels).labels(tap)
+        self.reconnects = r.counter(
+            "tap_reconnects_total", "Valve port reopened after a failure.", labels).labels(tap)
+        self.retries = r.counter(
+            "tap_valve_retries_total", "Valve frames resent for lack of an acknowledgement.", labels).labels(tap)
+        self.restarts = r.counter(
+            "tap_valve_restarts_total", "Valve device restarts reported by the device.", labels).labels(tap)
+        self.history_errors = r.counter(
+            "tap_history_errors_total", "Pours the history logger refused.", labels).labels(tap)
+
+
+# ── Export ──────────────────────────────────────────────────────────────
+def write_textfile(path, registry=REGISTRY):
+    """Atomically replace ``path`` with the current metrics."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+class TextfileExporter(threading.Thread):
+    def __init__(self, path, interval=None, registry=REGISTRY):
+        super().__init__(name="metrics-textfile", daemon=True)
+        self.path = path
+        self.interval = config.METRICS_INTERVAL if interval is None else interval
+        self.registry = registry
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            write_textfile(self.path, self.registry)
+        except OSError as e:
+            logger.warning("metrics: cannot write %s (%s)", self.path, e)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self._write()
+
+
+def serve_http(port, addr="127.0.0.1", registry=REGISTRY):
+    """Serve ``/metrics`` from a daemon thread; returns the server (``shutdown()`` to stop)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class Exporters:
+    """Whatever ``TAP_METRICS_PORT`` / ``TAP_METRICS_FILE`` ask for."""
+
+    def __init__(self, port=None, path=None, addr=None, registry=REGISTRY):
+        self.port = config.METRICS_PORT if port is None else port
+        self.path = config.METRICS_FILE if path is None else path
+        self.addr = addr or config.METRICS_ADDR
+        self.registry = registry
+        self.server = None
+        self.textfile = None
+
+    def start(self):
+        if self.port:
+            try:
+                self.server = serve_http(self.port, self.addr, self.registry)
+                logger.info("metrics: http://%s:%d/metrics", self.addr, self.server.server_port)
+            except OSError as e:
+                logger.warning("metrics: cannot listen on %s:%d (%s)", self.addr, self.port, e)
+        if self.path:
+            self.textfile = TextfileExporter(self.path, registry=self.registry)
+            self.textfile.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.textfile is not None:
+            self.textfile.stop()
@@ -0,0 +1,253 @@
+"""History retention: old pours move from SQLite to monthly archive files.
+
+Rows older than ``TAP_AUDIT_RETENTION_DAYS`` are copied to
+``<archive dir>/history-YYYY-MM.jsonl.gz`` (one gzip-compressed JSON line
+``[id, tag_id, ts, name, tap, ml]`` per pour, grouped by local month;
+files written before flow meters were supported lack ``ml``), then
+deleted from ``history`` a few hundred rows per transaction so taps keep
+writing in between. Freed pages are returned to the file system with
+incremental vacuum. The rollups are left alone, so reports still count
+archived pours.
+
+A month file is rewritten atomically with the rows it already holds,
+keyed by id: a run interrupted after writing the archive but before the
+delete simply archives the same rows again. Rows not yet pushed to the
+central server (see :mod:`tap.sync`) are never archived.
+
+:meth:`HistoryArchive.iter_entries` reads the archives back in the same
+shape as ``SQLiteDatabase.get_history_page``, and
+``SQLiteDatabase.iter_history`` continues into them after the live table.
+"""
+
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .. import config
+from . import changelog, search
+from .history import to_epoch
+
+logger = logging.getLogger(__name__)
+
+MONTH_FILE = re.compile(r"^history-(\d{4}-\d{2})\.jsonl\.gz$")
+
+# Rows read per archive pass; each pass rewrites the month files it touches once.
+CHUNK_ROWS = 50000
+# Pages freed per incremental vacuum step (one short write transaction each).
+VACUUM_PAGES = 500
+# First wait after a failed pass; it doubles while the database stays unavailable.
+RETRY_SECONDS = 60.0
+
+
+def archive_dir(db_file):
+    return config.ARCHIVE_DIR or f"{db_file}-archive"
+
+
+def month_of(ts):
+    return time.strftime("%Y-%m", time.localtime(ts))
+
+
+class HistoryArchive:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, month):
+        return os.path.join(self.directory, f"history-{month}.jsonl.gz")
+
+    def months(self):
+        """Archived months, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(m.group(1) for m in map(MONTH_FILE.match, names) if m)
+
+    def rows(self, month):
+        """``(id, tag_id, ts, name, tap[, ml])`` rows of one month, by id (older files lack ``ml``)."""
+        try:
+            with gzip.open(self.path(month), "rt", encoding="utf-8") as f:
+                return [tuple(json.loads(line)) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def add(self, month, rows):
+        """Merge ``rows`` into the month file (atomically); returns its row count."""
+        merged = {row[0]: tuple(row) for row in self.rows(month)}
+        merged.update((row[0], tuple(row)) for row in rows)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(month)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+                for row_id in sorted(merged):
+                    f.write(json.dumps(merged[row_id], ensure_ascii=False).encode("utf-8") + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp, path)
+        return len(merged)
+
+    def iter_entries(self, before_id=None, tag_id=None, name=None, since=None, until=None, tap=None):
+        """Archived history entries newest first, filtered like ``get_history_page``."""
+        from .database import _history_entry
+
+        since = to_epoch(since) if since is not None else None
+        until = to_epoch(until) if until is not None else None
+        first = month_of(since) if since is not None else None
+        last = month_of(until) if until is not None else None
+        for month in reversed(self.months()):
+            if (first and month < first) or (last and month > last):
+                continue
+            for row_id, row_tag, ts, row_name, row_tap, *ml in reversed(self.rows(month)):
+                if ((before_id is not None and row_id >= before_id)
+                        or (tag_id is not None and row_tag != tag_id)
+                        or (name is not None and row_name != name)
+                        or (tap is not None and row_tap != tap)
+                        or (since is not None and ts < since)
+                        or (until is not None and ts >= until)):
+                    continue
+                yield _history_entry({'id': row_id, 'tag_id': row_tag, 'name': row_name,
+                                      'ts': ts, 'tap': row_tap, 'ml': ml[0] if ml else None})
+
+
+# ── Archival ─────────────────────────────────────────────────────────────
+def archive_history(db, days=None, batch_size=None, pause=0.05, archive=None, now=None, stop=None):
+    """Move history older than ``days`` days to ``archive``; returns a summary dict.
+
+    ``batch_size`` rows are deleted per transaction, ``pause`` seconds
+    apart. A set ``stop`` event ends the run after the current chunk.
+    """
+    days = config.AUDIT_RETENTION_DAYS if days is None else days
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    archive = archive or HistoryArchive(archive_dir(db.db_file))
+    cutoff = int((time.time() if now is None else now) - days * 86400)
+    summary = {'archived': 0, 'months': set(), 'freed_pages': 0}
+    while True:
+        rows = _select_expired(db, cutoff, CHUNK_ROWS)
+        if not rows:
+            break
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(month_of(row[2]), []).append(row)
+        for month, month_rows in by_month.items():
+            archive.add(month, month_rows)
+        # Only delete what is safely on disk.
+        ids = [row[0] for row in rows]
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            with db.pool.write() as conn:
+                try:
+                    conn.execute(f"DELETE FROM history WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            if pause:
+                time.sleep(pause)
+        summary['archived'] += len(rows)
+        summary['months'].update(by_month)
+        if len(rows) < CHUNK_ROWS or (stop is not None and stop.is_set()):
+            break
+    if summary['archived']:
+        summary['freed_pages'] = incremental_vacuum(db)
+        logger.info("history: archived %d rows older than %d days to %s (%s)", summary['archived'], days,
+                    archive.directory, ", ".join(sorted(summary['months'])))
+    summary['months'] = sorted(summary['months'])
+    return summary
+
+
+def _select_expired(db, cutoff, limit):
+    with db.pool.read() as conn:
+        params = [cutoff]
+        unsynced = ""
+        if config.SYNC_URL:
+            params.append(int(changelog.get_state(conn, "history_pushed", 0)))
+            unsynced = "AND h.id <= ?"
+        params.append(limit)
+        cursor = conn.execute(
+            "SELECT h.id, h.tag_id, h.ts, n.name, h.tap, h.ml FROM history h "
+            f"LEFT JOIN names n ON n.id = h.name_id WHERE h.ts < ? {unsynced} ORDER BY h.id LIMIT ?",
+            params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def incremental_vacuum(db, pages=VACUUM_PAGES):
+    """Give free pages back to the file system; returns how many were freed.
+
+    Needs ``auto_vacuum = INCREMENTAL``, which new databases get; older
+    ones are converted once by :func:`enable_incremental_vacuum`.
+    """
+    with db.pool.read() as conn:
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode != 2:
+        logger.info("history: free pages kept (auto_vacuum is off; run 'tap archive --vacuum' once)")
+        return 0
+    freed = 0
+    while True:
+        with db.pool.write() as conn:
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not before:
+                return freed
+            # executescript steps the pragma to completion (execute frees one page).
+            conn.executescript(f"PRAGMA incremental_vacuum({pages})")
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        freed += before - after
+        if after >= before:
+            return freed
+
+
+def enable_incremental_vacuum(db):
+    """Switch an existing database to incremental auto-vacuum (a full ``VACUUM``)."""
+    with db.pool.write() as conn:
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        if search.available(conn):
+            # VACUUM may renumber ``tags`` rowids, which the search index is keyed by.
+            search.rebuild(conn)
+            conn.commit()
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+class Archiver(threading.Thread):
+    def __init__(self, db, days=None, interval=None):
+        super().__init__(name="history-archiver", daemon=True)
+        self.db = db
+        self.days = config.AUDIT_RETENTION_DAYS if days is None else days
+        self.interval = config.ARCHIVE_INTERVAL if interval is None else interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        delay, failures = 0.0, 0
+        while not self._stop_event.wait(delay):
+            try:
+                archive_history(self.db, self.days, stop=self._stop_event)
+            except sqlite3.Error as e:
+                # The database is not open yet (degraded start) or is busy.
+                failures += 1
+                delay = min(RETRY_SECONDS * 2 ** (failures - 1), max(self.interval, RETRY_SECONDS))
+                logger.warning("history: archival failed (%s, retrying in %.0f s)", e, delay)
+                continue
+            except Exception as e:
+                logger.warning("history: archival failed (%s)", e)
+                delay = min(self.interval, RETRY_SECONDS)
+                continue
+            delay, failures = self.interval, 0
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+def start_archiver(db):
+    """The background archival job, or ``None`` if history is kept forever."""
+    if config.AUDIT_RETENTION_DAYS <= 0:
+        return None
+    archiver = Archiver(db)
+    archiver.start()
+    return archiver
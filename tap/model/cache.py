@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TagCache:
+    """In-memory authorization cache for the ``tags`` table.
+
+    The cache is loaded once and then kept in step by the owning
+    ``SQLiteDatabase`` (``put``/``discard``). Changes committed by other
+    processes are detected through ``PRAGMA data_version`` plus the
+    trigger-maintained ``tag_version`` counter, so history inserts do not
+    force a reload. The ``data_version`` probe itself is rate limited to one
+    per ``check_interval`` seconds, which keeps a hit free of SQL.
+
+    When the whole table fits in ``max_entries`` a miss is authoritative and
+    no query is made. Otherwise the cache works as an LRU and remembers
+    unknown tags in a bounded negative cache.
+    """
+
+    def __init__(self, conn, max_entries=100_000, max_negative=1024, check_interval=0.25):
+        self.conn = conn
+        self.check_interval = check_interval
+        self._next_check = 0.0
+        self.max_entries = max_entries
+        self.max_negative = max_negative
+        self.lock = threading.RLock()
+        self.complete = False
+        self._entries = OrderedDict()
+        self._negative = OrderedDict()
+        self._data_version = None
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    # ── Loading ──────────────────────────────────────────────────────
+    def load(self):
+        with self.lock:
+            self._data_version = self._read_data_version()
+            self._version = self._read_version()
+            rows = self.conn.execute(
+                "SELECT id, name, registered_at FROM tags LIMIT ?",
+                (self.max_entries + 1,),
+            ).fetchall()
+            self.complete = len(rows) <= self.max_entries
+            self._entries = OrderedDict(
+                (row[0], {'name': row[1], 'registered_at': row[2]})
+                for row in rows[:self.max_entries]
+            )
+            self._negative.clear()
+            self.reloads += 1
+
+    def _read_data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_version(self):
+        row = self.conn.execute("SELECT version FROM tag_version WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def refresh(self):
+        """Reload if another connection changed ``tags`` since the last check."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self.lock:
+            self._next_check = now + self.check_interval
+            data_version = self._read_data_version()
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            if self._read_version() != self._version:
+                self.load()
+
+    # ── Lookups ──────────────────────────────────────────────────────
+    def get(self, tag_id):
+        self.refresh()
+        entry = self._entries.get(tag_id)
+        if entry is not None:
+            self.hits += 1
+            if not self.complete:
+                with self.lock:
+                    if tag_id in self._entries:
+                        self._entries.move_to_end(tag_id)
+            return dict(entry)
+        if self.complete:
+            self.misses += 1
+            return None
+        return self._fetch(tag_id)
+
+    def _fetch(self, tag_id):
+        with self.lock:
+            if tag_id in self._negative:
+                self._negative.move_to_end(tag_id)
+                self.misses += 1
+                return None
+            row = self.conn.execute(
+                "SELECT name, registered_at FROM tags WHERE id = ?", (tag_id,)
+            ).fetchone()
+            self.misses += 1
+            if row is None:
+                self._negative[tag_id] = True
+                if len(self._negative) > self.max_negative:
+                    self._negative.popitem(last=False)
+                return None
+            entry = {'name': row[0], 'registered_at': row[1]}
+            self._store(tag_id, entry)
+            return dict(entry)
+
+    # ── Write-through ────────────────────────────────────────────────
+    def _store(self, tag_id, entry):
+        self._entries[tag_id] = entry
+        self._entries.move_to_end(tag_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.complete = False
+
+    def _advance(self, version):
+        """Accept our own commit, or reload if someone else committed too."""
+        if self._version is not None:
+            if version <= self._version:
+                return False  # a reload already picked this change up
+            if version != self._version + 1:
+                self.load()
+                return False
+        self._version = version
+        return True
+
+    def put(self, tag_id, name, registered_at, version):
+        with self.lock:
+            if not self._advance(version):
+                return
+            self._negative.pop(tag_id, None)
+            self._store(tag_id, {'name': name, 'registered_at': registered_at})
+
+    def discard(self, tag_id, version):
+        with self.lock:
+            if not self._advance(version):
+                return
+            self._entries.pop(tag_id, None)
+            if not self.complete:
+                self._negative[tag_id] = True
+                if len(self._negative) > self.max_negative:
+                    self._negative.popitem(last=False)
+
+    def invalidate(self):
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,76 @@
+"""Local change log of ``tags`` and the sync cursors.
+
+Triggers append every insert, real update and delete of a tag to
+``tag_changes`` in the same transaction, so the sync engine can push
+local edits without diffing the table. Rows are removed once the central
+server has them. ``sync_state`` holds this node's id and how far each
+direction has got.
+"""
+
+CHANGES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS tag_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tag_id TEXT NOT NULL,
+        name TEXT,
+        registered_at TEXT,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at INTEGER NOT NULL
+    )
+'''
+
+STATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+'''
+
+# Milliseconds since the epoch; the server keeps the latest change per tag.
+NOW_MS = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+TRIGGERS = {
+    "insert": ("AFTER INSERT ON tags", "NEW.id, NEW.name, NEW.registered_at, 0"),
+    "update": ("AFTER UPDATE ON tags WHEN OLD.name IS NOT NEW.name "
+               "OR OLD.registered_at IS NOT NEW.registered_at",
+               "NEW.id, NEW.name, NEW.registered_at, 0"),
+    "delete": ("AFTER DELETE ON tags", "OLD.id, NULL, NULL, 1"),
+}
+
+
+def ensure(conn):
+    conn.execute(CHANGES_TABLE)
+    conn.execute(STATE_TABLE)
+    for event, (when, values) in TRIGGERS.items():
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tags_changelog_{event}
+            {when}
+            BEGIN
+                INSERT INTO tag_changes (tag_id, name, registered_at, deleted, changed_at)
+                VALUES ({values}, {NOW_MS});
+            END
+        ''')
+
+
+def last_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM tag_changes").fetchone()[0]
+
+
+def pending(conn, limit):
+    """Oldest unpushed local changes: ``(seq, tag_id, name, registered_at, deleted, changed_at)``."""
+    return [tuple(row) for row in conn.execute(
+        "SELECT seq, tag_id, name, registered_at, deleted, changed_at FROM tag_changes "
+        "ORDER BY seq LIMIT ?", (limit,))]
+
+
+def forget(conn, upto):
+    conn.execute("DELETE FROM tag_changes WHERE seq <= ?", (upto,))
+
+
+def get_state(conn, key, default=None):
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_state(conn, key, value):
+    conn.execute("INSERT INTO sync_state (key, value) VALUES (?, ?) "
+                 "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, str(value)))
@@ -2,15 +2,33 @@ import sqlite3
 import os
 from datetime import datetime
 
+from . import changelog, migrations, rollups, search
+from .archive import HistoryArchive, archive_dir
+from .cache import TagCache
+from .history import to_epoch
+from .pool import ConnectionManager
+from .storage import Storage, chunks, clean_import_rows, import_changes, now_text, select_in
+
 DB_FILE = "rfid_system.db"
 
-class SQLiteDatabase:
+class SQLiteDatabase(Storage):
+    label = "SQLite"
+
     def __init__(self, db_file=DB_FILE):
         self.db_file = db_file
-        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        self.pool = ConnectionManager(self.db_file)
+        # The writer connection; every write holds ``lock``.
+        self.conn = self.pool.writer
+        self.lock = self.pool.write_lock
         self.create_tables()
         self.initialize_admin()
+        self.tag_cache = TagCache(self.pool.reader())
+        self.tag_cache.load()
+        # Pours moved out of ``history`` by the retention job.
+        self.archive = HistoryArchive(archive_dir(db_file)) if db_file != ":memory:" else None
+
+    def close(self):
+        self.pool.close()
 
     def create_tables(self):
         cursor = self.conn.cursor()
@@ -21,14 +39,43 @@ class SQLiteDatabase:
                 registered_at TEXT
             )
         ''')
+        self.conn.commit()
+        if migrations.is_legacy_history(self.conn):
+            migrations.migrate_history(self.pool)
+        cursor.execute(migrations.NAMES_TABLE)
+        cursor.execute(migrations.HISTORY_TABLE.format(table="history"))
+        migrations.add_tap_column(self.conn)
+        migrations.add_ml_column(self.conn)
+        for statement in migrations.HISTORY_INDEXES:
+            cursor.execute(statement)
+        if rollups.ensure(self.conn):
+            rollups.rebuild(self.conn)
+        cursor.execute(f"PRAGMA user_version = {migrations.SCHEMA_VERSION}")
+        # Bumped on every change to ``tags`` so the authorization cache can
+        # tell tag edits apart from history inserts made by other processes.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tag_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO tag_version (id, version) VALUES (1, 0)")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS tags_version_{event.lower()}
+                AFTER {event} ON tags
+                BEGIN
+                    UPDATE tag_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+        changelog.ensure(self.conn)
+        search.ensure(self.conn)
+        # Where the write-behind history logger's spill file is committed up to.
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tag_id TEXT,
-                name TEXT,
-                timestamp TEXT,
-                display_date TEXT,
-                display_time TEXT
+            CREATE TABLE IF NOT EXISTS history_spill (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation TEXT NOT NULL,
+                position INTEGER NOT NULL
             )
         ''')
         cursor.execute('''
@@ -47,70 +94,342 @@ class SQLiteDatabase:
             self.conn.commit()
 
     def check_credentials(self, username, password):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM admins WHERE username = ? AND password = ?", (username, password))
-        return cursor.fetchone() is not None
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM admins WHERE username = ? AND password = ?", (username, password))
+            return cursor.fetchone() is not None
 
     def get_all_tags(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM tags ORDER BY registered_at DESC")
-        rows = cursor.fetchall()
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM tags ORDER BY registered_at DESC")
+            rows = cursor.fetchall()
         return {row['id']: {'name': row['name'], 'registered_at': row['registered_at']} for row in rows}
 
+    def search_tags(self, text="", limit=20, before=None):
+        """Newest-first page of tags whose id or name words start with the words of ``text``.
+
+        ``before`` is the ``rowid`` of the last entry of the previous page
+        (keyset pagination, see :mod:`tap.model.search`).
+        """
+        with self.pool.read() as conn:
+            rows = search.search(conn, text, limit, before)
+        return [{'rowid': row[0], 'tag_id': row[1], 'name': row[2], 'registered_at': row[3]} for row in rows]
+
+    def count_tags(self, text=""):
+        with self.pool.read() as conn:
+            return search.count(conn, text)
+
     def validate_tag(self, tag_id):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM tags WHERE id = ?", (tag_id,))
-        row = cursor.fetchone()
-        if row:
-            return {'name': row['name'], 'registered_at': row['registered_at']}
-        return None
+        return self.tag_cache.get(tag_id)
+
+    def _tag_version(self, cursor):
+        cursor.execute("SELECT version FROM tag_version WHERE id = 1")
+        return cursor.fetchone()[0]
 
     def add_tag(self, tag_id, name, registered_at=None, skip_check=False):
         if not skip_check and self.validate_tag(tag_id):
             return False, "Tag já cadastrada!"
         if not registered_at:
-            registered_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO tags (id, name, registered_at) VALUES (?, ?, ?)", (tag_id, name, registered_at))
-            self.conn.commit()
-            return True, "Tag cadastrada com sucesso!"
-        except sqlite3.Error as e:
-            return False, f"Erro ao cadastrar: {e}"
+            registered_at = now_text()
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("INSERT INTO tags (id, name, registered_at) VALUES (?, ?, ?)", (tag_id, name, registered_at))
+                version = self._tag_version(cursor)
+                self.conn.commit()
+                self.tag_cache.put(tag_id, name, registered_at, version)
+                return True, "Tag cadastrada com sucesso!"
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                return False, f"Erro ao cadastrar: {e}"
 
     def update_tag(self, tag_id, new_name):
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("UPDATE tags SET name = ? WHERE id = ?", (new_name, tag_id))
-            self.conn.commit()
-            if cursor.rowcount > 0:
-                return True, "Nome atualizado!"
-            return False, "Tag não encontrada!"
-        except sqlite3.Error as e:
-            return False, str(e)
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("UPDATE tags SET name = ? WHERE id = ?", (new_name, tag_id))
+                if cursor.rowcount > 0:
+                    cursor.execute("SELECT registered_at FROM tags WHERE id = ?", (tag_id,))
+                    registered_at = cursor.fetchone()[0]
+                    version = self._tag_version(cursor)
+                    self.conn.commit()
+                    self.tag_cache.put(tag_id, new_name, registered_at, version)
+                    return True, "Nome atualizado!"
+                self.conn.commit()
+                return False, "Tag não encontrada!"
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                return False, str(e)
 
     def remove_tag(self, tag_id):
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
-            self.conn.commit()
-            return True, "Tag removida!"
-        except sqlite3.Error as e:
-            return False, str(e)
-
-    def add_history_entry(self, tag_id, name, timestamp=None, display_date=None, display_time=None):
-        now = datetime.now()
-        if not timestamp: timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
-        if not display_date: display_date = now.strftime("%d/%m/%Y")
-        if not display_time: display_time = now.strftime("%H:%M:%S")
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO history (tag_id, name, timestamp, display_date, display_time)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (tag_id, name, timestamp, display_date, display_time))
-        self.conn.commit()
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+                removed = cursor.rowcount > 0
+                version = self._tag_version(cursor)
+                self.conn.commit()
+                if not removed:
+                    return False, "Tag não encontrada!"
+                self.tag_cache.discard(tag_id, version)
+                return True, "Tag removida!"
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                return False, str(e)
+
+    def import_tags(self, rows, chunk_size=500):
+        """Upsert ``(tag_id, name, registered_at)`` rows in one transaction.
+
+        ``rows`` may be any iterable (it is consumed ``chunk_size`` rows at a
+        time). Rows without an id or a name are rejected; a missing
+        ``registered_at`` keeps the stored one, or is set to now for new tags.
+        Returns a dict with ``inserted``, ``updated``, ``unchanged`` and
+        ``rejected`` counts; on error nothing is written.
+        """
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+        now = now_text()
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                for chunk in chunks(rows, chunk_size):
+                    batch = self._import_chunk(cursor, chunk, now, counts)
+                    cursor.executemany(IMPORT_UPSERT, batch)
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+        # Thousands of version bumps at once: reload instead of patching.
+        self.tag_cache.invalidate()
+        return counts
+
+    def _import_chunk(self, cursor, chunk, now, counts):
+        valid = clean_import_rows(chunk, counts)
+        rows = select_in(cursor, "SELECT id, name, registered_at FROM tags WHERE id IN ({marks})", valid)
+        stored = {row[0]: (row[1], row[2]) for row in rows}
+        return import_changes(valid, stored, now, counts)
+
+    def export_tags(self, batch_size=1000):
+        """Yield ``(tag_id, name, registered_at)`` rows straight from a cursor."""
+        with self.pool.read() as conn:
+            cursor = conn.execute("SELECT id, name, registered_at FROM tags ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield tuple(row)
+
+    def apply_tag_changes(self, changes):
+        """Apply ``(tag_id, name, registered_at, deleted)`` changes pulled from the central server.
+
+        Changes are applied in order and are not logged as local edits.
+        Returns how many tags actually changed.
+        """
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                # Take the write lock before reading the mark: a local edit
+                # committed by another process in between would get a seq
+                # above it and be deleted below, never to be pushed.
+                cursor.execute("BEGIN IMMEDIATE")
+                mark = changelog.last_seq(cursor)
+                for tag_id, name, registered_at, deleted in changes:
+                    if deleted:
+                        cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+                    else:
+                        cursor.execute(SYNC_UPSERT, (tag_id, name, registered_at))
+                cursor.execute("DELETE FROM tag_changes WHERE seq > ?", (mark,))
+                changed = cursor.rowcount
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+        if changed:
+            self.tag_cache.invalidate()
+        return changed
+
+    def history_after(self, after_id, limit):
+        """``(id, tag_id, ts, name, tap, ml)`` rows with ``id > after_id``, oldest first."""
+        with self.pool.read() as conn:
+            cursor = conn.execute(
+                "SELECT h.id, h.tag_id, h.ts, n.name, h.tap, h.ml FROM history h "
+                "LEFT JOIN names n ON n.id = h.name_id WHERE h.id > ? ORDER BY h.id LIMIT ?",
+                (after_id, limit),
+            )
+            return [tuple(row) for row in cursor.fetchall()]
+
+    def add_history_entries(self, rows, spill=None):
+        """Insert ``(tag_id, name, ts[, tap[, ml]])`` rows (see ``history_row``) in one transaction.
+
+        ``spill`` is the ``(generation, position)`` of the history writer's
+        spill file covered by these rows; it is recorded atomically with them.
+        """
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO names (name) VALUES (?)",
+                    {(row[1],) for row in rows if row[1] is not None},
+                )
+                cursor.executemany('''
+                    INSERT INTO history (tag_id, ts, name_id, tap, ml)
+                    VALUES (?, ?, (SELECT id FROM names WHERE name = ?), ?, ?)
+                ''', [(row[0], row[2], row[1], row[3] if len(row) > 3 else None, row[4] if len(row) > 4 else None)
+                      for row in rows])
+                if spill is not None:
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO history_spill (id, generation, position) VALUES (1, ?, ?)",
+                        spill,
+                    )
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+
+    def history_spill_state(self):
+        with self.pool.read() as conn:
+            row = conn.execute("SELECT generation, position FROM history_spill WHERE id = 1").fetchone()
+        return (row[0], row[1]) if row else (None, 0)
 
     def get_history_entries(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM history ORDER BY id DESC")
-        return [dict(row) for row in cursor.fetchall()]
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"{HISTORY_SELECT} ORDER BY h.id DESC")
+            return [_history_entry(row) for row in cursor.fetchall()]
+
+    def get_history_page(self, limit=50, before_id=None, tag_id=None, name=None, since=None, until=None,
+                         tap=None):
+        """Newest-first page of history with ``id < before_id`` (keyset pagination).
+
+        ``since``/``until`` take a ``datetime`` or a ``YYYY-MM-DD HH:MM:SS``
+        string (or an epoch) and bound the entry time (inclusive / exclusive).
+        """
+        clauses, params = [], []
+        if before_id is not None:
+            clauses.append("h.id < ?")
+            params.append(before_id)
+        if tag_id is not None:
+            clauses.append("h.tag_id = ?")
+            params.append(tag_id)
+        if name is not None:
+            clauses.append("h.name_id = (SELECT id FROM names WHERE name = ?)")
+            params.append(name)
+        if tap is not None:
+            clauses.append("h.tap = ?")
+            params.append(tap)
+        if since is not None:
+            clauses.append("h.ts >= ?")
+            params.append(to_epoch(since))
+        if until is not None:
+            clauses.append("h.ts < ?")
+            params.append(to_epoch(until))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"{HISTORY_SELECT} {where} ORDER BY h.id DESC LIMIT ?", params)
+            return [_history_entry(row) for row in cursor.fetchall()]
+
+    def iter_history(self, page_size=500, archived=True, **filters):
+        """Yield history entries newest first, one page in memory at a time.
+
+        Unless ``archived`` is false, entries moved to the archive files
+        follow the live ones (see :mod:`tap.model.archive`).
+        """
+        before_id = filters.pop('before_id', None)
+        while True:
+            page = self.get_history_page(page_size, before_id=before_id, **filters)
+            yield from page
+            if len(page) < page_size:
+                break
+            before_id = page[-1]['id']
+        if archived and self.archive is not None:
+            yield from self.archive.iter_entries(**filters)
+
+    def get_rollups(self, grain, since=None, until=None):
+        """``(bucket, tag_id, pours)`` rows for one grain (see ``rollups.GRAINS``).
+
+        Buckets are local-time text, so ``since``/``until`` are compared as
+        text: ``"2025-03-01"`` works for hours and days, ``"2025-03"`` for months.
+        """
+        if grain not in rollups.GRAINS:
+            raise ValueError(f"unknown grain {grain!r}")
+        clauses, params = ["grain = ?"], [grain]
+        if since is not None:
+            clauses.append("bucket >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("bucket < ?")
+            params.append(until)
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT bucket, tag_id, pours FROM rollups WHERE {' AND '.join(clauses)} ORDER BY bucket",
+                params,
+            )
+            return cursor.fetchall()
+
+    def rebuild_rollups(self):
+        """Recompute the rollups from ``history`` and the archived pours."""
+        months = self.archive.months() if self.archive is not None else []
+        with self.lock:
+            try:
+                source = "history"
+                if months:
+                    self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS archived_history "
+                                      "(id INTEGER PRIMARY KEY, tag_id TEXT, ts INTEGER)")
+                    self.conn.execute("DELETE FROM temp.archived_history")
+                    for month in months:
+                        self.conn.executemany("INSERT OR IGNORE INTO temp.archived_history VALUES (?, ?, ?)",
+                                              [row[:3] for row in self.archive.rows(month)])
+                    # A row archived but not yet deleted counts once.
+                    source = ("(SELECT tag_id, ts FROM history UNION ALL SELECT tag_id, ts "
+                              "FROM temp.archived_history WHERE id NOT IN (SELECT id FROM history))")
+                rollups.rebuild(self.conn, source)
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            finally:
+                if months:
+                    self.conn.execute("DROP TABLE IF EXISTS temp.archived_history")
+
+
+IMPORT_UPSERT = '''
+    INSERT INTO tags (id, name, registered_at)
+    VALUES (:id, :name, COALESCE(:registered_at, :now))
+    ON CONFLICT (id) DO UPDATE SET
+        name = excluded.name,
+        registered_at = COALESCE(:registered_at, tags.registered_at)
+'''
+
+
+# Only real changes fire the triggers (and with them the change log).
+SYNC_UPSERT = '''
+    INSERT INTO tags (id, name, registered_at) VALUES (?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        name = excluded.name,
+        registered_at = excluded.registered_at
+    WHERE tags.name IS NOT excluded.name OR tags.registered_at IS NOT excluded.registered_at
+'''
+
+
+HISTORY_SELECT = ("SELECT h.id, h.tag_id, n.name, h.ts, h.tap, h.ml FROM history h "
+                  "LEFT JOIN names n ON n.id = h.name_id")
+
+
+def _history_entry(row):
+    """Row from ``HISTORY_SELECT`` with the display fields formatted in local time."""
+    moment = datetime.fromtimestamp(row['ts'])
+    return {
+        'id': row['id'],
+        'tag_id': row['tag_id'],
+        'name': row['name'],
+        'ts': row['ts'],
+        'tap': row['tap'],
+        'ml': row['ml'],
+        'timestamp': moment.strftime("%Y-%m-%d %H:%M:%S"),
+        'display_date': moment.strftime("%d/%m/%Y"),
+        'display_time': moment.strftime("%H:%M:%S"),
+    }
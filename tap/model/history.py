@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def to_epoch(value):
+    """Unix time from an epoch, a ``datetime`` or local ``YYYY-MM-DD[ HH:MM:SS]`` text."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised timestamp {value!r}")
+
+
+def history_row(tag_id, name, timestamp=None, display_date=None, display_time=None, tap=None, ml=None):
+    """Build the ``(tag_id, name, ts, tap, ml)`` row ``add_history_entry`` would insert.
+
+    ``display_date``/``display_time`` are accepted for compatibility only:
+    display values are derived from ``ts`` when reading. ``ml`` is the
+    measured volume of a flow-meter pour (see :mod:`tap.flow`).
+    """
+    return (tag_id, name, to_epoch(timestamp) if timestamp else int(time.time()), tap, ml)
+
+
+def _normalize(rows):
+    # Older spill files hold ``(tag_id, name, ts[, tap])`` or legacy
+    # 5-tuples, whose timestamp is text followed by display fields.
+    return [history_row(*row[:3]) if isinstance(row[2], str)
+            else history_row(*row[:3], tap=row[3] if len(row) > 3 else None, ml=row[4] if len(row) > 4 else None)
+            for row in rows]
+
+
+class SpillLog:
+    """Append-only JSON-lines file holding history rows not yet committed.
+
+    The first line names the file's generation. Every committed batch
+    records ``(generation, byte position)`` in the same transaction, so on
+    restart only the rows after that position are replayed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.generation = None
+        self.position = 0
+        self.file = None
+
+    def recover(self, committed_generation, committed_position, end=None):
+        """Return ``(rows, generation, end_position)`` left over by a crash.
+
+        ``end`` stops at that byte position (rows appended later are left out).
+        """
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return [], None, 0
+        header, _, body = data.partition(b"\n")
+        try:
+            generation = json.loads(header)["generation"]
+        except (ValueError, KeyError, TypeError):
+            return [], None, 0
+        start = len(header) + 1
+        skip = committed_position if generation == committed_generation else start
+        rows = []
+        position = start
+        limit = len(data) if end is None else min(end, len(data))
+        for line in body.split(b"\n"):
+            line_end = position + len(line) + 1
+            if line_end > limit + 1 or (line_end > limit and end is not None):
+                break
+            if position >= skip and line:
+                try:
+                    rows.append(tuple(json.loads(line)))
+                except ValueError:
+                    break  # torn write at the tail
+            position = line_end
+        return rows, generation, min(position, limit)
+
+    def open_new(self):
+        """Atomically start a fresh generation (drops committed rows)."""
+        self.close()
+        generation = uuid.uuid4().hex
+        header = json.dumps({"generation": generation}).encode() + b"\n"
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.file = open(self.path, "ab")
+        self.generation = generation
+        self.position = len(header)
+
+    def open_existing(self):
+        """Keep appending to the current file (its rows are not committed yet)."""
+        self.close()
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            generation = json.loads(data.partition(b"\n")[0])["generation"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.open_new()
+            return
+        # Drop a torn last line so appended rows start on a line of their own.
+        size = data.rfind(b"\n") + 1
+        self.file = open(self.path, "r+b")
+        self.file.truncate(size)
+        self.file.seek(size)
+        self.generation = generation
+        self.position = size
+
+    def append(self, row):
+        line = json.dumps(row, ensure_ascii=False).encode() + b"\n"
+        self.file.write(line)
+        # Reaches the OS right away: survives a process crash without an
+        # fsync per tap.
+        self.file.flush()
+        self.position += len(line)
+        return self.position
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class HistoryWriter(threading.Thread):
+    """Write-behind history logger.
+
+    ``submit`` stamps the row, appends it to the spill log and returns; the
+    writer thread inserts queued rows with one ``executemany`` transaction
+    per flush. A flush happens when ``batch_size`` rows are waiting or
+    ``flush_interval`` seconds after the first one arrived.
+    """
+
+    def __init__(self, db, batch_size=None, flush_interval=None, spill_path=None,
+                 spill_rotate_bytes=64 * 1024):
+        super().__init__(name="history-writer", daemon=True)
+        self.db = db
+        self.batch_size = batch_size or config.HISTORY_BATCH_SIZE
+        self.flush_interval = config.HISTORY_FLUSH_SECONDS if flush_interval is None else flush_interval
+        if spill_path is None and db.db_file != ":memory:":
+            spill_path = db.db_file + "-spill"
+        self.spill = SpillLog(spill_path) if spill_path else None
+        self.spill_rotate_bytes = spill_rotate_bytes
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.written = 0
+        self.flushes = 0
+        self.recovered = 0
+        self.unwritten = 0
+        # Spill position up to which rows still need replaying, when the
+        # database was unavailable at start.
+        self._recover_before = None
+        self._closed = False
+
+    # ── Producer side ────────────────────────────────────────────────
+    def start(self):
+        if self.spill is not None:
+            try:
+                self._recover()
+            except sqlite3.Error as e:
+                # Keep the spill file; its rows are replayed on the first write.
+                logger.warning("history: database unavailable (%s), keeping %s until it recovers",
+                               e, self.spill.path)
+                self.spill.open_existing()
+                self._recover_before = self.spill.position
+            else:
+                self.spill.open_new()
+        super().start()
+
+    def _recover(self):
+        rows, generation, position = self.spill.recover(*self.db.history_spill_state())
+        if rows:
+            self.db.add_history_entries(_normalize(rows), spill=(generation, position))
+            self.recovered = len(rows)
+            logger.info("history: replayed %d rows from %s", len(rows), self.spill.path)
+
+    def submit(self, tag_id, name, timestamp=None, display_date=None, display_time=None, tap=None, ml=None):
+        row = history_row(tag_id, name, timestamp, display_date, display_time, tap, ml)
+        with self.lock:
+            if self._closed:
+                raise RuntimeError("history writer is closed")
+            position = self.spill.append(row) if self.spill is not None else None
+            self.queue.put((row, position))
+
+    def flush(self, timeout=None):
+        """Write everything submitted so far and wait for the commit."""
+        if not self.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=None):
+        with self.lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.queue.put(_STOP)
+        if self.is_alive():
+            self.join(timeout)
+        if self.spill is None:
+            return
+        if self.is_alive() or self.unwritten or self._recover_before is not None:
+            self.spill.close()
+        else:
+            self.spill.remove()
+
+    # ── Writer thread ────────────────────────────────────────────────
+    def run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if not batch else max(deadline - time.monotonic(), 0)
+            if timeout is None and self._recover_before is not None:
+                timeout = self.flush_interval
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is None or item is _STOP or isinstance(item, threading.Event):
+                if batch and self._write(batch):
+                    batch = []
+                elif batch:
+                    deadline = time.monotonic() + self.flush_interval
+                elif self._recover_before is not None:
+                    self._write(batch)
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is _STOP:
+                    self.unwritten = len(batch)
+                    if batch:
+                        logger.error("history: %d rows left in the spill log", len(batch))
+                    return
+                continue
+
+            if not batch:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                if self._write(batch):
+                    batch = []
+                else:
+                    deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch):
+        rows = [row for row, _ in batch]
+        spill = None
+        if self.spill is not None:
+            spill = (self.spill.generation, batch[-1][1] if batch else self._recover_before)
+        recovered = []
+        try:
+            if self._recover_before is not None:
+                recovered = _normalize(self.spill.recover(*self.db.history_spill_state(),
+                                                          end=self._recover_before)[0])
+            self.db.add_history_entries(recovered + rows, spill=spill)
+        except sqlite3.Error as e:
+            logger.warning("history: flush of %d rows failed (%s), will retry", len(rows), e)
+            return False
+        except Exception:
+            logger.exception("history: flush of %d rows failed, will retry", len(rows))
+            return False
+        if self._recover_before is not None:
+            self._recover_before = None
+            self.recovered += len(recovered)
+            logger.info("history: database back, replayed %d rows from %s", len(recovered), self.spill.path)
+        self.written += len(rows)
+        self.flushes += 1
+        self._maybe_rotate()
+        return True
+
+    def _maybe_rotate(self):
+        if self.spill is None or self.spill.position < self.spill_rotate_bytes:
+            return
+        with self.lock:
+            if self.queue.empty() and not self._closed:
+                self.spill.open_new()
@@ -0,0 +1,166 @@
+"""The in-memory storage engine (``TAP_STORAGE=memory``).
+
+Tags live in a dict and history in a list ordered by id, so a lookup is
+one dict access and a history page is a bisect plus a short scan.
+Nothing is persisted and there is no spill log: a restart starts empty.
+Meant for tests, benchmarks (see ``python -m benchmarks --storage``) and
+demos without a database file.
+
+Search matches word prefixes case- and accent-insensitively, like the
+FTS5 index of the SQLite engine, but scans every tag.
+"""
+
+import bisect
+import threading
+import unicodedata
+
+from .history import to_epoch
+from .search import WORD
+from .storage import Storage, chunks, clean_import_rows, import_changes, now_text
+
+
+def _fold(text):
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _words(text):
+    return WORD.findall(_fold(text))
+
+
+class MemoryStorage(Storage):
+    label = "Memória (não persiste)"
+
+    def __init__(self):
+        self._tags = {}  # tag_id -> [rowid, name, registered_at, folded words]
+        self._next_rowid = 1
+        self._history = []  # (id, tag_id, ts, name, tap, ml), by id
+        self._history_ids = []
+        self._next_id = 1
+        self._spill = (None, 0)
+        self.lock = threading.Lock()
+
+    # ── Tags ─────────────────────────────────────────────────────────
+    def validate_tag(self, tag_id):
+        tag = self._tags.get(tag_id)
+        return {'name': tag[1], 'registered_at': tag[2]} if tag is not None else None
+
+    def get_all_tags(self):
+        tags = sorted(self._tags.items(), key=lambda item: item[1][2] or "", reverse=True)
+        return {tag_id: {'name': tag[1], 'registered_at': tag[2]} for tag_id, tag in tags}
+
+    def _matching(self, text):
+        words = _words(text)
+        for tag_id, tag in self._tags.items():
+            if all(any(w.startswith(word) for w in tag[3]) for word in words):
+                yield tag_id, tag
+
+    def search_tags(self, text="", limit=20, before=None):
+        with self.lock:
+            found = [(tag[0], tag_id, tag[1], tag[2]) for tag_id, tag in self._matching(text)
+                     if before is None or tag[0] < before]
+        found.sort(reverse=True)
+        return [{'rowid': rowid, 'tag_id': tag_id, 'name': name, 'registered_at': registered_at}
+                for rowid, tag_id, name, registered_at in found[:limit]]
+
+    def count_tags(self, text=""):
+        if not text:
+            return len(self._tags)
+        with self.lock:
+            return sum(1 for _ in self._matching(text))
+
+    def _put(self, tag_id, name, registered_at):
+        tag = self._tags.get(tag_id)
+        rowid = tag[0] if tag is not None else self._next_rowid
+        if tag is None:
+            self._next_rowid += 1
+        self._tags[tag_id] = [rowid, name, registered_at, _words(name) + _words(tag_id)]
+
+    def add_tag(self, tag_id, name, registered_at=None, skip_check=False):
+        with self.lock:
+            if tag_id in self._tags:
+                return False, "Tag já cadastrada!"
+            self._put(tag_id, name, registered_at or now_text())
+        return True, "Tag cadastrada com sucesso!"
+
+    def update_tag(self, tag_id, new_name):
+        with self.lock:
+            tag = self._tags.get(tag_id)
+            if tag is None:
+                return False, "Tag não encontrada!"
+            self._put(tag_id, new_name, tag[2])
+        return True, "Nome atualizado!"
+
+    def remove_tag(self, tag_id):
+        with self.lock:
+            if self._tags.pop(tag_id, None) is None:
+                return False, "Tag não encontrada!"
+        return True, "Tag removida!"
+
+    def import_tags(self, rows, chunk_size=500):
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+        now = now_text()
+        planned = {}  # tag_id -> (name, registered_at) once every chunk is read
+        for chunk in chunks(rows, chunk_size):
+            valid = clean_import_rows(chunk, counts)
+            stored = {}
+            for tag_id in valid:
+                if tag_id in planned:
+                    stored[tag_id] = planned[tag_id]
+                elif tag_id in self._tags:
+                    stored[tag_id] = tuple(self._tags[tag_id][1:3])
+            import_changes(valid, stored, now, counts)
+            planned.update((tag_id, stored[tag_id]) for tag_id in valid)
+        # All or nothing, as with SQLite: nothing changes until every row is read.
+        with self.lock:
+            for tag_id, (name, registered_at) in planned.items():
+                current = self._tags.get(tag_id)
+                if current is None or (current[1], current[2]) != (name, registered_at):
+                    self._put(tag_id, name, registered_at)
+        return counts
+
+    def export_tags(self, batch_size=1000):
+        with self.lock:
+            rows = [(tag_id, tag[1], tag[2]) for tag_id, tag in self._tags.items()]
+        rows.sort()
+        yield from rows
+
+    # ── History ──────────────────────────────────────────────────────
+    def add_history_entries(self, rows, spill=None):
+        with self.lock:
+            for row in rows:
+                self._history.append((self._next_id, row[0], int(row[2]), row[1],
+                                      row[3] if len(row) > 3 else None, row[4] if len(row) > 4 else None))
+                self._history_ids.append(self._next_id)
+                self._next_id += 1
+            if spill is not None:
+                self._spill = tuple(spill)
+
+    def history_spill_state(self):
+        return self._spill
+
+    def history_after(self, after_id, limit):
+        start = bisect.bisect_right(self._history_ids, after_id)
+        return self._history[start:start + limit]
+
+    def get_history_page(self, limit=50, before_id=None, tag_id=None, name=None, since=None, until=None,
+                         tap=None):
+        from .database import _history_entry
+
+        since = to_epoch(since) if since is not None else None
+        until = to_epoch(until) if until is not None else None
+        end = len(self._history_ids) if before_id is None else bisect.bisect_left(self._history_ids, before_id)
+        page = []
+        for i in range(end - 1, -1, -1):
+            if len(page) >= limit:
+                break
+            row_id, row_tag, ts, row_name, row_tap, ml = self._history[i]
+            if ((tag_id is not None and row_tag != tag_id)
+                    or (name is not None and row_name != name)
+                    or (tap is not None and row_tap != tap)
+                    or (since is not None and ts < since)
+                    or (until is not None and ts >= until)):
+                continue
+            page.append(_history_entry({'id': row_id, 'tag_id': row_tag, 'name': row_name,
+                                        'ts': ts, 'tap': row_tap, 'ml': ml}))
+        return page
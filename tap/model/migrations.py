@@ -0,0 +1,138 @@
+"""Schema migrations for ``rfid_system.db``.
+
+Version 2 replaces the legacy text-heavy ``history`` table (timestamp,
+display date and display time as text, plus a copy of the user's name)
+with a compact one: an integer epoch, the tag id and a reference into an
+interned ``names`` table. Display values are formatted at read time.
+
+Version 3 adds the ``tap`` column naming the tap that served each pour
+(``NULL`` for single-tap setups).
+
+Version 4 adds the ``tags`` change log and the sync cursors (see
+:mod:`tap.model.changelog`); both are created empty.
+
+Version 5 adds the ``tags_search`` full-text index (see
+:mod:`tap.model.search`), filled from ``tags`` when it is created.
+
+Version 6 adds the ``ml`` column: the volume a flow meter measured for
+the pour (see :mod:`tap.flow`), ``NULL`` for timed doses.
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 6
+
+NAMES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS names (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+'''
+
+# Name at pour time is kept through ``names`` so renames and removals do
+# not rewrite the audit trail.
+HISTORY_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tag_id TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        name_id INTEGER REFERENCES names (id),
+        tap TEXT,
+        ml REAL
+    )
+'''
+
+HISTORY_INDEXES = (
+    # Both carry the rowid, so filtered pages still walk id order.
+    "CREATE INDEX IF NOT EXISTS idx_history_tag_id ON history (tag_id)",
+    "CREATE INDEX IF NOT EXISTS idx_history_ts ON history (ts)",
+)
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def is_legacy_history(conn):
+    return "display_date" in columns(conn, "history")
+
+
+def add_tap_column(conn):
+    """Version 2 -> 3: a nullable column is a metadata-only change in SQLite."""
+    if "tap" not in columns(conn, "history"):
+        conn.execute("ALTER TABLE history ADD COLUMN tap TEXT")
+
+
+def add_ml_column(conn):
+    """Version 5 -> 6, metadata-only like the ``tap`` column."""
+    if "ml" not in columns(conn, "history"):
+        conn.execute("ALTER TABLE history ADD COLUMN ml REAL")
+
+
+def migrate_history(pool, batch_size=5000, pause=0.0, progress=None):
+    """Convert a legacy ``history`` table in place, ``batch_size`` rows per transaction.
+
+    Each batch is its own short write transaction, so taps and other
+    processes keep writing while a large table is converted; ``pause``
+    seconds between batches leaves them extra room. The copy is resumable:
+    an interrupted run picks up after the last converted id. The final swap
+    copies any stragglers and renames the table in one short transaction.
+    Returns the number of rows converted.
+    """
+    with pool.write() as conn:
+        if not is_legacy_history(conn):
+            return 0
+        conn.execute(NAMES_TABLE)
+        conn.execute(HISTORY_TABLE.format(table="history_compact"))
+        conn.commit()
+
+    copied = 0
+    while True:
+        with pool.write() as conn:
+            count = _copy_batch(conn, batch_size)
+            conn.commit()
+        copied += count
+        if progress is not None:
+            progress(copied)
+        if count < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    with pool.write() as conn:
+        try:
+            copied += _copy_batch(conn, -1)
+            conn.execute("DROP TABLE history")
+            conn.execute("ALTER TABLE history_compact RENAME TO history")
+            for statement in HISTORY_INDEXES:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    logger.info("history: migrated %d rows to the compact schema", copied)
+    return copied
+
+
+def _copy_batch(conn, limit):
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM history_compact").fetchone()[0]
+    conn.execute('''
+        INSERT OR IGNORE INTO names (name)
+        SELECT DISTINCT name FROM (
+            SELECT name FROM history WHERE id > ? ORDER BY id LIMIT ?
+        ) WHERE name IS NOT NULL
+    ''', (last_id, limit))
+    # Legacy timestamps are local wall-clock text; 'utc' converts them.
+    cursor = conn.execute('''
+        INSERT INTO history_compact (id, tag_id, ts, name_id)
+        SELECT h.id, COALESCE(h.tag_id, ''),
+               COALESCE(CAST(strftime('%s', h.timestamp, 'utc') AS INTEGER), 0),
+               n.id
+        FROM history h LEFT JOIN names n ON n.name = h.name
+        WHERE h.id > ? ORDER BY h.id LIMIT ?
+    ''', (last_id, limit))
+    return cursor.rowcount
@@ -0,0 +1,119 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Applied to every connection. WAL lets readers run alongside the writer;
+# NORMAL only syncs at checkpoints, which WAL keeps consistent anyway.
+# auto_vacuum only takes effect on a new file, so it goes before WAL
+# creates it; it lets history archival hand space back in small steps.
+PRAGMAS = (
+    ("auto_vacuum", "INCREMENTAL"),
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", 64 * 1024 * 1024),
+    ("cache_size", -8000),  # KiB
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),
+)
+
+# sqlite3 keeps prepared statements per connection keyed by SQL text; the
+# queries used on the hot path are constant strings, so they always hit.
+CACHED_STATEMENTS = 256
+
+# ``tap --profile`` swaps in a connection class that times statements
+# (see tap.profiling); otherwise connections are plain.
+connection_factory = sqlite3.Connection
+
+
+def file_uri(path):
+    """SQLite ``file:`` URI for a path (avoids pathlib's import cost at startup)."""
+    path = os.path.abspath(path).replace(os.sep, "/")
+    if not path.startswith("/"):
+        path = "/" + path  # Windows drive letter
+    for char, escaped in (("%", "%25"), ("?", "%3F"), ("#", "%23")):
+        path = path.replace(char, escaped)
+    return "file://" + path
+
+
+class ConnectionManager:
+    """One writer connection plus a pool of read-only connections.
+
+    Writers take ``write()`` (serialised by a lock); readers borrow a
+    connection with ``read()`` and never wait on the writer thanks to WAL.
+    In-memory databases cannot be shared between connections, so there
+    every read goes through the writer.
+    """
+
+    def __init__(self, db_file, max_readers=4):
+        self.db_file = db_file
+        self.max_readers = max_readers
+        self.write_lock = threading.RLock()
+        self.writer = self.connect()
+        self.shared = db_file == ":memory:" or db_file.startswith("file::memory:")
+        self._readers = queue.LifoQueue()
+        self._created = 0
+        self._created_lock = threading.Lock()
+        self._all = [self.writer]
+
+    def connect(self, readonly=False):
+        if readonly:
+            uri = file_uri(self.db_file) + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                   cached_statements=CACHED_STATEMENTS, factory=connection_factory)
+        else:
+            conn = sqlite3.connect(self.db_file, check_same_thread=False,
+                                   cached_statements=CACHED_STATEMENTS, factory=connection_factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS:
+            if readonly and name in ("auto_vacuum", "journal_mode"):
+                continue
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def reader(self):
+        """A dedicated read-only connection owned by the caller."""
+        if self.shared:
+            return self.writer
+        conn = self.connect(readonly=True)
+        self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def write(self):
+        with self.write_lock:
+            yield self.writer
+
+    @contextmanager
+    def read(self):
+        if self.shared:
+            with self.write_lock:
+                yield self.writer
+            return
+        conn = self._borrow()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def _borrow(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._created_lock:
+            if self._created < self.max_readers:
+                self._created += 1
+                conn = self.connect(readonly=True)
+                self._all.append(conn)
+                return conn
+        return self._readers.get()
+
+    def pragma(self, name, conn=None):
+        return (conn or self.writer).execute(f"PRAGMA {name}").fetchone()[0]
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+        self._all = []
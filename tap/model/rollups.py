@@ -0,0 +1,72 @@
+"""Consumption rollups: pours per local hour, and per tag per day and month.
+
+Triggers on ``history`` keep the rollups in the same transaction as every
+insert, so reports read a few thousand pre-aggregated rows instead of
+scanning the whole history.
+
+Hourly rows are kept for all tags together (``tag_id = ''``): a member
+rarely pours twice in the same hour, so a per-tag hourly rollup would be
+almost as large as ``history`` itself.
+"""
+
+ALL_TAGS = ""
+
+# grain -> (bucket format, kept per tag)
+GRAINS = {
+    "hour": ("%Y-%m-%d %H", False),
+    "day": ("%Y-%m-%d", True),
+    "month": ("%Y-%m", True),
+}
+
+ROLLUPS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS rollups (
+        grain TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        tag_id TEXT NOT NULL,
+        pours INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket, tag_id)
+    ) WITHOUT ROWID
+'''
+
+
+def _bucket(grain, ts):
+    return f"strftime('{GRAINS[grain][0]}', {ts}, 'unixepoch', 'localtime')"
+
+
+def _tag(grain, tag_id):
+    return tag_id if GRAINS[grain][1] else f"'{ALL_TAGS}'"
+
+
+def _trigger():
+    upserts = "\n".join(f'''
+            INSERT INTO rollups (grain, bucket, tag_id, pours)
+            VALUES ('{grain}', {_bucket(grain, "NEW.ts")}, {_tag(grain, "NEW.tag_id")}, 1)
+            ON CONFLICT (grain, bucket, tag_id) DO UPDATE SET pours = pours + 1;'''
+        for grain in GRAINS)
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS history_rollups
+        AFTER INSERT ON history
+        BEGIN{upserts}
+        END
+    '''
+
+
+def ensure(conn):
+    """Create the rollup table and trigger; returns True if they are new."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollups'"
+    ).fetchone()
+    conn.execute(ROLLUPS_TABLE)
+    conn.execute(_trigger())
+    return exists is None
+
+
+def rebuild(conn, source="history"):
+    """Recompute every rollup from ``source`` rows with ``tag_id`` and ``ts`` (caller commits)."""
+    conn.execute("DELETE FROM rollups")
+    for grain in GRAINS:
+        conn.execute(f'''
+            INSERT INTO rollups (grain, bucket, tag_id, pours)
+            SELECT '{grain}', {_bucket(grain, "ts")} AS bucket, {_tag(grain, "tag_id")} AS tag, COUNT(*)
+            FROM {source} GROUP BY bucket, tag
+        ''')
@@ -0,0 +1,132 @@
+"""Member search: an FTS5 index over tag ids and names.
+
+``tags_search`` is an external-content FTS5 table: it indexes ``tags``
+without a second copy of the rows, and triggers keep it current on every
+insert, update and delete, whoever makes them. Each word typed is
+matched as a prefix (``"ali" "sil"`` finds "Alice Silva"), case- and
+accent-insensitively, against both the name and the tag id.
+
+Results come newest first by ``rowid`` and pages continue after the last
+rowid seen, so a page costs the same however deep it is and however
+many members there are. The index is keyed by ``tags.rowid``, which a
+full ``VACUUM`` may renumber, so :func:`rebuild` runs after one.
+
+SQLite builds without FTS5 fall back to ``LIKE`` scans, which are fine
+for a few thousand members.
+"""
+
+import logging
+import re
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+INDEX_TABLE = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS tags_search USING fts5(
+        id, name, content='tags', content_rowid='rowid', tokenize='unicode61'
+    )
+'''
+
+TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS tags_search_insert AFTER INSERT ON tags
+    BEGIN
+        INSERT INTO tags_search (rowid, id, name) VALUES (NEW.rowid, NEW.id, NEW.name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS tags_search_delete AFTER DELETE ON tags
+    BEGIN
+        INSERT INTO tags_search (tags_search, rowid, id, name) VALUES ('delete', OLD.rowid, OLD.id, OLD.name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS tags_search_update AFTER UPDATE OF id, name ON tags
+    BEGIN
+        INSERT INTO tags_search (tags_search, rowid, id, name) VALUES ('delete', OLD.rowid, OLD.id, OLD.name);
+        INSERT INTO tags_search (rowid, id, name) VALUES (NEW.rowid, NEW.id, NEW.name);
+    END
+    ''',
+)
+
+WORD = re.compile(r"\w+")
+
+
+def ensure(conn):
+    """Create the index and its triggers (filled from ``tags`` if new); False without FTS5."""
+    if available(conn):
+        return True
+    try:
+        conn.execute(INDEX_TABLE)
+    except sqlite3.OperationalError as e:
+        logger.info("tag search: FTS5 unavailable (%s), using LIKE", e)
+        return False
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+    rebuild(conn)
+    return True
+
+
+def available(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tags_search'"
+    ).fetchone() is not None
+
+
+def rebuild(conn):
+    """Re-read every tag into the index (caller commits)."""
+    conn.execute("INSERT INTO tags_search (tags_search) VALUES ('rebuild')")
+
+
+def match_expression(text):
+    """FTS5 query for ``text``: every word, quoted, as a prefix. ``None`` if there are no words."""
+    words = WORD.findall(text or "")
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _like_where(text):
+    # Word prefixes as in FTS5, but only ASCII letters fold case.
+    clauses, params = [], []
+    for word in WORD.findall(text or ""):
+        prefix = re.sub(r"([\\%_])", r"\\\1", word) + "%"
+        clauses.append("(name LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\' OR id LIKE ? ESCAPE '\\')")
+        params += [prefix, "% " + prefix, prefix]
+    return " AND ".join(clauses), params
+
+
+def search(conn, text, limit, before=None):
+    """``(rowid, id, name, registered_at)`` rows matching ``text``, newest first.
+
+    ``before`` is the rowid of the last row of the previous page.
+    """
+    expression = match_expression(text)
+    if expression is not None and available(conn):
+        # FTS5 walks its own rowid order, so the page is read straight off the index.
+        sql = ("SELECT t.rowid, t.id, t.name, t.registered_at FROM tags_search s "
+               "JOIN tags t ON t.rowid = s.rowid WHERE tags_search MATCH ?")
+        params = [expression]
+        if before is not None:
+            sql += " AND s.rowid < ?"
+            params.append(before)
+        return conn.execute(f"{sql} ORDER BY s.rowid DESC LIMIT ?", params + [limit]).fetchall()
+    where, params = _like_where(text)
+    clauses = [where] if where else []
+    if before is not None:
+        clauses.append("rowid < ?")
+        params.append(before)
+    sql = "SELECT rowid, id, name, registered_at FROM tags"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return conn.execute(f"{sql} ORDER BY rowid DESC LIMIT ?", params + [limit]).fetchall()
+
+
+def count(conn, text):
+    expression = match_expression(text)
+    if expression is not None and available(conn):
+        return conn.execute("SELECT COUNT(*) FROM tags_search WHERE tags_search MATCH ?",
+                            (expression,)).fetchone()[0]
+    where, params = _like_where(text)
+    sql = "SELECT COUNT(*) FROM tags" + (f" WHERE {where}" if where else "")
+    return conn.execute(sql, params).fetchone()[0]
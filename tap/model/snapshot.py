@@ -0,0 +1,230 @@
+"""Memory-mapped tag snapshot and the database wrapper that falls back to it.
+
+The snapshot is a compact, sorted binary copy of ``tags``::
+
+    header   "TAPTAGS1", count (u32), reserved (u32), tag_version (u64)
+    index    count x (blob offset u32, id length u16, name length u16,
+             registered_at length u16), sorted by UTF-8 id
+    blob     id, name and registered_at of every tag, back to back
+
+Opening it is an ``mmap`` and a header check, and a lookup is a binary
+search over the index, so validation can start before SQLite has opened.
+The file is rewritten atomically (temporary file plus ``os.replace``)
+whenever the ``tag_version`` counter moves.
+
+:class:`FailoverDatabase` wraps :class:`~tap.model.database.SQLiteDatabase`.
+It opens SQLite in the background, answers ``validate_tag`` from the
+snapshot until SQLite is up or whenever it fails, and retries a
+database that would not open. Other calls go to SQLite and raise
+:class:`DatabaseUnavailable` in the meantime; the history writer keeps
+such rows in its spill log until they can be written.
+"""
+
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TAPTAGS1"
+HEADER = struct.Struct("<8sIIQ")
+ENTRY = struct.Struct("<IHHH")
+MAX_FIELD = 0xFFFF
+
+
+class DatabaseUnavailable(sqlite3.OperationalError):
+    pass
+
+
+def snapshot_path(db_file):
+    return config.TAG_SNAPSHOT or f"{db_file}-tags"
+
+
+def _field(value):
+    return (value or "").encode("utf-8")[:MAX_FIELD]
+
+
+def write_snapshot(path, rows, version):
+    """Atomically replace ``path`` with ``(tag_id, name, registered_at)`` rows.
+
+    Rows must be sorted by id in byte order, as ``ORDER BY id`` returns
+    them from SQLite. Returns the number of tags written.
+    """
+    index, blob = bytearray(), bytearray()
+    count = 0
+    for tag_id, name, registered_at in rows:
+        fields = [_field(tag_id), _field(name), _field(registered_at)]
+        index += ENTRY.pack(len(blob), *map(len, fields))
+        for field in fields:
+            blob += field
+        count += 1
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, 0, version))
+        f.write(index)
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+class TagSnapshot:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{path}: truncated tag snapshot")
+        magic, self.count, _, self.version = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a tag snapshot")
+        self._blob = HEADER.size + self.count * ENTRY.size
+        if len(self._map) < self._blob:
+            raise ValueError(f"{path}: truncated tag snapshot")
+
+    @classmethod
+    def open(cls, path):
+        """The snapshot at ``path``, or ``None`` if it is missing or unreadable."""
+        try:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("tag snapshot: cannot use %s (%s)", path, e)
+            return None
+
+    def _entry(self, i):
+        offset, id_len, name_len, reg_len = ENTRY.unpack_from(self._map, HEADER.size + i * ENTRY.size)
+        start = self._blob + offset
+        return start, id_len, name_len, reg_len
+
+    def get(self, tag_id):
+        """``{'name', 'registered_at'}`` like ``validate_tag``, or ``None``."""
+        key = tag_id.encode("utf-8")
+        m = self._map
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, id_len, name_len, reg_len = self._entry(mid)
+            probe = m[start:start + id_len]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                name_at = start + id_len
+                reg_at = name_at + name_len
+                return {'name': m[name_at:reg_at].decode("utf-8"),
+                        'registered_at': m[reg_at:reg_at + reg_len].decode("utf-8") or None}
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+
+class FailoverDatabase:
+    """``SQLiteDatabase`` once it opens, the tag snapshot until then (and whenever it fails)."""
+
+    def __init__(self, db_file, snapshot=None, retry_seconds=None, check_interval=1.0, opener=None):
+        self.db_file = db_file
+        self.snapshot_path = snapshot or snapshot_path(db_file)
+        self.retry_seconds = config.DB_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self.check_interval = check_interval
+        if opener is None:
+            from .database import SQLiteDatabase as opener
+        self.opener = opener
+        self.db = None
+        self.snapshot = TagSnapshot.open(self.snapshot_path)
+        self.ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tag-snapshot", daemon=True)
+
+    def open(self, timeout=None):
+        """Start opening SQLite; waits for it only when there is no snapshot to fall back on."""
+        self._thread.start()
+        if self.snapshot is None:
+            timeout = config.DB_OPEN_TIMEOUT if timeout is None else timeout
+            if not self.ready.wait(timeout):
+                logger.error("database %s not open after %.0f s and no tag snapshot: "
+                             "every tag is refused until it opens", self.db_file, timeout)
+        elif not self.ready.is_set():
+            logger.info("validating from tag snapshot %s (%d tags) while %s opens",
+                        self.snapshot_path, len(self.snapshot), self.db_file)
+        return self
+
+    @property
+    def degraded(self):
+        return self.db is None
+
+    # ── Validation ───────────────────────────────────────────────────
+    def validate_tag(self, tag_id):
+        db = self.db
+        if db is not None:
+            try:
+                return db.validate_tag(tag_id)
+            except sqlite3.Error as e:
+                logger.warning("database lookup failed (%s), using tag snapshot", e)
+        snapshot = self.snapshot
+        return snapshot.get(tag_id) if snapshot is not None else None
+
+    # ── Everything else goes to SQLite ───────────────────────────────
+    def __getattr__(self, name):
+        db = self.__dict__.get("db")
+        if db is None:
+            raise DatabaseUnavailable(f"database {self.__dict__.get('db_file')} is not available")
+        return getattr(db, name)
+
+    # ── Background: open, then keep the snapshot current ─────────────
+    def _run(self):
+        while self.db is None:
+            try:
+                db = self.opener(self.db_file)
+            except Exception as e:
+                logger.warning("database %s: cannot open (%s), retrying in %.0f s",
+                               self.db_file, e, self.retry_seconds)
+                if self._stop_event.wait(self.retry_seconds):
+                    return
+                continue
+            if self._stop_event.is_set():
+                db.close()
+                return
+            self.db = db
+            self.ready.set()
+            logger.info("database %s open", self.db_file)
+        version = None
+        while True:
+            try:
+                version = self._refresh(version)
+            except Exception as e:
+                logger.warning("tag snapshot: refresh failed (%s)", e)
+            if self._stop_event.wait(self.check_interval):
+                return
+
+    def _refresh(self, known):
+        with self.db.pool.read() as conn:
+            version = conn.execute("SELECT version FROM tag_version WHERE id = 1").fetchone()[0]
+            if version == known:
+                return known
+            # Rewritten on the first check after opening too: the file may
+            # predate edits made while this process was not running.
+            count = write_snapshot(self.snapshot_path,
+                                   conn.execute("SELECT id, name, registered_at FROM tags ORDER BY id"),
+                                   version)
+        self.snapshot = TagSnapshot(self.snapshot_path)
+        logger.debug("tag snapshot: %d tags at version %d", count, version)
+        return version
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(5)
+        if self.db is not None:
+            self.db.close()
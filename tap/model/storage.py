@@ -0,0 +1,225 @@
+"""Storage engines behind one interface, chosen by configuration.
+
+:class:`Storage` is everything the validation path, the taps and the
+terminal UI ask of storage. Three engines implement it:
+
+``sqlite``
+    :class:`~tap.model.database.SQLiteDatabase`, the default: one local
+    file. The tag snapshot, history archives, rate-limit snapshots and
+    central sync are built on it and are only available with it.
+``memory``
+    :class:`~tap.model.memory.MemoryStorage`: dicts and lists, nothing
+    persisted. For tests, benchmarks and demos.
+``remote``
+    :class:`~tap.model.remote.RemoteStorage`: tags and history on a
+    central SQL server. A ``sqlite:///path`` URL stands in for the
+    server locally.
+
+``TAP_STORAGE`` picks the engine; ``TAP_DB_PATH`` is the SQLite file and
+``TAP_DB_URL`` the server. :func:`open_storage` opens one and :func:`copy`
+moves tags and history between two of them.
+"""
+
+from datetime import datetime
+
+from .. import config
+from .history import history_row
+
+ENGINES = ("sqlite", "memory", "remote")
+# Bound variables per ``IN (...)`` lookup, whatever the import chunk size:
+# SQLite before 3.32 (Raspbian Buster ships 3.27) allows 999.
+MAX_IN_VARIABLES = 900
+
+
+class Storage:
+    """Tags, history and the history writer's spill state.
+
+    Engines subclass it for the shared helpers; callers only rely on the
+    methods below. ``db_file`` is the local path the history writer keeps
+    its spill log next to, or ``":memory:"`` for none.
+    """
+
+    db_file = ":memory:"
+    label = "?"
+    # True while an engine answers from a fallback (see ``FailoverDatabase``).
+    degraded = False
+    # True when ``validate_tag`` is a network round trip: the validation
+    # engine then looks tags up off its event loop, with a time limit.
+    remote_lookup = False
+
+    def close(self):
+        pass
+
+    # ── Tags ─────────────────────────────────────────────────────────
+    def validate_tag(self, tag_id):
+        """``{'name', 'registered_at'}`` of a registered tag, else ``None``; called on every read."""
+        raise NotImplementedError
+
+    def get_all_tags(self):
+        """``{tag_id: {'name', 'registered_at'}}``, newest first."""
+        raise NotImplementedError
+
+    def search_tags(self, text="", limit=20, before=None):
+        """Newest-first page of ``{'rowid', 'tag_id', 'name', 'registered_at'}``.
+
+        Every word of ``text`` must start a word of the name or the id.
+        ``before`` is the ``rowid`` of the last entry of the previous page.
+        """
+        raise NotImplementedError
+
+    def count_tags(self, text=""):
+        raise NotImplementedError
+
+    def add_tag(self, tag_id, name, registered_at=None, skip_check=False):
+        """``(ok, message)``; the message is shown to the user as is."""
+        raise NotImplementedError
+
+    def update_tag(self, tag_id, new_name):
+        raise NotImplementedError
+
+    def remove_tag(self, tag_id):
+        raise NotImplementedError
+
+    def import_tags(self, rows, chunk_size=500):
+        """Upsert ``(tag_id, name, registered_at)`` rows; counts as in ``SQLiteDatabase.import_tags``."""
+        raise NotImplementedError
+
+    def export_tags(self, batch_size=1000):
+        """Yield ``(tag_id, name, registered_at)`` rows by id."""
+        raise NotImplementedError
+
+    # ── History ──────────────────────────────────────────────────────
+    def add_history_entry(self, tag_id, name, timestamp=None, display_date=None, display_time=None, tap=None,
+                          ml=None):
+        self.add_history_entries([history_row(tag_id, name, timestamp, display_date, display_time, tap, ml)])
+
+    def add_history_entries(self, rows, spill=None):
+        """Insert ``(tag_id, name, ts[, tap[, ml]])`` rows and record ``spill`` with them, atomically."""
+        raise NotImplementedError
+
+    def history_spill_state(self):
+        """``(generation, position)`` last recorded by ``add_history_entries``, or ``(None, 0)``."""
+        raise NotImplementedError
+
+    def history_after(self, after_id, limit):
+        """``(id, tag_id, ts, name, tap, ml)`` rows with ``id > after_id``, oldest first."""
+        raise NotImplementedError
+
+    def get_history_page(self, limit=50, before_id=None, tag_id=None, name=None, since=None, until=None,
+                         tap=None):
+        """Newest-first page of history entries with ``id < before_id``."""
+        raise NotImplementedError
+
+    def get_history_entries(self):
+        return list(self.iter_history(archived=False))
+
+    def iter_history(self, page_size=500, archived=True, **filters):
+        """Yield history entries newest first, one page in memory at a time."""
+        before_id = filters.pop('before_id', None)
+        while True:
+            page = self.get_history_page(page_size, before_id=before_id, **filters)
+            yield from page
+            if len(page) < page_size:
+                break
+            before_id = page[-1]['id']
+
+
+# ── Import helpers shared by the engines ────────────────────────────────
+def now_text():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def select_in(cursor, select, ids, adapt=None):
+    """Rows of ``select`` (ending in ``IN ({marks})``) for ``ids``, at most ``MAX_IN_VARIABLES`` per statement."""
+    ids = list(ids)
+    rows = []
+    for start in range(0, len(ids), MAX_IN_VARIABLES):
+        batch = ids[start:start + MAX_IN_VARIABLES]
+        sql = select.format(marks=",".join("?" * len(batch)))
+        cursor.execute(adapt(sql) if adapt else sql, batch)
+        rows += cursor.fetchall()
+    return rows
+
+
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def clean_import_rows(chunk, counts):
+    """``{tag_id: [(name, registered_at), ...]}`` of the usable rows; the others count as rejected."""
+    valid = {}
+    for row in chunk:
+        tag_id, name, registered_at = (list(row or ()) + [None] * 3)[:3]
+        tag_id = str(tag_id).strip() if tag_id is not None else ""
+        name = str(name).strip() if name is not None else ""
+        if not tag_id or not name:
+            counts['rejected'] += 1
+            continue
+        valid.setdefault(tag_id, []).append((name, registered_at or None))
+    return valid
+
+
+def import_changes(valid, stored, now, counts):
+    """The upserts ``valid`` needs given the ``stored`` ``{tag_id: (name, registered_at)}``.
+
+    ``stored`` is updated as rows are planned, so a tag repeated in the
+    chunk is compared with its previous version.
+    """
+    batch = []
+    for tag_id, versions in valid.items():
+        for name, registered_at in versions:
+            current = stored.get(tag_id)
+            if current is None:
+                counts['inserted'] += 1
+                stored[tag_id] = (name, registered_at or now)
+            elif current == (name, registered_at or current[1]):
+                counts['unchanged'] += 1
+                continue
+            else:
+                counts['updated'] += 1
+                stored[tag_id] = (name, registered_at or current[1])
+            batch.append({'id': tag_id, 'name': name, 'registered_at': registered_at, 'now': now})
+    return batch
+
+
+# ── Engines ─────────────────────────────────────────────────────────────
+def open_storage(engine=None, location=None):
+    """Open ``engine`` (default ``TAP_STORAGE``) at ``location``: a file, a URL, or nothing for memory."""
+    engine = engine or config.STORAGE
+    if engine == "sqlite":
+        from .database import SQLiteDatabase
+        return SQLiteDatabase(location or config.DB_PATH)
+    if engine == "memory":
+        from .memory import MemoryStorage
+        return MemoryStorage()
+    if engine == "remote":
+        from .remote import RemoteStorage
+        return RemoteStorage(location or config.DB_URL)
+    raise ValueError(f"storage engine must be one of {ENGINES}, got {engine!r}")
+
+
+def copy(source, target, batch_size=5000, progress=None):
+    """Copy every tag and history entry of ``source`` into ``target``; returns ``(tags, rows)``.
+
+    History keeps its order but not its ids. ``progress`` is called with
+    the number of history rows copied so far.
+    """
+    tags = target.import_tags(source.export_tags(), chunk_size=batch_size)
+    copied, after = 0, 0
+    while True:
+        rows = source.history_after(after, batch_size)
+        if not rows:
+            break
+        target.add_history_entries([(tag_id, name, ts, tap, ml) for _, tag_id, ts, name, tap, ml in rows])
+        copied += len(rows)
+        after = rows[-1][0]
+        if progress is not None:
+            progress(copied)
+    return tags['inserted'] + tags['updated'], copied
@@ -0,0 +1,316 @@
+"""Field profiling (``tap --profile``).
+
+For the tap that "feels slow": run it with ``--profile``, reproduce the
+problem, quit, and copy the report bundle off the Pi. While it runs:
+
+* ``kill -USR1 <pid>`` starts a cProfile session and the next one stops
+  it, writing ``profile-N.txt`` (and ``.pstats`` for ``snakeviz`` or
+  ``python -m pstats``). A session follows the main thread: the menus,
+  and ``tap serve``'s engines and their database calls. The interactive
+  app runs its engine on a thread of its own, wrapped with
+  :meth:`Profiler.thread`: that thread is profiled from start to end and
+  merged into the session running when it finishes (or into a last one
+  written at exit). Where there is no SIGUSR1 (Windows) one session
+  covers the whole run.
+* tracemalloc records allocations; every stopped session and the end of
+  the run write the top allocators and what grew since startup
+  (``memory-N.txt``).
+* every SQLite connection opened by the pool times its statements, and
+  its trace callback counts what SQLite actually ran (including
+  ``executescript`` and triggers), grouped by statement with the values
+  taken out (``sql.txt``).
+
+The bundle is ``TAP_PROFILE_DIR/<timestamp>/`` plus a ``.tar.gz`` of it.
+Without ``--profile`` this module is never imported and the pool opens
+plain ``sqlite3.Connection`` objects, so profiling costs nothing.
+"""
+
+import collections
+import functools
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import signal
+import sqlite3
+import sys
+import threading
+import time
+
+from . import config
+from .model import pool
+
+logger = logging.getLogger(__name__)
+
+TOP_FUNCTIONS = 60
+TOP_ALLOCATORS = 25
+TOP_STATEMENTS = 50
+
+_LITERAL = re.compile(r"""'(?:[^']|'')*'|[xX]'[0-9a-fA-F]*'|(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b|[:@$]\w+""")
+_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """``sql`` with literals and parameters as ``?`` and whitespace collapsed.
+
+    The trace callback sees statements with their values bound in; this
+    makes them match the text they were executed with.
+    """
+    return _LIST.sub("?, ...", _LITERAL.sub("?", " ".join(sql.split())))
+
+
+class SQLStats:
+    """Per-statement calls, time and traced runs, shared by every profiled connection."""
+
+    def __init__(self):
+        self.timings = {}  # fingerprint -> [calls, total, max]
+        self.traced = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, sql, elapsed):
+        key = fingerprint(sql)
+        with self._lock:
+            entry = self.timings.get(key)
+            if entry is None:
+                self.timings[key] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+
+    def trace(self, sql):
+        key = fingerprint(sql)
+        with self._lock:
+            self.traced[key] += 1
+
+    def report(self, top=TOP_STATEMENTS):
+        with self._lock:
+            timings = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)
+            traced = collections.Counter(self.traced)
+        lines = [f"{'TOTAL ms':>10} {'CALLS':>8} {'MEAN ms':>9} {'MAX ms':>9} {'RUNS':>8}  STATEMENT"]
+        for sql, (calls, total, longest) in timings[:top]:
+            lines.append(f"{total * 1000:10.1f} {calls:8d} {total * 1000 / calls:9.3f} "
+                         f"{longest * 1000:9.3f} {traced.pop(sql, 0):8d}  {sql}")
+        untimed = [(sql, runs) for sql, runs in traced.most_common() if sql not in self.timings]
+        if untimed:
+            lines += ["", "Run by SQLite without a timed call (executescript, triggers, pragmas):",
+                      f"{'RUNS':>8}  STATEMENT"]
+            lines += [f"{runs:8d}  {sql}" for sql, runs in untimed[:top]]
+        return "\n".join(lines) + "\n"
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Times ``execute`` and the fetches that step its statement."""
+
+    stats = None
+    _sql = None
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._sql is not None:
+                self.stats.record(self._sql, time.perf_counter() - started)
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """``pool.connection_factory`` while profiling: profiled cursors and a trace callback."""
+
+    stats = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(self.stats.trace)
+
+    def cursor(self, factory=None):
+        cursor = super().cursor(factory or ProfiledCursor)
+        cursor.stats = self.stats
+        return cursor
+
+    # sqlite3.Connection.execute does not go through cursor().
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class Profiler:
+    """One ``--profile`` run: its report bundle, cProfile sessions, tracemalloc and SQL timing."""
+
+    def __init__(self, directory=None):
+        self.stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(directory or config.PROFILE_DIR, self.stamp)
+        self.sql = SQLStats()
+        self.session = None
+        self.sessions = 0
+        self._threads = []  # finished thread profiles not written yet
+        self.started = None
+        self._baseline = None
+        self._previous_factory = None
+        self._previous_handler = None
+        # Reentrant: the SIGUSR1 handler runs on the main thread, which may hold it.
+        self._lock = threading.RLock()
+
+    def start(self):
+        import tracemalloc
+
+        os.makedirs(self.path, exist_ok=True)
+        self.started = time.time()
+        tracemalloc.start()
+        self._baseline = tracemalloc.take_snapshot()
+        factory = type("ProfiledConnection", (ProfiledConnection,), {'stats': self.sql})
+        self._previous_factory, pool.connection_factory = pool.connection_factory, factory
+        if self._install_signal():
+            logger.info("profiling into %s: 'kill -USR1 %d' starts and stops a cProfile session",
+                        self.path, os.getpid())
+        else:
+            logger.info("profiling into %s until exit", self.path)
+            self.start_session()
+        return self
+
+    def _install_signal(self):
+        if not hasattr(signal, "SIGUSR1") or threading.current_thread() is not threading.main_thread():
+            return False
+        self._previous_handler = signal.signal(signal.SIGUSR1, self.toggle)
+        return True
+
+    # ── cProfile sessions ────────────────────────────────────────────
+    def toggle(self, signum=None, frame=None):
+        if self.session is None:
+            self.start_session()
+        else:
+            self.stop_session()
+
+    def start_session(self):
+        import cProfile
+
+        with self._lock:
+            if self.session is not None:
+                return
+            self.sessions += 1
+            self.session = cProfile.Profile()
+            self.session.enable()
+        logger.info("profile session %d started", self.sessions)
+
+    def stop_session(self):
+        with self._lock:
+            session, self.session = self.session, None
+            if session is None:
+                return
+            threads, self._threads = self._threads, []
+        session.disable()
+        self._write_profile([session] + threads, self.sessions)
+        self._write_memory(f"memory-{self.sessions}.txt")
+        logger.info("profile session %d written to %s", self.sessions, self.path)
+
+    def thread(self, target):
+        """``target`` profiled on the thread that runs it (cProfile only sees its own thread)."""
+        import cProfile
+
+        @functools.wraps(target)
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._threads.append(profile)
+        return run
+
+    def _write_profile(self, profiles, number):
+        import pstats
+
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(os.path.join(self.path, f"profile-{number}.pstats"))
+        with open(os.path.join(self.path, f"profile-{number}.txt"), "w", encoding="utf-8") as f:
+            stats.stream = f
+            stats.strip_dirs()
+            f.write("By cumulative time (the call paths that take long):\n")
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            f.write("By own time (the functions that do the work):\n")
+            stats.sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+
+    # ── Memory ───────────────────────────────────────────────────────
+    def _write_memory(self, name):
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            return
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, __file__),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                  tracemalloc.Filter(False, "<unknown>")]
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced now {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB", "",
+                 "Top allocators:"]
+        lines += [f"  {stat}" for stat in snapshot.statistics("lineno")[:TOP_ALLOCATORS]]
+        lines += ["", "Growth since startup:"]
+        grown = [stat for stat in snapshot.compare_to(self._baseline.filter_traces(ignore), "lineno")
+                 if stat.size_diff > 0]
+        lines += [f"  {stat}" for stat in grown[:TOP_ALLOCATORS]]
+        with open(os.path.join(self.path, name), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    # ── Report ───────────────────────────────────────────────────────
+    def close(self):
+        """Stop everything, write the bundle and return the path of its archive."""
+        import tracemalloc
+
+        self.stop_session()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if threads:
+            # Threads that finished after the last session.
+            self.sessions += 1
+            self._write_profile(threads, self.sessions)
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGUSR1, self._previous_handler)
+            self._previous_handler = None
+        if self._previous_factory is not None:
+            pool.connection_factory, self._previous_factory = self._previous_factory, None
+        self._write_memory("memory.txt")
+        tracemalloc.stop()
+        with open(os.path.join(self.path, "sql.txt"), "w", encoding="utf-8") as f:
+            f.write(self.sql.report())
+        meta = {
+            'started': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            'seconds': round(time.time() - self.started, 1),
+            'sessions': self.sessions,
+            'argv': sys.argv,
+            'pid': os.getpid(),
+            'python': sys.version,
+            'platform': platform.platform(),
+            'storage': config.STORAGE,
+        }
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return shutil.make_archive(self.path, "gztar", root_dir=os.path.dirname(self.path) or ".",
+                                   base_dir=self.stamp)
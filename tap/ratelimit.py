@@ -0,0 +1,203 @@
+"""Per-tag rate limit and daily dose quota, kept in memory.
+
+Every tag gets a token bucket holding up to ``per_minute`` validations
+that refills continuously, plus a count of doses granted today. Checking
+a read takes a few dict lookups and some arithmetic; nothing touches
+SQLite on the pour path. The state is written to ``rate_limits`` every
+``TAP_LIMIT_SNAPSHOT_SECONDS`` and on shutdown, and restored on startup,
+so a restart does not hand everyone a full bucket and a fresh quota.
+
+One limiter is shared by every tap of a process, so changing taps does
+not reset a member's limits.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+RATE = "rate"
+QUOTA = "quota"
+
+SNAPSHOT_TABLE = '''
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        tag_id TEXT PRIMARY KEY,
+        tokens REAL,
+        updated REAL,
+        day TEXT,
+        doses INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+'''
+
+
+def _today():
+    return time.strftime("%Y-%m-%d")
+
+
+class RateLimiter:
+    """``per_minute`` validations and ``daily_quota`` doses per tag (0 disables either)."""
+
+    def __init__(self, per_minute=None, daily_quota=None, clock=time.time, today=_today):
+        self.per_minute = config.MAX_VALIDATIONS_PER_MINUTE if per_minute is None else per_minute
+        self.daily_quota = config.DAILY_QUOTA if daily_quota is None else daily_quota
+        self.rate = self.per_minute / 60.0
+        self.clock = clock
+        self.today = today
+        self._buckets = {}  # tag_id -> (tokens, updated)
+        self._doses = {}  # tag_id -> doses granted on ``_day``
+        self._day = today()
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+        self._snapshots = None
+
+    @property
+    def enabled(self):
+        return bool(self.per_minute or self.daily_quota)
+
+    # ── Pour path ────────────────────────────────────────────────────
+    def acquire(self, tag_id):
+        """Spend a validation and a dose; returns ``None``, :data:`RATE` or :data:`QUOTA`."""
+        now = self.clock()
+        with self._lock:
+            if self.per_minute:
+                tokens = self._tokens(tag_id, now)
+                if tokens < 1.0:
+                    self._buckets[tag_id] = (tokens, now)
+                    return RATE
+                self._buckets[tag_id] = (tokens - 1.0, now)
+            if self.daily_quota:
+                self._roll_day()
+                used = self._doses.get(tag_id, 0)
+                if used >= self.daily_quota:
+                    return QUOTA
+                self._doses[tag_id] = used + 1
+            if now >= self._next_prune:
+                self._prune(now)
+        return None
+
+    def refund(self, tag_id):
+        """Give back the dose of an acquired read that did not pour."""
+        with self._lock:
+            used = self._doses.get(tag_id, 0)
+            if used > 1:
+                self._doses[tag_id] = used - 1
+            else:
+                self._doses.pop(tag_id, None)
+
+    def doses_today(self, tag_id):
+        with self._lock:
+            self._roll_day()
+            return self._doses.get(tag_id, 0)
+
+    def _tokens(self, tag_id, now):
+        state = self._buckets.get(tag_id)
+        if state is None:
+            return float(self.per_minute)
+        tokens, updated = state
+        return min(float(self.per_minute), tokens + max(now - updated, 0.0) * self.rate)
+
+    def _roll_day(self):
+        day = self.today()
+        if day != self._day:
+            self._day = day
+            self._doses.clear()
+
+    def _prune(self, now):
+        # A bucket that has refilled is the same as no bucket.
+        self._next_prune = now + 60.0
+        self._buckets = {tag_id: state for tag_id, state in self._buckets.items()
+                         if self._tokens(tag_id, now) < self.per_minute}
+
+    # ── Snapshots ────────────────────────────────────────────────────
+    def save(self, db):
+        now = self.clock()
+        with self._lock:
+            self._roll_day()
+            tags = set(self._buckets) | set(self._doses)
+            rows = []
+            for tag_id in tags:
+                bucket = self._buckets.get(tag_id)
+                rows.append((tag_id, bucket and self._tokens(tag_id, now), bucket and now,
+                             self._day, self._doses.get(tag_id, 0)))
+        with db.lock:
+            try:
+                db.conn.execute(SNAPSHOT_TABLE)
+                db.conn.execute("DELETE FROM rate_limits")
+                db.conn.executemany("INSERT INTO rate_limits VALUES (?, ?, ?, ?, ?)", rows)
+                db.conn.commit()
+            except Exception:
+                db.conn.rollback()
+                raise
+        return len(rows)
+
+    def load(self, db):
+        with db.lock:
+            db.conn.execute(SNAPSHOT_TABLE)
+            db.conn.commit()
+            rows = db.conn.execute("SELECT tag_id, tokens, updated, day, doses FROM rate_limits").fetchall()
+        with self._lock:
+            self._roll_day()
+            for tag_id, tokens, updated, day, doses in rows:
+                if tokens is not None:
+                    self._buckets[tag_id] = (tokens, updated)
+                if day == self._day and doses:
+                    self._doses[tag_id] = doses
+        return len(rows)
+
+    def start_snapshots(self, db, interval=None):
+        """Restore from ``db`` and save back to it periodically until :meth:`close`."""
+        try:
+            self.load(db)
+        except sqlite3.Error as e:
+            # Database not open yet (degraded start): begin with fresh limits.
+            logger.warning("rate limits: cannot restore snapshot (%s)", e)
+        self._snapshots = _Snapshots(self, db, config.LIMIT_SNAPSHOT_SECONDS if interval is None else interval)
+        self._snapshots.start()
+        return self
+
+    def close(self):
+        if self._snapshots is not None:
+            self._snapshots.stop()
+            self._snapshots = None
+
+
+class _Snapshots(threading.Thread):
+    def __init__(self, limiter, db, interval):
+        super().__init__(name="rate-limit-snapshots", daemon=True)
+        self.limiter = limiter
+        self.db = db
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._save()
+
+    def _save(self):
+        try:
+            self.limiter.save(self.db)
+        except Exception as e:
+            logger.warning("rate limits: snapshot failed (%s)", e)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self._save()
+
+
+def start_limiter(db):
+    """The configured limiter, restored from ``db`` and snapshotting; ``None`` if disabled.
+
+    With ``db=None`` (storage engines other than SQLite) limits are kept in memory only.
+    """
+    limiter = RateLimiter()
+    if not limiter.enabled:
+        return None
+    if db is None:
+        return limiter
+    return limiter.start_snapshots(db)
@@ -0,0 +1,186 @@
+"""Background serial RFID reader.
+
+The reader thread pulls whatever is buffered on the port in one ``read``,
+splits it into tag frames and drops repeated reads of the same card inside
+the debounce window before handing tags to a sink (usually
+``ValidationEngine.submit``).
+"""
+
+import logging
+import threading
+import time
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+STX = 0x02
+ETX = 0x03
+# Partial frames longer than this are line noise, not tags.
+MAX_FRAME = 256
+
+
+# ── Framing ─────────────────────────────────────────────────────────────
+class LineFraming:
+    """Frames terminated by ``\\n`` (``\\r`` and padding are stripped)."""
+
+    def __init__(self, terminator=b"\n"):
+        self.terminator = terminator
+        self.buffer = b""
+
+    def feed(self, data):
+        self.buffer += data
+        if self.terminator not in self.buffer:
+            if len(self.buffer) > MAX_FRAME:
+                self.buffer = b""
+            return []
+        *frames, self.buffer = self.buffer.split(self.terminator)
+        return [tag for tag in (_decode(f) for f in frames) if tag]
+
+
+class StxEtxFraming:
+    """Frames wrapped in STX … ETX; bytes outside a frame are discarded."""
+
+    def __init__(self, start=STX, end=ETX):
+        self.start = bytes([start])
+        self.end = bytes([end])
+        self.buffer = b""
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while True:
+            begin = self.buffer.find(self.start)
+            if begin < 0:
+                self.buffer = b""
+                break
+            finish = self.buffer.find(self.end, begin + 1)
+            if finish < 0:
+                self.buffer = self.buffer[begin:] if len(self.buffer) - begin <= MAX_FRAME else b""
+                break
+            # A second STX before ETX means the first frame was truncated.
+            restart = self.buffer.rfind(self.start, begin, finish)
+            tag = _decode(self.buffer[restart + 1:finish])
+            if tag:
+                frames.append(tag)
+            self.buffer = self.buffer[finish + 1:]
+        return frames
+
+
+class FixedLengthFraming:
+    """Frames of exactly ``length`` bytes with no delimiter."""
+
+    def __init__(self, length):
+        if length <= 0:
+            raise ValueError("frame length must be positive")
+        self.length = length
+        self.buffer = b""
+
+    def feed(self, data):
+        self.buffer += data
+        usable = len(self.buffer) - len(self.buffer) % self.length
+        chunk, self.buffer = self.buffer[:usable], self.buffer[usable:]
+        frames = (_decode(chunk[i:i + self.length]) for i in range(0, usable, self.length))
+        return [tag for tag in frames if tag]
+
+
+def _decode(frame):
+    return frame.decode("ascii", errors="ignore").strip()
+
+
+def make_framing(kind=None, length=None):
+    kind = kind or config.READER_FRAMING
+    if kind == "line":
+        return LineFraming()
+    if kind == "stxetx":
+        return StxEtxFraming()
+    if kind == "fixed":
+        return FixedLengthFraming(length or config.READER_FRAME_LENGTH)
+    raise ValueError(f"unknown framing {kind!r} (line, stxetx, fixed)")
+
+
+# ── Debounce ────────────────────────────────────────────────────────────
+class Debouncer:
+    """Drop reads of a card seen less than ``window`` seconds ago.
+
+    Every read refreshes the timestamp, so a card resting on the reader
+    stays suppressed until it is taken away for a full window.
+    """
+
+    def __init__(self, window=None, clock=time.monotonic):
+        self.window = config.DEBOUNCE_SECONDS if window is None else window
+        self.clock = clock
+        self.last_seen = {}
+        self.dropped = 0
+        self._next_prune = 0.0
+
+    def accept(self, tag_id):
+        now = self.clock()
+        last = self.last_seen.get(tag_id)
+        self.last_seen[tag_id] = now
+        if now >= self._next_prune:
+            self._prune(now)
+        if last is not None and now - last < self.window:
+            self.dropped += 1
+            return False
+        return True
+
+    def _prune(self, now):
+        self._next_prune = now + max(self.window, 1.0) * 10
+        cutoff = now - self.window
+        self.last_seen = {t: seen for t, seen in self.last_seen.items() if seen >= cutoff}
+
+
+# ── Decoding ────────────────────────────────────────────────────────────
+class TagDecoder:
+    """Framing plus debounce: turns raw bytes into tag reads for ``sink``.
+
+    Used on its own when the bytes arrive through something else, e.g. the
+    valve link when tags and valve replies share one port.
+    """
+
+    def __init__(self, sink, framing=None, debouncer=None):
+        self.sink = sink
+        self.framing = framing or make_framing()
+        self.debouncer = debouncer or Debouncer()
+        self.frames = 0
+
+    def handle(self, data):
+        for tag_id in self.framing.feed(data):
+            self.frames += 1
+            if self.debouncer.accept(tag_id):
+                self.sink(tag_id)
+
+
+# ── Reader thread ───────────────────────────────────────────────────────
+class SerialTagReader(threading.Thread, TagDecoder):
+    def __init__(self, conn, sink, framing=None, debouncer=None):
+        threading.Thread.__init__(self, name="rfid-reader", daemon=True)
+        TagDecoder.__init__(self, sink, framing, debouncer)
+        self.conn = conn
+        self._stop_event = threading.Event()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                data = self.read_available()
+            except Exception as e:
+                logger.warning("RFID reader: read error (%s)", e)
+                self._stop_event.wait(1.0)
+                continue
+            if data:
+                self.handle(data)
+
+    def read_available(self):
+        # Block (up to the port timeout) for the first byte, then take the
+        # whole buffer in one call instead of one byte at a time.
+        data = self.conn.read(max(1, self.conn.in_waiting))
+        waiting = self.conn.in_waiting
+        if waiting:
+            data += self.conn.read(waiting)
+        return data
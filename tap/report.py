@@ -0,0 +1,107 @@
+"""Consumption reports built on the rollup tables.
+
+Aggregation is done with NumPy over the pre-aggregated rollups, so even
+years of history come back in milliseconds. NumPy (and matplotlib, for PNG
+output) are optional: ``pip install 'hack-n-tap[report]'``.
+"""
+
+import csv
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Relatórios precisam do numpy: pip install 'hack-n-tap[report]'") from None
+    return numpy
+
+
+def _columns(rows):
+    np = _numpy()
+    buckets = np.array([row[0] for row in rows], dtype=object)
+    tags = np.array([row[1] for row in rows], dtype=object)
+    pours = np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows))
+    return buckets, tags, pours
+
+
+def _per_tag_rollups(db, since, until):
+    # Month rollups are ~30x smaller; use them whenever the range allows.
+    if all(d is None or d.endswith("-01") for d in (since, until)):
+        return db.get_rollups("month", since and since[:7], until and until[:7])
+    return db.get_rollups("day", since, until)
+
+
+def user_totals(db, since=None, until=None):
+    """Pours per tag between two local dates, largest first."""
+    np = _numpy()
+    rows = _per_tag_rollups(db, since, until)
+    if not rows:
+        return []
+    _, tags, pours = _columns(rows)
+    ids, inverse = np.unique(tags, return_inverse=True)
+    totals = np.bincount(inverse, weights=pours).astype(np.int64)
+    order = np.argsort(-totals, kind="stable")
+    result = []
+    for i in order:
+        tag_id = ids[i]
+        data = db.validate_tag(tag_id)
+        if data is None:
+            # Removed member: fall back to the name on their last pour.
+            last = next(db.iter_history(1, tag_id=tag_id), None)
+            data = last if last and last['name'] else {'name': tag_id}
+        result.append({
+            'tag_id': tag_id,
+            'name': data['name'],
+            'pours': int(totals[i]),
+        })
+    return result
+
+
+def peak_hours(db, since=None, until=None):
+    """Pours per hour of the day (24 local-time bins)."""
+    np = _numpy()
+    rows = db.get_rollups("hour", since, until)
+    if not rows:
+        return np.zeros(24, dtype=np.int64)
+    buckets, _, pours = _columns(rows)
+    hours = np.fromiter((int(b[11:13]) for b in buckets), dtype=np.int64, count=len(buckets))
+    return np.bincount(hours, weights=pours, minlength=24).astype(np.int64)
+
+
+def daily_totals(db, since=None, until=None):
+    """``(days, pours)`` arrays with one entry per local day that had pours."""
+    np = _numpy()
+    rows = db.get_rollups("day", since, until)
+    if not rows:
+        return np.array([], dtype=object), np.array([], dtype=np.int64)
+    buckets, _, pours = _columns(rows)
+    days, inverse = np.unique(buckets, return_inverse=True)
+    return days, np.bincount(inverse, weights=pours).astype(np.int64)
+
+
+def write_csv(path, totals):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["tag_id", "name", "pours"])
+        for row in totals:
+            writer.writerow([row['tag_id'], row['name'], row['pours']])
+
+
+def write_png(path, totals, hours, top=15):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        raise RuntimeError("Gráficos precisam do matplotlib: pip install 'hack-n-tap[report]'") from None
+
+    fig, (ax_users, ax_hours) = plt.subplots(1, 2, figsize=(12, 5))
+    shown = totals[:top]
+    ax_users.barh([row['name'] for row in shown][::-1], [row['pours'] for row in shown][::-1])
+    ax_users.set_title("Doses por usuário")
+    ax_hours.bar(range(24), hours)
+    ax_hours.set_xticks(range(0, 24, 2))
+    ax_hours.set_title("Doses por hora do dia")
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
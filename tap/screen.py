@@ -0,0 +1,221 @@
+"""Buffered terminal rendering for the interactive UI.
+
+A screen is a list of lines. Drawing helpers append to the current
+frame; nothing reaches the terminal until :meth:`Screen.flush`, which
+compares the frame with what the terminal shows and rewrites only the
+lines that changed (cursor-addressed, each cleared to its end), all in
+one ``write``. Starting a new frame with :meth:`Screen.clear` does not
+blank the terminal, so turning a page of a list repaints only the rows
+that differ, and a countdown ticking ten times a second rewrites one
+line per tick.
+
+Prompts are part of the frame (:meth:`Screen.ask`): the cursor waits at
+the end of the last line, and flushes made by other threads while
+``input()`` blocks save and restore the cursor around themselves,
+leaving what is being typed alone.
+
+The terminal size is cached and refreshed on ``SIGWINCH`` (or once a
+second where that signal cannot be used), and a resize makes the next
+flush repaint everything. Widths skip the ANSI regex for plain text and
+remember the styled lines already measured.
+
+Output that is not a terminal gets the changed lines in order, without
+escapes.
+"""
+
+import functools
+import os
+import re
+import shutil
+import signal
+import sys
+import threading
+import time
+
+ANSI = re.compile(r"\033\[[0-9;?]*[A-Za-z]")
+
+# Where SIGWINCH cannot be used the size is asked for again after this many seconds.
+SIZE_TTL = 1.0
+
+_size = None
+_size_at = 0.0
+_winch = None  # whether the SIGWINCH handler is installed; None until first asked
+_listeners = []
+
+
+def _on_winch(signum, frame):
+    global _size
+    _size = None
+    for listener in _listeners:
+        listener()
+
+
+def _install_winch():
+    if not hasattr(signal, "SIGWINCH") or threading.current_thread() is not threading.main_thread():
+        return False
+    try:
+        if signal.getsignal(signal.SIGWINCH) not in (signal.SIG_DFL, None):
+            return False  # someone else's handler
+        signal.signal(signal.SIGWINCH, _on_winch)
+    except (ValueError, OSError):
+        return False
+    return True
+
+
+def terminal_size():
+    """``os.terminal_size`` of the terminal (80x24 if unknown), cached until it is resized."""
+    global _size, _size_at, _winch
+    if _winch is None:
+        _winch = _install_winch()
+    if _size is None or (not _winch and time.monotonic() - _size_at > SIZE_TTL):
+        _size = shutil.get_terminal_size((80, 24))
+        _size_at = time.monotonic()
+    return _size
+
+
+def on_resize(listener):
+    """Call ``listener()`` (from the signal handler) whenever the terminal is resized."""
+    _listeners.append(listener)
+
+
+def strip_ansi(text):
+    return ANSI.sub("", text) if "\033" in text else text
+
+
+@functools.lru_cache(maxsize=4096)
+def _styled_width(text):
+    return len(ANSI.sub("", text))
+
+
+def visible_width(text):
+    """Columns ``text`` takes on screen, ignoring ANSI escapes."""
+    return _styled_width(text) if "\033" in text else len(text)
+
+
+class Screen:
+    def __init__(self, out=None, ansi=None):
+        self._out = out
+        self._ansi = ansi
+        self.lines = []
+        self._shown = []  # the terminal's rows from the top; ``None`` where unknown
+        self._rows = 0  # rows in use, including any left below the frame
+        self._asking = False
+        self._full = True
+        self.lock = threading.RLock()
+        on_resize(self.invalidate)
+
+    @property
+    def out(self):
+        # Resolved late: sys.stdout may be replaced after import.
+        return self._out or sys.stdout
+
+    @property
+    def ansi(self):
+        if self._ansi is None:
+            isatty = getattr(self.out, "isatty", None)
+            return bool(isatty and isatty()) and os.environ.get("TERM") != "dumb"
+        return self._ansi
+
+    # ── Composing ────────────────────────────────────────────────────
+    def clear(self):
+        """Start a new frame; the terminal keeps the old one until :meth:`flush`."""
+        with self.lock:
+            self.lines = []
+            if not self.ansi:
+                self._shown = []
+
+    def line(self, text=""):
+        with self.lock:
+            self.lines.append(text)
+
+    def extend(self, lines):
+        with self.lock:
+            self.lines.extend(lines)
+
+    def region(self, start, size, lines):
+        """Set the ``size`` lines from ``start`` (a live area of fixed height) to ``lines``."""
+        with self.lock:
+            self.lines[start:start + size] = (list(lines) + [""] * size)[:size]
+
+    def invalidate(self):
+        """Repaint everything on the next flush (after a resize or output from elsewhere)."""
+        self._full = True
+
+    # ── Output ───────────────────────────────────────────────────────
+    def flush(self, upto=None):
+        with self.lock:
+            lines = self.lines if upto is None else self.lines[:upto]
+            if not self.ansi:
+                self._flush_plain(lines)
+                return
+            out = []
+            too_tall = len(lines) > terminal_size().lines
+            if self._full or too_tall:
+                # Rows cannot be addressed once the terminal scrolls: start over from the top.
+                out.append("\033[H\033[2J")
+                self._shown, self._rows = [], 0
+                self._full = too_tall
+            shown = self._shown
+            for row, text in enumerate(lines):
+                if row >= len(shown) or shown[row] != text:
+                    out.append(f"\033[{row + 1};1H{text}\033[K")
+            if self._rows > len(lines):
+                out.append(f"\033[{len(lines) + 1};1H\033[J")
+            if self._asking:
+                if out:
+                    out = ["\0337"] + out + ["\0338"]
+            elif out and lines:
+                out.append(f"\033[{len(lines)};{visible_width(lines[-1]) + 1}H")
+            self._shown = list(lines)
+            self._rows = len(lines)
+            if out:
+                self.out.write("".join(out))
+                self.out.flush()
+
+    def _flush_plain(self, lines):
+        shown = self._shown
+        changed = [strip_ansi(text) + "\n" for row, text in enumerate(lines)
+                   if row >= len(shown) or shown[row] != text]
+        self._shown = list(lines)
+        if changed:
+            self.out.write("".join(changed))
+            self.out.flush()
+
+    def ask(self, text, read=input, keep=True):
+        """Show ``text`` as the frame's last line and read what is typed after it.
+
+        With ``keep`` the answer stays on that line, as the terminal shows
+        it; otherwise the line leaves the frame. Raises what ``read``
+        raises (``EOFError``, ``KeyboardInterrupt``).
+        """
+        with self.lock:
+            self.lines.append(text)
+            row = len(self.lines) - 1
+            ansi = self.ansi
+            self.flush(None if ansi else row)
+            self._asking = ansi
+        answer = None
+        try:
+            answer = read("" if ansi else strip_ansi(text))
+        finally:
+            with self.lock:
+                self._asking = False
+                typed = text + answer if answer is not None else None
+                if row < len(self.lines) and self.lines[row] == text:
+                    if keep and typed is not None:
+                        self.lines[row] = typed
+                    else:
+                        del self.lines[row]
+                if ansi:
+                    if row < len(self._shown):
+                        self._shown[row] = typed
+                    # Enter left the cursor on the next row, scrolling if it was the last one.
+                    self._rows = max(self._rows, row + 2)
+                    if row + 1 >= terminal_size().lines:
+                        self.invalidate()
+                elif row <= len(self._shown):
+                    self._shown[row:row + 1] = [typed]
+        return answer
+
+
+screen = Screen()
@@ -0,0 +1,146 @@
+"""Headless validation service (``tap serve``).
+
+Starts straight into validation with no TTY: no banner, no menu, no
+"press Enter". Tags come from the serial reader(s), events go to the log,
+and SIGTERM/SIGINT stop every tap cleanly (valves closed, history
+flushed). Storage is ``TAP_STORAGE`` (see :mod:`tap.model.storage`);
+with SQLite, tags are validated from the memory-mapped tag snapshot until
+it is open (see :mod:`tap.model.snapshot`). Metrics are exported as
+configured by ``TAP_METRICS_*`` and the central server is synced in the
+background when ``TAP_SYNC_URL`` is set; old history is archived when
+``TAP_AUDIT_RETENTION_DAYS`` is, and the live dashboard runs when
+``TAP_DASHBOARD_PORT`` is (sync and archival need SQLite). Only what
+validation needs is imported; the terminal UI and the reporting stack
+never load.
+
+Startup time is logged once the taps are ready, measured from process
+start where the OS exposes it and from ``tap`` import otherwise.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from . import IMPORTED_AT, config
+
+logger = logging.getLogger(__name__)
+
+
+def process_age():
+    """Seconds since this process started, or ``None`` if unknown (Linux only)."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 (after the parenthesised command name) is the start time.
+            started = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(uptime - started / os.sysconf("SC_CLK_TCK"), 0.0)
+
+
+def log_event(event, tap=None, **data):
+    where = f"[{tap}] " if tap else ""
+    if event == 'open':
+        logger.info("%sopen for %s (%s), waited %.0f ms", where, data['name'], data['tag_id'],
+                    data['wait'] * 1000)
+    elif event == 'closed' and data.get('ml') is not None:
+        logger.info("%sclosed after %.1f s, %.0f ml", where, data['duration'], data['ml'])
+    elif event == 'closed':
+        logger.info("%sclosed after %.1f s", where, data['duration'])
+    elif event in ('denied', 'busy'):
+        logger.info("%s%s: %s", where, event, data['tag_id'])
+    elif event in ('queued', 'extended'):
+        logger.info("%s%s: %s", where, event, data['name'])
+    elif event == 'limited':
+        logger.info("%slimited (%s): %s", where, data['reason'], data['tag_id'])
+    elif event == 'fault':
+        logger.warning("%svalve did not confirm open for %s (%s)", where, data['name'], data['tag_id'])
+    elif event == 'stopped':
+        logger.info("%sstopped: %s", where, data['stats'])
+
+
+def build_taps():
+    """``[(name, port), ...]`` from ``TAP_TAPS``, or the detected port unnamed."""
+    from .taps import detect_serial_port, parse_taps
+
+    taps = parse_taps(config.TAPS)
+    return taps or [(None, detect_serial_port())]
+
+
+async def _serve(daemon, started):
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, daemon.stop)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: KeyboardInterrupt still ends asyncio.run
+    runner = asyncio.ensure_future(daemon.run())
+    await asyncio.sleep(0)
+    ready = time.perf_counter()
+    age = process_age()
+    logger.info("ready: %d tap(s) in %.0f ms since import%s", len(daemon.taps),
+                (ready - started) * 1000,
+                f", {age * 1000:.0f} ms since process start" if age is not None else "")
+    await runner
+
+
+def serve(db_file=None, storage=None):
+    from .dashboard import start_dashboard
+    from .metrics import Exporters
+    from .model.archive import start_archiver
+    from .model.history import HistoryWriter
+    from .model.snapshot import FailoverDatabase
+    from .model.storage import open_storage
+    from .ratelimit import start_limiter
+    from .taps import TapDaemon
+
+    started = IMPORTED_AT
+    storage = storage or config.STORAGE
+    sqlite = storage == "sqlite"
+    if sqlite:
+        # Validation starts from the tag snapshot if SQLite is slow or failing.
+        db = FailoverDatabase(db_file or config.DB_PATH).open()
+    else:
+        db = open_storage(storage, db_file)
+    history = HistoryWriter(db)
+    history.start()
+    exporters = Exporters().start()
+    # Limit snapshots, archival and sync are built on SQLite.
+    limiter = start_limiter(db if sqlite else None)
+    archiver = start_archiver(db) if sqlite else None
+    feed, dashboard = start_dashboard(db)
+    on_event = log_event
+    if feed is not None:
+        def on_event(event, **data):
+            log_event(event, **data)
+            feed.publish(event, **data)
+    syncer = None
+    if config.SYNC_URL and sqlite:
+        from .sync import Syncer
+        syncer = Syncer(db)
+        syncer.start()
+    try:
+        taps = build_taps()
+        single = len(taps) == 1 and taps[0][0] is None
+        daemon = TapDaemon(db, history, taps, on_event=on_event, limiter=limiter,
+                           reader_port=(config.READER_PORT or None) if single else None)
+        daemon.start()
+        asyncio.run(_serve(daemon, started))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if syncer is not None:
+            syncer.stop(timeout=5)
+        if dashboard is not None:
+            dashboard.stop()
+        if archiver is not None:
+            archiver.stop(timeout=5)
+        if limiter is not None:
+            limiter.close()
+        exporters.stop()
+        history.close()
+        db.close()
+    return 0
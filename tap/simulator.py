@@ -0,0 +1,207 @@
+"""Valve/RFID device simulator on a pseudo-terminal (Linux, macOS).
+
+:class:`ValveSimulator` plays the Arduino: it answers the ``framed``
+protocol of :mod:`tap.valve` (or obeys raw ``'1'``/``'0'`` bytes), can
+forward RFID tags to the host and can misbehave on demand: drop or
+corrupt replies, go silent, or restart. With a ``flow_rate`` (ml/s) it
+also plays the flow meter, reporting pulses as ``~<count>`` lines (see
+:mod:`tap.flow`) while the valve is open. Point the host at
+``simulator.port`` like at any serial device.
+
+``python -m tap.simulator`` runs one interactively: it prints the port,
+sends each line typed on stdin as a tag and shows the valve state.
+"""
+
+import os
+import select
+import threading
+import time
+
+from .flow import encode_pulses
+from .valve import decode, encode
+
+
+class ValveSimulator(threading.Thread):
+    def __init__(self, protocol="framed", watchdog=None, on_change=None, flow_rate=None,
+                 pulses_per_litre=450, flow_interval=0.05):
+        super().__init__(name="valve-simulator", daemon=True)
+        import tty
+
+        self.protocol = protocol
+        # Firmware safety net: close if the host is silent this long.
+        self.watchdog = watchdog
+        self.on_change = on_change
+        # Flow meter: ml/s while open, reported every ``flow_interval`` seconds.
+        self.flow_rate = flow_rate
+        self.pulses_per_litre = pulses_per_litre
+        self.flow_interval = flow_interval
+        self.pulses_sent = 0
+        self._pulse_debt = 0.0
+        self._flow_at = None
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.valve = False
+        self.commands = []  # (command, monotonic time) actually applied
+        self.frames = 0
+        self.drop_replies = 0
+        self.corrupt_replies = 0
+        self.muted = False
+        self._buffer = b""
+        self._last_frame = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    # ── Fault injection and stimuli ──────────────────────────────────
+    def inject_tag(self, tag_id):
+        self._send(tag_id.encode("ascii") + b"\n")
+
+    def inject_pulses(self, count):
+        self.pulses_sent += count
+        self._send(encode_pulses(count))
+
+    def restart(self):
+        """Simulate a reset: valve closed, restart notice sent."""
+        self._set_valve(False)
+        if self.protocol == "framed":
+            self._send(encode(b"<", 0, "R"))
+
+    # ── Device loop ──────────────────────────────────────────────────
+    def run(self):
+        while not self._stop_event.is_set():
+            wait = 0.05 if self.flow_rate is None else min(0.05, self.flow_interval)
+            ready, _, _ = select.select([self.master], [], [], wait)
+            if ready:
+                try:
+                    data = os.read(self.master, 1024)
+                except OSError:
+                    data = b""
+                if data and not self.muted:
+                    self._handle(data)
+            if (self.watchdog is not None and self.valve
+                    and time.monotonic() - self._last_frame > self.watchdog):
+                self._set_valve(False)
+            if self.flow_rate is not None:
+                self._flow()
+
+    def _flow(self):
+        now = time.monotonic()
+        if not self.valve:
+            self._flow_at = None
+            return
+        if self._flow_at is None:
+            self._flow_at = now
+            return
+        if now - self._flow_at < self.flow_interval:
+            return
+        self._pulse_debt += (now - self._flow_at) * self.flow_rate * self.pulses_per_litre / 1000
+        self._flow_at = now
+        count = int(self._pulse_debt)
+        if count:
+            self._pulse_debt -= count
+            self.inject_pulses(count)
+
+    def _handle(self, data):
+        if self.protocol == "raw":
+            for byte in data.decode("ascii", errors="ignore"):
+                if byte in "01":
+                    self._last_frame = time.monotonic()
+                    self._apply(byte)
+            return
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            start = line.find(b">")
+            if start < 0:
+                continue
+            frame = decode(line[start:], b">")
+            if frame is None:
+                self._reply(self._seq_of(line[start:]), "N")
+                continue
+            seq, code = frame
+            self.frames += 1
+            self._last_frame = time.monotonic()
+            if code in ("0", "1"):
+                self._apply(code)
+            self._reply(seq, "K")
+
+    @staticmethod
+    def _seq_of(line):
+        try:
+            return int(line[1:3], 16)
+        except ValueError:
+            return 0
+
+    def _apply(self, code):
+        self.commands.append((code, time.monotonic()))
+        self._set_valve(code == "1")
+
+    def _set_valve(self, state):
+        changed = state != self.valve
+        self.valve = state
+        if changed and self.on_change is not None:
+            self.on_change(state)
+
+    def _reply(self, seq, code):
+        if self.drop_replies:
+            self.drop_replies -= 1
+            return
+        frame = encode(b"<", seq, code)
+        if self.corrupt_replies:
+            self.corrupt_replies -= 1
+            frame = frame[:-3] + b"ZZ\n"
+        self._send(frame)
+
+    def _send(self, data):
+        with self._lock:
+            try:
+                os.write(self.master, data)
+            except OSError:
+                pass
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(prog="python -m tap.simulator", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--protocol", choices=("framed", "raw"), default="framed")
+    parser.add_argument("--watchdog", type=float, help="close the valve after this many silent seconds")
+    parser.add_argument("--flow", type=float, metavar="ML_S", help="report flow-meter pulses at this rate while open")
+    parser.add_argument("--pulses-per-litre", type=float, default=450)
+    args = parser.parse_args()
+
+    sim = ValveSimulator(args.protocol, args.watchdog,
+                         on_change=lambda state: print(f"  valve {'OPEN' if state else 'closed'}", flush=True),
+                         flow_rate=args.flow, pulses_per_litre=args.pulses_per_litre)
+    sim.start()
+    print(f"Simulated valve on {sim.port} ({args.protocol}).")
+    flow = f" TAP_FLOW_PULSES_PER_LITRE={args.pulses_per_litre:g}" if args.flow else ""
+    print(f"  TAP_TAPS=sim={sim.port} TAP_VALVE_PROTOCOL={args.protocol}{flow} tap serve")
+    print("Type a tag id and Enter to read it; 'reset' restarts the device; Ctrl-D quits.")
+    try:
+        for line in sys.stdin:
+            line = line.strip()
+            if line == "reset":
+                sim.restart()
+            elif line:
+                sim.inject_tag(line)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
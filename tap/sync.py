@@ -0,0 +1,206 @@
+"""Offline-first sync with a central server.
+
+Validation only ever reads the local database; a :class:`Syncer` thread
+keeps it in step with the central server in the background:
+
+* local tag edits (recorded by the ``tag_changes`` triggers) are pushed,
+  then tag changes made anywhere are pulled from the server's change
+  feed, starting after the last sequence number seen. Only the delta
+  travels, and the authorization cache reloads only if something changed;
+* new ``history`` rows are pushed in gzip-compressed batches keyed by
+  ``(node, local id)``, so a batch resent after a timeout is not counted
+  twice.
+
+The server speaks JSON over HTTP (``GET /tags?since=N``, ``POST /tags``,
+``POST /history``); :mod:`tap.central` is a stand-in implementation.
+While the server is unreachable the taps keep pouring and the backlog
+is sent once it is back; so is the local database, which is not
+available yet while the taps start degraded (see
+:mod:`tap.model.snapshot`). Conflicting tag edits are resolved by the
+server: the latest change wins.
+"""
+
+import gzip
+import json
+import logging
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from . import config
+from .model import changelog
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between attempts while the server is unreachable.
+MAX_BACKOFF = 300.0
+
+
+class SyncError(Exception):
+    pass
+
+
+def encode_body(payload):
+    return gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_body(data, encoding=None):
+    if encoding == "gzip":
+        data = gzip.decompress(data)
+    return json.loads(data.decode("utf-8")) if data else {}
+
+
+class SyncClient:
+    def __init__(self, url=None, token=None, timeout=None):
+        self.url = (url or config.SYNC_URL).rstrip("/")
+        self.token = config.SYNC_TOKEN if token is None else token
+        self.timeout = config.SYNC_TIMEOUT if timeout is None else timeout
+
+    def request(self, method, path, payload=None, query=None):
+        url = f"{self.url}{path}"
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+        headers = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+        data = None
+        if payload is not None:
+            data = encode_body(payload)
+            headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return decode_body(resp.read(), resp.headers.get("Content-Encoding"))
+        except urllib.error.HTTPError as e:
+            raise SyncError(f"{method} {path}: HTTP {e.code} {e.reason}") from e
+        except (OSError, ValueError) as e:
+            raise SyncError(f"{method} {path}: {e}") from e
+
+    def pull_tags(self, since, limit):
+        return self.request("GET", "/tags", query={"since": since, "limit": limit})
+
+    def push_tags(self, node, changes):
+        return self.request("POST", "/tags", {"node": node, "changes": changes})
+
+    def push_history(self, node, rows):
+        return self.request("POST", "/history", {"node": node, "rows": rows})
+
+
+class Syncer(threading.Thread):
+    def __init__(self, db, client=None, interval=None, batch_size=None):
+        super().__init__(name="sync", daemon=True)
+        self.db = db
+        self.client = client or SyncClient()
+        self.interval = config.SYNC_INTERVAL if interval is None else interval
+        self.batch_size = batch_size or config.SYNC_BATCH_SIZE
+        self.last_sync = None
+        self.last_error = None
+        self._node = None
+        self._stop_event = threading.Event()
+
+    # ── State ────────────────────────────────────────────────────────
+    def _get(self, key, default=None):
+        with self.db.pool.read() as conn:
+            return changelog.get_state(conn, key, default)
+
+    def _set(self, key, value):
+        with self.db.lock:
+            changelog.set_state(self.db.conn, key, value)
+            self.db.conn.commit()
+
+    @property
+    def node(self):
+        """This database's id on the server, created on first use."""
+        if self._node is None:
+            node = self._get("node")
+            if node is None:
+                node = uuid.uuid4().hex
+                self._set("node", node)
+            self._node = node
+        return self._node
+
+    # ── One pass ─────────────────────────────────────────────────────
+    def sync_once(self):
+        """Push local edits, pull remote ones, push history; raises :class:`SyncError`."""
+        counts = {
+            "tags_pushed": self.push_tags(),
+            "tags_pulled": self.pull_tags(),
+            "history_pushed": self.push_history(),
+        }
+        self.last_sync = time.time()
+        self.last_error = None
+        return counts
+
+    def push_tags(self):
+        pushed = 0
+        while True:
+            with self.db.pool.read() as conn:
+                pending = changelog.pending(conn, self.batch_size)
+            if not pending:
+                return pushed
+            self.client.push_tags(self.node, [list(row[1:]) for row in pending])
+            with self.db.lock:
+                changelog.forget(self.db.conn, pending[-1][0])
+                self.db.conn.commit()
+            pushed += len(pending)
+
+    def pull_tags(self):
+        since = int(self._get("tags_seq", 0))
+        changed = 0
+        while True:
+            reply = self.client.pull_tags(since, self.batch_size)
+            changes = reply.get("changes", [])
+            if changes:
+                # Rows are ``[seq, tag_id, name, registered_at, deleted, changed_at]``.
+                changed += self.db.apply_tag_changes(
+                    [(c[1], c[2], c[3], bool(c[4])) for c in changes])
+            if reply.get("seq", since) != since:
+                since = reply["seq"]
+                self._set("tags_seq", since)
+            if not reply.get("more"):
+                return changed
+
+    def push_history(self):
+        after = int(self._get("history_pushed", 0))
+        pushed = 0
+        while True:
+            rows = self.db.history_after(after, self.batch_size)
+            if not rows:
+                return pushed
+            self.client.push_history(self.node, [list(row) for row in rows])
+            after = rows[-1][0]
+            self._set("history_pushed", after)
+            pushed += len(rows)
+            if len(rows) < self.batch_size:
+                return pushed
+
+    # ── Background loop ──────────────────────────────────────────────
+    def run(self):
+        delay, failures = 0.0, 0
+        while not self._stop_event.wait(delay):
+            try:
+                counts = self.sync_once()
+            except (SyncError, sqlite3.Error) as e:
+                # Server unreachable, or the local database not open yet.
+                failures += 1
+                self.last_error = str(e)
+                delay = min(self.interval * 2 ** (failures - 1), max(MAX_BACKOFF, self.interval))
+                logger.warning("sync: %s (retrying in %.0f s)", e, delay)
+                continue
+            except Exception:
+                logger.exception("sync: pass failed")
+                delay = self.interval
+                continue
+            if any(counts.values()):
+                logger.info("sync: %s", counts)
+            delay, failures = self.interval, 0
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
@@ -0,0 +1,150 @@
+"""Multi-tap daemon: several serial valves driven from one process.
+
+``TAP_TAPS`` maps tap names to serial ports, e.g.
+``bar=/dev/ttyACM0,lab=/dev/ttyUSB0``. Every tap gets its own
+:class:`ValidationEngine` (and with it its own valve thread) plus its own
+RFID reader thread, while all taps share the database's authorization
+cache and a single :class:`HistoryWriter`. Each valve port is owned by a
+:class:`~tap.valve.ValveLink` thread that reconnects in the background, so
+a valve that hangs or drops off the bus only fails its own pours; the
+others keep pouring. With ``TAP_FLOW_PULSES_PER_LITRE`` set every tap
+also gets its own :class:`~tap.flow.FlowMeter`, fed from its valve port.
+"""
+
+import asyncio
+import functools
+import glob
+import logging
+import platform
+
+from . import config
+from .engine import ValidationEngine
+from .flow import FlowMeter
+from .metrics import EngineMetrics
+from .reader import SerialTagReader, TagDecoder
+from .valve import ValveLink
+
+logger = logging.getLogger(__name__)
+
+
+def parse_taps(spec):
+    """``"name=port,name=port"`` -> ``[(name, port), ...]`` (order kept)."""
+    taps = []
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, sep, port = item.partition("=")
+        name, port = name.strip(), port.strip()
+        if not sep or not name or not port:
+            raise ValueError(f"invalid tap entry {item.strip()!r}, expected name=port")
+        if any(name == other for other, _ in taps):
+            raise ValueError(f"duplicate tap name {name!r}")
+        taps.append((name, port))
+    return taps
+
+
+def detect_serial_port():
+    """First Arduino-looking port (``/dev/ttyACM*``, then ``/dev/ttyUSB*``)."""
+    if platform.system() == "Windows":
+        return "COM15"
+    ports = sorted(glob.glob('/dev/ttyACM*')) + sorted(glob.glob('/dev/ttyUSB*'))
+    return ports[0] if ports else "/dev/ttyACM0"
+
+
+def _open_reader(port, baud):
+    import serial
+    return serial.serial_for_url(port, baud, timeout=1)
+
+
+class Tap:
+    """One valve link with its engine and reader.
+
+    ``name`` is recorded in the history; ``None`` leaves it empty, as in a
+    single-tap setup. Tags are read from ``reader_port`` when given,
+    otherwise from the data the valve port forwards. Pulse reports on the
+    valve port drive volume doses when ``pulses_per_litre`` (by default
+    ``TAP_FLOW_PULSES_PER_LITRE``) is positive.
+    """
+
+    def __init__(self, name, port, db, history, baud=None, on_event=None, opener=None,
+                 reconnect_seconds=None, reader_port=None, protocol=None, pulses_per_litre=None,
+                 **engine_options):
+        self.name = name
+        self.label = name or port
+        self.port = port
+        self.reader_port = reader_port
+        self.on_event = on_event
+        self.reader = None
+        self.metrics = EngineMetrics(name or "")
+        if pulses_per_litre is None:
+            pulses_per_litre = config.FLOW_PULSES_PER_LITRE
+        self.flow = FlowMeter(pulses_per_litre) if pulses_per_litre > 0 else None
+        self.link = ValveLink(port, baud, protocol, opener, max_backoff=reconnect_seconds,
+                              metrics=self.metrics, name=f"valve-{self.label}")
+        self.engine = ValidationEngine(
+            db, self.link.send, on_event=self._event, metrics=self.metrics,
+            record_history=functools.partial(history.submit, tap=name), flow=self.flow,
+            **engine_options,
+        )
+
+    def _event(self, event, **data):
+        if self.on_event is not None:
+            self.on_event(event, tap=self.name, **data)
+
+    def start(self):
+        """Start the link (it connects in the background) and the reader."""
+        on_data = TagDecoder(self.engine.submit).handle if self.reader_port is None else None
+        if self.flow is not None:
+            self.flow.sink, on_data = on_data, self.flow.feed
+        self.link.on_data = on_data
+        if self.reader_port is not None:
+            try:
+                conn = _open_reader(self.reader_port, config.READER_BAUD)
+            except Exception as e:
+                logger.warning("tap %s: cannot open reader %s (%s)", self.label, self.reader_port, e)
+            else:
+                self.reader = SerialTagReader(conn, self.engine.submit)
+                self.reader.name = f"rfid-reader-{self.label}"
+                self.reader.start()
+        self.link.start()
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.stop(timeout=2)
+            self.reader.conn.close()
+            self.reader = None
+        self.link.close()
+
+
+class TapDaemon:
+    """Runs every tap's engine on one event loop."""
+
+    def __init__(self, db, history, taps, on_event=None, **tap_options):
+        self.taps = [Tap(name, port, db, history, on_event=on_event, **tap_options)
+                     for name, port in taps]
+
+    def __getitem__(self, name):
+        for tap in self.taps:
+            if tap.name == name:
+                return tap
+        raise KeyError(name)
+
+    def start(self):
+        for tap in self.taps:
+            tap.start()
+
+    def submit(self, tag_id, tap=None):
+        """Hand a read to ``tap`` (the first one by default); thread-safe."""
+        target = self[tap] if tap is not None else self.taps[0]
+        target.engine.submit(tag_id)
+
+    def stop(self):
+        for tap in self.taps:
+            tap.engine.stop()
+
+    async def run(self):
+        try:
+            await asyncio.gather(*(tap.engine.run() for tap in self.taps))
+        finally:
+            for tap in self.taps:
+                tap.close()
@@ -0,0 +1,75 @@
+"""Streaming CSV / JSONL readers and writers for ``tap import`` and ``tap export``.
+
+Files are read and written one row at a time so member lists of any size
+go straight to :meth:`SQLiteDatabase.import_tags` without being loaded
+into memory. Both formats use the fields ``tag_id``, ``name`` and
+``registered_at``; the format follows the file extension.
+"""
+
+import csv
+import json
+import sys
+
+FIELDS = ("tag_id", "name", "registered_at")
+FORMATS = ("csv", "jsonl")
+
+
+def guess_format(path):
+    return "jsonl" if str(path).lower().endswith((".jsonl", ".json", ".ndjson")) else "csv"
+
+
+def _open(path, mode):
+    if path == "-":
+        return sys.stdin if "r" in mode else sys.stdout
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+def _fields(record):
+    return tuple(record.get(field) for field in FIELDS)
+
+
+def read_tags(path, fmt=None):
+    """Yield ``(tag_id, name, registered_at)`` tuples; unreadable lines yield ``None``."""
+    fmt = fmt or guess_format(path)
+    f = _open(path, "r")
+    try:
+        if fmt == "csv":
+            for record in csv.DictReader(f):
+                if "tag_id" not in record and "id" in record:
+                    record["tag_id"] = record["id"]
+                yield _fields(record)
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield None
+                    continue
+                yield _fields(record) if isinstance(record, dict) else None
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def write_tags(path, rows, fmt=None):
+    """Write ``(tag_id, name, registered_at)`` rows; returns how many were written."""
+    fmt = fmt or guess_format(path)
+    count = 0
+    f = _open(path, "w")
+    try:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                f.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n")
+                count += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count
@@ -0,0 +1,338 @@
+"""Serial valve link: acknowledged commands and background reconnect.
+
+Wire format of the ``framed`` protocol (ASCII, one frame per line)::
+
+    host -> device   >SS C XX      C: '1' open, '0' close, 'P' ping
+    device -> host   <SS S XX      S: 'K' done, 'N' bad frame (resend),
+                                      'R' device (re)started, valve closed
+
+``SS`` is a sequence number (hex, 01-FF, wrapping) echoed in the reply and
+``XX`` the XOR of the bytes between the marker and the last space, in hex.
+A command is resent every ``ack_timeout`` seconds until acknowledged or
+``retries`` resends have failed; a device that stops answering (pings
+every ``heartbeat`` idle seconds) is dropped and reopened.
+
+Everything else the device sends, such as RFID frames forwarded by the
+Arduino, is handed to ``on_data``. The ``raw`` protocol is the original
+single ``'1'``/``'0'`` byte with no acknowledgement, for unmodified
+firmware.
+
+One thread per link owns the port: it reads, resends, pings and
+reconnects with exponential backoff. ``send`` never waits for a
+reconnect; while the port is down it fails at once, so tag processing
+never blocks on a missing valve. The last requested state is re-applied
+after every reconnect or device restart.
+"""
+
+import logging
+import threading
+import time
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+PROTOCOLS = ("raw", "framed")
+# Replies longer than this without a newline are not replies.
+MAX_REPLY = 32
+
+
+class ValveError(ConnectionError):
+    pass
+
+
+def checksum(body):
+    value = 0
+    for byte in body:
+        value ^= byte
+    return value
+
+
+def encode(marker, seq, code):
+    body = b"%02X %s" % (seq, code.encode("ascii"))
+    return marker + body + b" %02X\n" % checksum(body)
+
+
+def decode(line, marker):
+    """``(seq, code)`` from one frame line, or ``None`` if it is malformed."""
+    line = line.strip()
+    if not line.startswith(marker):
+        return None
+    body, _, check = line[len(marker):].rpartition(b" ")
+    try:
+        if int(check, 16) != checksum(body):
+            return None
+        seq, code = body.split(b" ")
+        return int(seq, 16), code.decode("ascii")
+    except ValueError:
+        return None
+
+
+def _open_serial(port, baud):
+    import serial
+    return serial.serial_for_url(port, baud, timeout=0.05, write_timeout=config.VALVE_WRITE_TIMEOUT)
+
+
+class _Pending:
+    def __init__(self, seq, code, frame, now, ack_timeout, expires):
+        self.seq = seq
+        self.code = code
+        self.frame = frame
+        self.deadline = now + ack_timeout
+        self.expires = expires
+        self.done = threading.Event()
+        self.error = None
+
+
+class ValveLink(threading.Thread):
+    def __init__(self, port, baud=None, protocol=None, opener=None, ack_timeout=None, retries=None,
+                 heartbeat=None, boot_seconds=None, max_backoff=None, on_data=None, metrics=None,
+                 name=None):
+        super().__init__(name=name or "valve-link", daemon=True)
+        self.port = port
+        self.baud = baud or config.VALVE_BAUD
+        self.protocol = protocol or config.VALVE_PROTOCOL
+        if self.protocol not in PROTOCOLS:
+            raise ValueError(f"protocol must be one of {PROTOCOLS}, got {self.protocol!r}")
+        self.opener = opener or _open_serial
+        self.ack_timeout = config.VALVE_ACK_TIMEOUT if ack_timeout is None else ack_timeout
+        self.retries = config.VALVE_RETRIES if retries is None else retries
+        self.heartbeat = config.VALVE_HEARTBEAT if heartbeat is None else heartbeat
+        # An Arduino resets when the port opens and ignores the first
+        # frames while its bootloader runs.
+        self.boot_seconds = config.VALVE_BOOT_SECONDS if boot_seconds is None else boot_seconds
+        self.max_backoff = config.VALVE_RECONNECT_SECONDS if max_backoff is None else max_backoff
+        self.on_data = on_data
+        self.metrics = metrics
+
+        self.conn = None
+        self.connected = threading.Event()
+        self.desired = None
+        self.restarts = 0
+        self._seq = 0
+        self._pending = {}
+        self._buffer = b""
+        self._last_activity = 0.0
+        self._ever_connected = False
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+
+    # ── Caller side ──────────────────────────────────────────────────
+    def send(self, command):
+        """Apply ``'1'``/``'0'``; raises :class:`ValveError` if the device did not confirm."""
+        if command not in ("1", "0"):
+            raise ValueError(f"unknown valve command {command!r}")
+        # Recorded first, so a reconnect re-applies a close even if this
+        # fails; a failed open is never re-applied behind the caller's back.
+        self.desired = command
+        try:
+            self._send(command)
+        except ValveError:
+            if command == "1":
+                self.desired = "0"
+            raise
+
+    def _send(self, command):
+        if not self.connected.is_set():
+            raise ValveError(f"{self.port}: not connected")
+        if self.protocol == "raw":
+            with self._lock:
+                conn = self.conn
+                if conn is None:
+                    raise ValveError(f"{self.port}: not connected")
+                try:
+                    conn.write(command.encode())
+                except Exception as e:
+                    self._drop(f"write failed ({e})")
+                    raise ValveError(f"{self.port}: {e}") from e
+            return
+        now = time.monotonic()
+        pending = self._submit(command, now + self.ack_timeout * (self.retries + 1))
+        if pending is None:
+            raise ValveError(f"{self.port}: not connected")
+        pending.done.wait(pending.expires - now + 1.0)
+        if not pending.done.is_set() or pending.error:
+            raise ValveError(f"{self.port}: {pending.error or 'no acknowledgement'}")
+
+    def wait_connected(self, timeout=None):
+        return self.connected.wait(timeout)
+
+    def close(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+        self._drop(None)
+
+    # ── Link thread ──────────────────────────────────────────────────
+    def run(self):
+        backoff = min(0.25, self.max_backoff)
+        while not self._stop_event.is_set():
+            if self.conn is None:
+                if not self._connect():
+                    self._stop_event.wait(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                backoff = min(0.25, self.max_backoff)
+            try:
+                self._poll()
+            except Exception as e:
+                self._drop(f"read failed ({e})")
+
+    def _connect(self):
+        try:
+            conn = self.opener(self.port, self.baud)
+        except Exception as e:
+            logger.warning("valve %s: cannot open (%s)", self.port, e)
+            return False
+        with self._lock:
+            self.conn = conn
+            self._buffer = b""
+            self._last_activity = time.monotonic()
+        if self._ever_connected and self.metrics is not None:
+            self.metrics.reconnects.inc()
+        self._ever_connected = True
+        if self.protocol == "raw":
+            self._online()
+        else:
+            # Online once the device answers; it may still be booting.
+            now = time.monotonic()
+            self._submit("P", now + self.boot_seconds, force=True)
+        return True
+
+    def _online(self):
+        logger.info("valve %s: connected (%s)", self.port, self.protocol)
+        self.connected.set()
+        if self.desired is not None:
+            self._reapply()
+
+    def _reapply(self):
+        if self.protocol == "raw":
+            try:
+                self._send(self.desired)
+            except ValveError:
+                pass
+        else:
+            self._submit(self.desired, time.monotonic() + self.ack_timeout * (self.retries + 1))
+
+    def _poll(self):
+        conn = self.conn
+        data = conn.read(max(1, conn.in_waiting))
+        now = time.monotonic()
+        if data:
+            if self.protocol == "raw":
+                self._deliver(data)
+            else:
+                self._last_activity = now
+                self._feed(data)
+        if self.protocol == "framed":
+            self._service(now)
+
+    def _deliver(self, data):
+        if data and self.on_data is not None:
+            try:
+                self.on_data(data)
+            except Exception:
+                logger.exception("valve %s: data handler failed", self.port)
+
+    def _feed(self, data):
+        buffer = self._buffer + data
+        passthrough = b""
+        while True:
+            start = buffer.find(b"<")
+            if start < 0:
+                passthrough += buffer
+                buffer = b""
+                break
+            passthrough += buffer[:start]
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                buffer = buffer[start:]
+                if len(buffer) > MAX_REPLY:
+                    passthrough += buffer
+                    buffer = b""
+                break
+            reply = decode(buffer[start:end], b"<")
+            if reply is None:
+                passthrough += buffer[start:end + 1]
+            else:
+                self._reply(*reply)
+            buffer = buffer[end + 1:]
+        self._buffer = buffer
+        self._deliver(passthrough)
+
+    def _reply(self, seq, code):
+        if code == "R":
+            self.restarts += 1
+            if self.metrics is not None:
+                self.metrics.restarts.inc()
+            logger.warning("valve %s: device restarted", self.port)
+            if self.connected.is_set():
+                if self.desired is not None:
+                    self._reapply()
+            return
+        with self._lock:
+            pending = self._pending.get(seq)
+            if pending is None:
+                return
+            if code == "N":
+                self._write(pending.frame)
+                return
+            del self._pending[seq]
+        pending.done.set()
+        if pending.code == "P" and not self.connected.is_set():
+            self._online()
+
+    def _service(self, now):
+        expired = []
+        with self._lock:
+            for pending in list(self._pending.values()):
+                if now >= pending.expires:
+                    expired.append(pending)
+                elif now >= pending.deadline:
+                    pending.deadline = now + self.ack_timeout
+                    if self.metrics is not None:
+                        self.metrics.retries.inc()
+                    self._write(pending.frame)
+            idle = not self._pending and now - self._last_activity >= self.heartbeat
+        if expired:
+            self._drop(f"no acknowledgement for {expired[0].code!r}")
+        elif idle and self.connected.is_set():
+            self._submit("P", now + self.ack_timeout * (self.retries + 1))
+
+    # ── Shared ───────────────────────────────────────────────────────
+    def _submit(self, code, expires, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if self.conn is None or not (force or self.connected.is_set()):
+                return None
+            self._seq = self._seq % 255 + 1
+            frame = encode(b">", self._seq, code)
+            pending = _Pending(self._seq, code, frame, now, self.ack_timeout, expires)
+            self._pending[self._seq] = pending
+            self._last_activity = now
+            self._write(frame)
+        return pending
+
+    def _write(self, frame):
+        try:
+            self.conn.write(frame)
+        except Exception as e:
+            logger.warning("valve %s: write failed (%s)", self.port, e)
+
+    def _drop(self, reason):
+        with self._lock:
+            conn, self.conn = self.conn, None
+            pending, self._pending = list(self._pending.values()), {}
+            was_connected = self.connected.is_set()
+            self.connected.clear()
+        for p in pending:
+            p.error = reason or "link closed"
+            p.done.set()
+        if conn is None:
+            return
+        if reason is not None:
+            logger.warning("valve %s: %s%s", self.port, reason, ", reconnecting" if was_connected else "")
+        try:
+            conn.close()
+        except Exception:
+            pass
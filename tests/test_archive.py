@@ -0,0 +1,113 @@
+"""
+Hack-n-TAP — History Archive Tests
+Testes da retenção do histórico: arquivos mensais, exclusão em lotes e consulta unificada.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from tap import config
+from tap.model import archive, changelog
+from tap.model.database import SQLiteDatabase
+
+
+def ts(*args):
+    return int(datetime(*args).timestamp())
+
+
+NOW = ts(2025, 4, 15)
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = SQLiteDatabase(db_file=os.path.join(self.dir, "tap.db"))
+        self.db.add_history_entries([
+            ("T1", "Alice", ts(2025, 3, 1, 18, 5)),
+            ("T2", "Bob", ts(2025, 3, 2, 21, 0)),
+            ("T1", "Alice", ts(2025, 4, 1, 9, 0)),
+            ("T2", "Bob", ts(2025, 4, 10, 18, 0)),
+        ])
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def run_archive(self, **options):
+        return archive.archive_history(self.db, 10, now=NOW, pause=0, **options)
+
+    def test_moves_old_rows_to_monthly_files(self):
+        rollups = self.db.get_rollups("month")
+        summary = self.run_archive()
+        self.assertEqual(summary['archived'], 3)
+        self.assertEqual(summary['months'], ["2025-03", "2025-04"])
+        self.assertEqual(self.db.archive.months(), ["2025-03", "2025-04"])
+        self.assertEqual([e['name'] for e in self.db.get_history_entries()], ["Bob"])
+        self.assertEqual([r[3] for r in self.db.archive.rows("2025-03")], ["Alice", "Bob"])
+        # Rollups still count the archived pours.
+        self.assertEqual(self.db.get_rollups("month"), rollups)
+        self.assertEqual(self.run_archive()['archived'], 0)
+
+    def test_iter_history_covers_archives(self):
+        self.run_archive(batch_size=1)
+        entries = list(self.db.iter_history(page_size=2))
+        self.assertEqual([e['ts'] for e in entries], [ts(2025, 4, 10, 18, 0), ts(2025, 4, 1, 9, 0),
+                                                      ts(2025, 3, 2, 21, 0), ts(2025, 3, 1, 18, 5)])
+        self.assertEqual(entries[-1]['display_date'], "01/03/2025")
+        alice = list(self.db.iter_history(tag_id="T1", since="2025-03-01 00:00:00", until="2025-04-01 00:00:00"))
+        self.assertEqual([e['name'] for e in alice], ["Alice"])
+        self.assertEqual(len(list(self.db.iter_history(archived=False))), 1)
+
+    def test_interrupted_run_does_not_duplicate(self):
+        # Archive written, crash before the delete: the next run rewrites the same rows.
+        rows = self.db.history_after(0, 2)
+        self.db.archive.add("2025-03", rows)
+        self.run_archive()
+        self.assertEqual(len(self.db.archive.rows("2025-03")), 2)
+        self.assertEqual(len(list(self.db.iter_history())), 4)
+
+    def test_rebuild_rollups_includes_archives(self):
+        rollups = {g: self.db.get_rollups(g) for g in ("hour", "day", "month")}
+        self.run_archive()
+        self.db.rebuild_rollups()
+        for grain, rows in rollups.items():
+            self.assertEqual([tuple(r) for r in self.db.get_rollups(grain)], [tuple(r) for r in rows])
+
+    def test_unsynced_rows_are_kept(self):
+        with self.db.lock:
+            changelog.set_state(self.db.conn, "history_pushed", 1)
+            self.db.conn.commit()
+        with mock.patch.object(config, "SYNC_URL", "http://central"):
+            self.assertEqual(self.run_archive()['archived'], 1)
+        self.assertEqual(len(self.db.get_history_entries()), 3)
+
+    def test_incremental_vacuum_frees_pages(self):
+        self.assertEqual(self.db.pool.pragma("auto_vacuum"), 2)
+        self.db.add_history_entries([("T3", f"User {i}", ts(2025, 2, 1) + i) for i in range(5000)])
+        summary = self.run_archive()
+        self.assertEqual(summary['archived'], 5003)
+        self.assertGreater(summary['freed_pages'], 0)
+        self.assertEqual(self.db.pool.pragma("freelist_count"), 0)
+
+
+    def test_archiver_backs_off_while_database_unavailable(self):
+        archiver = archive.Archiver(self.db, days=10, interval=3600)
+        failure = sqlite3.OperationalError("database tap.db is not available")
+        with mock.patch.object(archive, "RETRY_SECONDS", 0.02), \
+                mock.patch.object(archive, "archive_history", side_effect=failure) as run, \
+                self.assertLogs("tap.model.archive", "WARNING"):
+            archiver.start()
+            time.sleep(0.3)
+            archiver.stop(timeout=2)
+        self.assertLess(run.call_count, 6)  # 0.02, 0.04, 0.08, 0.16 s apart
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Hack-n-TAP — Benchmark Suite Tests
+Garante que o gerador de dados e a comparação com a linha de base funcionam.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import dataset
+from benchmarks.__main__ import compare, run_case
+from tap.model.database import SQLiteDatabase
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_generated_dataset(self):
+        path = dataset.ensure(self.dir, 50, 2000)
+        self.assertEqual(dataset.ensure(self.dir, 50, 2000), path)
+        db = SQLiteDatabase(path)
+        try:
+            self.assertEqual(len(db.get_all_tags()), 50)
+            self.assertEqual(db.validate_tag(dataset.tag_id(7))["name"], "Member 7")
+            entries = db.get_history_page(10)
+            self.assertEqual(entries[0]["name"], db.validate_tag(entries[0]["tag_id"])["name"])
+            self.assertEqual(sum(n for _, _, n in db.get_rollups("month")), 2000)
+            # The rollup trigger is back after the bulk load.
+            db.add_history_entry(dataset.tag_id(1), "Member 1")
+            self.assertEqual(sum(n for _, _, n in db.get_rollups("month")), 2001)
+        finally:
+            db.close()
+
+    def test_write_cases_leave_dataset_untouched(self):
+        path = dataset.ensure(self.dir, 50, 2000)
+        for name in ("add_history_entry", "history_writer_submit", "validate_tag_hit"):
+            result = run_case(name, path, 2000, budget=0.05, max_ops=200)
+            self.assertGreater(result["ops"], 0)
+            self.assertLessEqual(result["p50_us"], result["p99_us"])
+        db = SQLiteDatabase(path)
+        try:
+            self.assertEqual(len(db.get_history_page(5000)), 2000)
+            self.assertEqual(sum(n for _, _, n in db.get_rollups("hour")), 2000)
+        finally:
+            db.close()
+        self.assertFalse(os.path.exists(path + "-spill"))
+
+    def test_compare_flags_regressions(self):
+        baseline = {"cases": {"a": {"p50_us": 10.0, "ops_per_sec": 1000.0}, "b": {"p50_ms": 100.0}}}
+        current = {"cases": {"a": {"p50_us": 11.0, "ops_per_sec": 700.0}, "b": {"p50_ms": 150.0}}}
+        flagged = {(name, metric) for name, metric, *_ in compare(current, baseline, 0.2)}
+        self.assertEqual(flagged, {("a", "ops_per_sec"), ("b", "p50_ms")})
+
+
+if __name__ == "__main__":
+    unittest.main()
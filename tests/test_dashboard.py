@@ -0,0 +1,124 @@
+"""
+Hack-n-TAP — Dashboard Tests
+Testes do buffer circular de eventos e do painel web com server-sent events.
+"""
+
+import http.client
+import json
+import time
+import unittest
+
+from tap.dashboard import RATE_WINDOW, EventFeed
+
+try:
+    import aiohttp  # noqa: F401
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+
+class TestEventFeed(unittest.TestCase):
+
+    def test_ring_buffer_and_tap_state(self):
+        feed = EventFeed(size=3)
+        feed.publish('open', tap="bar", tag_id="T1", name="Alice", wait=0.01, seconds=5)
+        feed.publish('tick', tap="bar", remaining=4, total=5)
+        state = feed.snapshot()
+        self.assertEqual(state['seq'], 1)
+        self.assertEqual(state['taps']["bar"]['state'], 'pouring')
+        self.assertEqual(state['taps']["bar"]['name'], "Alice")
+
+        feed.publish('closed', tap="bar", tag_id="T1", name="Alice", duration=5.0)
+        self.assertEqual([e['event'] for e in feed.since(1)], ['closed'])
+        self.assertEqual(feed.since(2), [])
+        self.assertEqual(feed.snapshot()['taps']["bar"]['state'], 'idle')
+
+        for _ in range(3):
+            feed.publish('denied', tap="bar", tag_id="XX")
+        self.assertEqual(len(feed.snapshot()['events']), 3)
+        self.assertIsNone(feed.since(1))  # fell off the buffer: resync
+        self.assertIsNone(feed.since(99))  # from before a restart
+        self.assertEqual(feed.snapshot()['counts'], {'open': 1, 'closed': 1, 'denied': 3})
+
+    def test_seed_from_history(self):
+        feed = EventFeed()
+        feed.seed([{'ts': 200, 'tap': None, 'tag_id': "T2", 'name': "Bob"},
+                   {'ts': 100, 'tap': None, 'tag_id': "T1", 'name': "Alice"}])
+        self.assertEqual([e['name'] for e in feed.snapshot()['events']], ["Alice", "Bob"])
+        self.assertEqual(feed.snapshot()['taps'], {})
+
+    def test_rates_outlast_the_buffer(self):
+        feed = EventFeed(size=10)
+        now = time.time()
+        feed.seed([{'ts': now - 60, 'tap': None, 'tag_id': "T1", 'name': "Alice"},
+                   {'ts': now - 2 * RATE_WINDOW, 'tap': None, 'tag_id': "T1", 'name': "Alice"}])
+        for _ in range(120):
+            feed.publish('open', tap="bar", tag_id="T1", name="Alice", wait=0.0, seconds=5)
+        feed.publish('denied', tag_id="XX")
+        recent = feed.snapshot()['recent']
+        self.assertEqual(len(recent['open']), 121)
+        self.assertEqual(len(recent['denied']), 1)
+        self.assertEqual(len(feed.snapshot()['events']), 10)
+
+
+@unittest.skipUnless(HAS_AIOHTTP, "needs aiohttp")
+class TestDashboardServer(unittest.TestCase):
+
+    def setUp(self):
+        from tap.dashboard import Dashboard
+
+        self.feed = EventFeed()
+        self.server = Dashboard(self.feed, port=0, addr="127.0.0.1").start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def connect(self, path, headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        conn.request("GET", path, headers=headers or {})
+        self.addCleanup(conn.close)
+        return conn.getresponse()
+
+    def read_event(self, response):
+        fields = {}
+        while True:
+            line = response.fp.readline().decode("utf-8").rstrip("\n")
+            if not line:
+                if fields:
+                    return fields
+                continue
+            if line.startswith(":"):
+                continue
+            key, _, value = line.partition(": ")
+            fields[key] = value
+
+    def test_page_and_state(self):
+        self.assertIn("EventSource", self.connect("/").read().decode("utf-8"))
+        self.feed.publish('denied', tag_id="XX")
+        state = json.loads(self.connect("/state").read())
+        self.assertEqual(state['events'][0]['tag_id'], "XX")
+
+    def test_events_are_pushed(self):
+        self.feed.publish('denied', tag_id="XX")
+        response = self.connect("/events")
+        self.assertEqual(response.getheader("Content-Type"), "text/event-stream")
+        first = self.read_event(response)
+        self.assertEqual((first['event'], first['id']), ("state", "1"))
+        self.assertEqual(json.loads(first['data'])['events'][0]['event'], 'denied')
+
+        time.sleep(0.05)  # let the viewer start waiting
+        self.feed.publish('open', tap="bar", tag_id="T1", name="Alice", wait=0.0, seconds=5)
+        pour = self.read_event(response)
+        self.assertEqual((pour['event'], pour['id']), ("pour", "2"))
+        self.assertEqual(json.loads(pour['data'])['name'], "Alice")
+
+    def test_reconnect_resumes_after_last_event_id(self):
+        for tag_id in ("A", "B", "C"):
+            self.feed.publish('denied', tag_id=tag_id)
+        response = self.connect("/events", {"Last-Event-ID": "1"})
+        got = [json.loads(self.read_event(response)['data'])['tag_id'] for _ in range(2)]
+        self.assertEqual(got, ["B", "C"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Hack-n-TAP — Engine Tests
+Testes do motor de validação assíncrono (sem hardware).
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from tap.engine import ValidationEngine
+from tap.model.database import SQLiteDatabase
+from tap.ratelimit import RateLimiter
+
+
+class SlowLookupStorage:
+    """Motor remoto falso: a busca de ``SLOW`` fica presa até ``release``."""
+
+    remote_lookup = True
+
+    def __init__(self, db, release):
+        self.db = db
+        self.release = release
+
+    def validate_tag(self, tag_id):
+        if tag_id == "SLOW":
+            self.release.wait(5)
+        return self.db.validate_tag(tag_id)
+
+    def add_history_entry(self, *args, **kwargs):
+        return self.db.add_history_entry(*args, **kwargs)
+
+
+class EngineTestCase(unittest.TestCase):
+    pour_seconds = 0.05
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+        self.db.add_tag("T1", "Alice")
+        self.db.add_tag("T2", "Bob")
+        self.commands = []
+        self.events = []
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.unlink(self.tmp.name)
+
+    def send(self, command):
+        self.commands.append((command, time.monotonic()))
+
+    def run_engine(self, reads, policy="queue", settle=None, gap=0, db=None, **options):
+        engine = ValidationEngine(
+            db or self.db, self.send, pour_seconds=self.pour_seconds, busy_policy=policy,
+            ui_interval=0.01, on_event=lambda e, **d: self.events.append((e, d)), **options,
+        )
+
+        async def scenario():
+            runner = asyncio.ensure_future(engine.run())
+            await asyncio.sleep(0)
+            for tag_id in reads:
+                engine.submit(tag_id)
+                await asyncio.sleep(gap)
+            await asyncio.sleep(settle if settle is not None else self.pour_seconds * (len(reads) + 2))
+            engine.stop()
+            await runner
+
+        asyncio.run(scenario())
+        return engine
+
+    def names(self, event):
+        return [d.get("tag_id") for e, d in self.events if e == event]
+
+
+class TestValidationEngine(EngineTestCase):
+
+    def test_reads_during_pour_are_queued(self):
+        engine = self.run_engine(["T1", "T2"])
+        self.assertEqual(self.names("open"), ["T1", "T2"])
+        self.assertEqual([c for c, _ in self.commands], ["1", "0", "1", "0"])
+        self.assertEqual(engine.stats["pours"], 2)
+        self.assertEqual(len(self.db.get_history_entries()), 2)
+
+    def test_reject_policy_refuses_while_open(self):
+        engine = self.run_engine(["T1", "T2"], policy="reject")
+        self.assertEqual(self.names("open"), ["T1"])
+        self.assertEqual(self.names("busy"), ["T2"])
+        self.assertEqual(engine.stats["rejected"], 1)
+
+    def test_extend_policy_adds_a_dose(self):
+        self.run_engine(["T1", "T2"], policy="extend", gap=self.pour_seconds / 2)
+        self.assertEqual(self.names("open"), ["T1"])
+        self.assertEqual(self.names("extended"), ["T2"])
+        (_, opened), (_, closed) = self.commands
+        self.assertGreaterEqual(closed - opened, 2 * self.pour_seconds)
+        self.assertEqual(len(self.db.get_history_entries()), 2)
+
+    def test_denial_does_not_block(self):
+        self.run_engine(["NOPE", "T1"])
+        self.assertEqual(self.names("denied"), ["NOPE"])
+        self.assertEqual(self.names("open"), ["T1"])
+
+    def test_stop_closes_open_valve(self):
+        self.pour_seconds = 10
+        self.run_engine(["T1"], settle=0.05)
+        self.assertEqual([c for c, _ in self.commands], ["1", "0"])
+
+    def test_limited_reads_do_not_pour(self):
+        limiter = RateLimiter(per_minute=0, daily_quota=1)
+        engine = self.run_engine(["T1", "T2", "T1"], policy="reject", limiter=limiter)
+        self.assertEqual(self.names("open"), ["T1"])
+        self.assertEqual(self.names("busy"), ["T2"])
+        self.assertEqual(self.names("limited"), ["T1"])
+        self.assertEqual(engine.stats["limited"], 1)
+        # The refused read gave its dose back.
+        self.assertEqual(limiter.doses_today("T2"), 0)
+
+    def test_slow_remote_lookup_does_not_delay_the_valve(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.pour_seconds = 0.2
+        self.run_engine(["T1", "SLOW"], settle=0.4, gap=0.02,
+                        db=SlowLookupStorage(self.db, release), lookup_timeout=0.3)
+        (_, opened), (_, closed) = self.commands
+        self.assertLess(closed - opened, self.pour_seconds + 0.05)
+        self.assertEqual(self.names("open"), ["T1"])
+        self.assertEqual(self.names("denied"), ["SLOW"])
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            ValidationEngine(self.db, self.send, busy_policy="drop")
+
+
+if __name__ == "__main__":
+    unittest.main()
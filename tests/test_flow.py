@@ -0,0 +1,151 @@
+"""
+Hack-n-TAP — Flow Meter Tests
+Testes da dose por volume: pulsos do medidor de vazão na porta da válvula (sem hardware).
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from tap.engine import ValidationEngine
+from tap.flow import FlowMeter, encode_pulses, split_volume
+from tap.model.database import SQLiteDatabase
+
+
+class TestFlowMeter(unittest.TestCase):
+
+    def setUp(self):
+        self.passed = []
+        self.meter = FlowMeter(1000, sink=self.passed.append)
+
+    def test_pulse_reports_are_counted_and_removed(self):
+        self.meter.feed(b"<01K5A\n~12\nT1\n~8\r\n")
+        self.assertEqual(self.meter.pulses, 20)
+        self.assertEqual(self.meter.frames, 2)
+        self.assertEqual(b"".join(self.passed), b"<01K5A\nT1\n")
+
+    def test_data_without_reports_passes_untouched(self):
+        self.meter.feed(b"T1\n")
+        self.assertEqual(self.passed, [b"T1\n"])
+        self.assertEqual(self.meter.frames, 0)
+
+    def test_report_split_across_reads(self):
+        self.meter.feed(b"T1\n~4")
+        self.meter.feed(b"2\n")
+        self.assertEqual(self.meter.pulses, 42)
+        self.assertEqual(b"".join(self.passed), b"T1\n")
+
+    def test_many_reports_in_one_read(self):
+        self.meter.feed(b"".join(encode_pulses(3) for _ in range(500)))
+        self.assertEqual((self.meter.pulses, self.meter.frames), (1500, 500))
+        self.assertEqual(self.passed, [])
+
+    def test_target_calls_back_once(self):
+        reached = []
+        self.meter.arm(50, lambda: reached.append(self.meter.ml))
+        self.meter.feed(encode_pulses(30))
+        self.assertEqual(reached, [])
+        self.meter.feed(encode_pulses(30) + encode_pulses(30))
+        self.assertEqual(reached, [90.0])
+        self.assertFalse(self.meter.extend(50))
+        self.assertEqual(self.meter.disarm(), 90.0)
+
+    def test_extend_raises_the_target(self):
+        reached = []
+        self.meter.arm(50, lambda: reached.append(True))
+        self.assertTrue(self.meter.extend(50))
+        self.meter.add(60)
+        self.assertEqual(reached, [])
+        self.meter.add(40)
+        self.assertEqual(reached, [True])
+
+    def test_split_volume(self):
+        self.assertEqual(split_volume(320, 1, 300), [320])
+        self.assertEqual(split_volume(450, 2, 300), [300, 150])
+        self.assertEqual(split_volume(620, 2, 300), [300, 320])
+
+
+class TestFlowDosing(unittest.TestCase):
+    pour_seconds = 1.0
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+        self.db.add_tag("T1", "Alice")
+        self.db.add_tag("T2", "Bob")
+        self.commands = []
+        self.events = []
+        self.flow = FlowMeter(1000)
+        self.pouring = threading.Event()
+        self.stop_flow = threading.Event()
+        self.addCleanup(self.stop_flow.set)
+        threading.Thread(target=self.meter, daemon=True).start()
+
+    def meter(self):
+        # 10 pulses (10 ml) every 5 ms while the valve is open: 300 ml in ~0.15 s.
+        while not self.stop_flow.wait(0.005):
+            if self.pouring.is_set():
+                self.flow.feed(encode_pulses(10))
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.unlink(self.tmp.name)
+
+    def send(self, command):
+        self.commands.append((command, time.monotonic()))
+        if command == '1':
+            self.pouring.set()
+        else:
+            self.pouring.clear()
+
+    def run_engine(self, reads, settle, policy="queue", gap=0, pour_ml=300):
+        engine = ValidationEngine(
+            self.db, self.send, pour_seconds=self.pour_seconds, busy_policy=policy, ui_interval=0.01,
+            on_event=lambda e, **d: self.events.append((e, d)), flow=self.flow, pour_ml=pour_ml,
+        )
+
+        async def scenario():
+            runner = asyncio.ensure_future(engine.run())
+            await asyncio.sleep(0)
+            for tag_id in reads:
+                engine.submit(tag_id)
+                await asyncio.sleep(gap)
+            await asyncio.sleep(settle)
+            engine.stop()
+            await runner
+
+        asyncio.run(scenario())
+
+    def test_valve_closes_at_target_volume(self):
+        self.run_engine(["T1"], settle=0.5)
+        (_, opened), (_, closed) = self.commands
+        self.assertLess(closed - opened, self.pour_seconds)
+        (entry,) = self.db.get_history_entries()
+        self.assertGreaterEqual(entry['ml'], 300)
+        (data,) = [d for e, d in self.events if e == 'closed']
+        self.assertEqual(data['ml'], entry['ml'])
+
+    def test_time_cap_without_flow(self):
+        self.pouring.set = lambda: None  # empty keg
+        self.pour_seconds = 0.1
+        self.run_engine(["T1"], settle=0.3)
+        (_, opened), (_, closed) = self.commands
+        self.assertGreaterEqual(closed - opened, 0.1)
+        (entry,) = self.db.get_history_entries()
+        self.assertEqual(entry['ml'], 0)
+
+    def test_extended_pour_records_each_dose(self):
+        self.run_engine(["T1", "T2"], policy="extend", gap=0.02, settle=0.6, pour_ml=100)
+        self.assertEqual([c for c, _ in self.commands], ["1", "0"])
+        entries = sorted(self.db.get_history_entries(), key=lambda e: e['tag_id'])
+        self.assertEqual([e['tag_id'] for e in entries], ["T1", "T2"])
+        self.assertEqual(entries[0]['ml'], 100)
+        self.assertGreaterEqual(entries[1]['ml'], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,9 +5,13 @@ Testes funcionais simples para rodar em pre-commit / CI.
 
 import unittest
 import os
+import sqlite3
 import tempfile
 
 from tap.model.database import SQLiteDatabase
+from tap.model import migrations
+from tap.model.history import HistoryWriter
+from tap.model.pool import ConnectionManager
 
 
 class TestDatabaseSetup(unittest.TestCase):
@@ -121,6 +125,357 @@ class TestHistory(unittest.TestCase):
         entries = self.db.get_history_entries()
         self.assertEqual(len(entries), 0)
 
+    def test_history_pages_are_keyset_ordered(self):
+        for i in range(7):
+            self.db.add_history_entry(f"T{i % 2}", f"User{i}")
+        first = self.db.get_history_page(3)
+        second = self.db.get_history_page(3, before_id=first[-1]["id"])
+        names = [e["name"] for e in first + second]
+        self.assertEqual(names, ["User6", "User5", "User4", "User3", "User2", "User1"])
+
+    def test_iter_history_filters(self):
+        self.db.add_history_entry("T1", "Alice", timestamp="2025-01-01 10:00:00")
+        self.db.add_history_entry("T2", "Bob", timestamp="2025-01-02 10:00:00")
+        self.db.add_history_entry("T1", "Alice", timestamp="2025-01-03 10:00:00")
+        by_tag = list(self.db.iter_history(page_size=1, tag_id="T1"))
+        self.assertEqual([e["timestamp"][:10] for e in by_tag], ["2025-01-03", "2025-01-01"])
+        in_range = list(self.db.iter_history(since="2025-01-02 00:00:00", until="2025-01-03 00:00:00"))
+        self.assertEqual([e["name"] for e in in_range], ["Bob"])
+        self.assertEqual(len(list(self.db.iter_history(name="Alice"))), 2)
+
+    def test_history_indexes_used(self):
+        plan = self.db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM history WHERE tag_id = ? ORDER BY id DESC LIMIT 10", ("T1",)
+        ).fetchall()
+        self.assertIn("idx_history_tag_id", " ".join(row[-1] for row in plan))
+
+
+class TestTagCache(unittest.TestCase):
+    """Testa o cache de autorização na frente de validate_tag."""
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+
+    def tearDown(self):
+        self.db.conn.close()
+        os.unlink(self.tmp.name)
+
+    def test_cache_follows_local_edits(self):
+        self.db.add_tag("T1", "Alice")
+        self.db.update_tag("T1", "Alice B")
+        self.assertEqual(self.db.validate_tag("T1")["name"], "Alice B")
+        self.db.remove_tag("T1")
+        self.assertIsNone(self.db.validate_tag("T1"))
+        self.assertEqual(self.db.tag_cache.reloads, 1)
+
+    def test_cache_sees_other_process_changes(self):
+        self.db.tag_cache.check_interval = 0
+        other = SQLiteDatabase(db_file=self.tmp.name)
+        try:
+            self.assertIsNone(self.db.validate_tag("T9"))
+            other.add_tag("T9", "Externo")
+            self.assertEqual(self.db.validate_tag("T9")["name"], "Externo")
+            other.remove_tag("T9")
+            self.assertIsNone(self.db.validate_tag("T9"))
+        finally:
+            other.conn.close()
+
+    def test_history_from_other_process_does_not_reload(self):
+        self.db.tag_cache.check_interval = 0
+        other = SQLiteDatabase(db_file=self.tmp.name)
+        try:
+            reloads = self.db.tag_cache.reloads
+            other.add_history_entry("T1", "Alice")
+            self.db.validate_tag("T1")
+            self.assertEqual(self.db.tag_cache.reloads, reloads)
+        finally:
+            other.conn.close()
+
+    def test_negative_cache_when_table_exceeds_capacity(self):
+        self.db.add_tag("T1", "Alice")
+        self.db.add_tag("T2", "Bob")
+        self.db.tag_cache.max_entries = 1
+        self.db.tag_cache.load()
+        self.assertFalse(self.db.tag_cache.complete)
+        self.assertEqual(self.db.validate_tag("T1")["name"], "Alice")
+        self.assertEqual(self.db.validate_tag("T2")["name"], "Bob")
+        self.assertIsNone(self.db.validate_tag("NOPE"))
+        self.assertIn("NOPE", self.db.tag_cache._negative)
+        self.db.add_tag("NOPE", "Carol")
+        self.assertEqual(self.db.validate_tag("NOPE")["name"], "Carol")
+
+
+class TestHistoryWriter(unittest.TestCase):
+    """Testa o logger de histórico com escrita em lote e arquivo de spill."""
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+
+    def tearDown(self):
+        self.db.conn.close()
+        for suffix in ("", "-spill", "-wal", "-shm"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+    def test_wal_mode(self):
+        mode = self.db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_flush_writes_one_batch(self):
+        writer = HistoryWriter(self.db, flush_interval=3600)
+        writer.start()
+        for i in range(10):
+            writer.submit(f"T{i}", "Alice")
+        writer.flush()
+        self.assertEqual(len(self.db.get_history_entries()), 10)
+        self.assertEqual(writer.flushes, 1)
+        writer.close()
+
+    def test_close_flushes_pending_and_drops_spill(self):
+        writer = HistoryWriter(self.db, flush_interval=3600)
+        writer.start()
+        writer.submit("T1", "Alice")
+        writer.close()
+        self.assertEqual(len(self.db.get_history_entries()), 1)
+        self.assertFalse(os.path.exists(self.tmp.name + "-spill"))
+        with self.assertRaises(RuntimeError):
+            writer.submit("T2", "Bob")
+
+    def test_spill_replays_only_uncommitted_rows(self):
+        writer = HistoryWriter(self.db, batch_size=2, flush_interval=3600)
+        writer.start()
+        for name in ("Alice", "Bob", "Carol"):
+            writer.submit("T1", name)
+        while writer.written < 2:
+            writer.join(0.01)
+        writer.spill.close()  # simulated crash: Carol never reached SQLite
+
+        restarted = SQLiteDatabase(db_file=self.tmp.name)
+        try:
+            recovery = HistoryWriter(restarted)
+            recovery.start()
+            self.assertEqual(recovery.recovered, 1)
+            names = [e["name"] for e in restarted.get_history_entries()]
+            self.assertEqual(names, ["Carol", "Bob", "Alice"])
+            recovery.close()
+        finally:
+            restarted.conn.close()
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Testa o gerenciador de conexões (um escritor, vários leitores)."""
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+    def test_pragmas_applied(self):
+        self.assertEqual(self.db.pool.pragma("journal_mode"), "wal")
+        self.assertEqual(self.db.pool.pragma("synchronous"), 1)  # NORMAL
+        self.assertEqual(self.db.pool.pragma("temp_store"), 2)  # MEMORY
+
+    def test_readers_do_not_wait_for_open_write(self):
+        self.db.add_tag("T1", "Alice")
+        with self.db.pool.write() as conn:
+            conn.execute("INSERT INTO tags (id, name) VALUES ('T2', 'Bob')")
+            # Uncommitted: readers see the last committed state, immediately.
+            self.assertEqual(list(self.db.get_all_tags()), ["T1"])
+            conn.commit()
+        self.assertEqual(len(self.db.get_all_tags()), 2)
+
+    def test_reader_connections_are_read_only(self):
+        with self.db.pool.read() as conn:
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM tags")
+
+    def test_in_memory_database(self):
+        db = SQLiteDatabase(db_file=":memory:")
+        db.add_tag("T1", "Alice")
+        self.assertEqual(db.validate_tag("T1")["name"], "Alice")
+        self.assertIn("T1", db.get_all_tags())
+        db.close()
+
+
+class TestBulkTags(unittest.TestCase):
+    """Testa a importação e exportação de tags em lote."""
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ("", "-wal", "-shm", ".csv", ".jsonl"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+    def test_import_counts(self):
+        self.db.add_tag("T1", "Alice", registered_at="2025-01-01 10:00:00")
+        self.db.add_tag("T2", "Bob")
+        counts = self.db.import_tags([
+            ("T1", "Alice", None),
+            ("T2", "Roberto", None),
+            ("T3", "Carol", "2025-02-01 09:00:00"),
+            ("", "Sem tag", None),
+            ("T4", "  ", None),
+            None,
+            ("T3", "Carolina", None),
+        ], chunk_size=2)
+        self.assertEqual(counts, {'inserted': 1, 'updated': 2, 'unchanged': 1, 'rejected': 3})
+        tags = self.db.get_all_tags()
+        self.assertEqual(tags["T1"]["registered_at"], "2025-01-01 10:00:00")
+        self.assertEqual(tags["T2"]["name"], "Roberto")
+        self.assertEqual(tags["T3"], {'name': "Carolina", 'registered_at': "2025-02-01 09:00:00"})
+        self.assertEqual(self.db.validate_tag("T3")["name"], "Carolina")
+
+    def test_csv_and_jsonl_round_trip(self):
+        from tap import transfer
+        self.db.import_tags(((f"T{i}", f"Membro {i}", None) for i in range(1200)))
+        for ext in (".csv", ".jsonl"):
+            path = self.tmp.name + ext
+            self.assertEqual(transfer.write_tags(path, self.db.export_tags()), 1200)
+            other = SQLiteDatabase(db_file=":memory:")
+            counts = other.import_tags(transfer.read_tags(path))
+            self.assertEqual(counts['inserted'], 1200)
+            self.assertEqual(list(other.export_tags()), list(self.db.export_tags()))
+            other.close()
+
+    def test_bad_jsonl_lines_rejected(self):
+        from tap import transfer
+        path = self.tmp.name + ".jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('{"tag_id": "T1", "name": "Alice"}\n{quebrado\n\n["T2"]\n')
+        counts = self.db.import_tags(transfer.read_tags(path))
+        self.assertEqual((counts['inserted'], counts['rejected']), (1, 2))
+
+
+class TestTagSearch(unittest.TestCase):
+    """Testa a busca de membros (índice FTS5, paginação por chave e totais)."""
+
+    def setUp(self):
+        self.db = SQLiteDatabase(db_file=":memory:")
+        self.db.import_tags([(f"T{i:04d}", f"Membro {i}", None) for i in range(250)])
+        self.db.add_tag("04A1B2", "José da Silva")
+        self.db.add_tag("04A1B3", "Alice Souza")
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_prefix_words_in_name_and_id(self):
+        self.assertEqual([u['tag_id'] for u in self.db.search_tags("jose sil")], ["04A1B2"])
+        self.assertEqual([u['name'] for u in self.db.search_tags("ALI")], ["Alice Souza"])
+        self.assertEqual(self.db.count_tags("04a1"), 2)
+        self.assertEqual(self.db.count_tags("membro 12"), 11)  # 12, 120-129
+        self.assertEqual(self.db.count_tags(""), 252)
+        self.assertEqual(self.db.search_tags('"; DROP'), [])
+
+    def test_index_follows_edits(self):
+        self.db.update_tag("04A1B3", "Alicia Pereira")
+        self.assertEqual(self.db.count_tags("souza"), 0)
+        self.assertEqual(self.db.count_tags("pereira"), 1)
+        ok, _ = self.db.remove_tag("04A1B2")
+        self.assertTrue(ok)
+        self.assertEqual(self.db.count_tags("jose"), 0)
+        ok, _ = self.db.remove_tag("04A1B2")
+        self.assertFalse(ok)
+
+    def test_keyset_pages_cover_everything_once(self):
+        for text in ("", "membro"):
+            seen, before = [], None
+            while True:
+                page = self.db.search_tags(text, 40, before=before)
+                seen += [u['tag_id'] for u in page]
+                if len(page) < 40:
+                    break
+                before = page[-1]['rowid']
+            self.assertEqual(len(seen), self.db.count_tags(text))
+            self.assertEqual(len(set(seen)), len(seen))
+        # Newest first.
+        self.assertEqual(self.db.search_tags(limit=1)[0]['tag_id'], "04A1B3")
+
+    def test_like_fallback(self):
+        from tap.model import search
+        with self.db.lock:
+            self.db.conn.execute("DROP TABLE tags_search")
+            for name in ("insert", "update", "delete"):
+                self.db.conn.execute(f"DROP TRIGGER tags_search_{name}")
+        self.assertFalse(search.available(self.db.conn))
+        self.assertEqual([u['tag_id'] for u in self.db.search_tags("Silva")], ["04A1B2"])
+        self.assertEqual(self.db.count_tags("membro 12"), 11)
+
+
+class TestCompactHistoryMigration(unittest.TestCase):
+    """Testa a migração do histórico legado (texto) para o esquema compacto."""
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        conn = sqlite3.connect(self.tmp.name)
+        conn.execute('''
+            CREATE TABLE history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tag_id TEXT, name TEXT, timestamp TEXT, display_date TEXT, display_time TEXT
+            )
+        ''')
+        conn.executemany(
+            "INSERT INTO history (tag_id, name, timestamp, display_date, display_time) VALUES (?, ?, ?, ?, ?)",
+            [(f"T{i % 3}", f"User{i % 3}", f"2025-03-0{i % 9 + 1} 12:30:00", "", "") for i in range(25)],
+        )
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+    def test_open_migrates_legacy_history(self):
+        db = SQLiteDatabase(db_file=self.tmp.name)
+        try:
+            entries = db.get_history_entries()
+            self.assertEqual(len(entries), 25)
+            self.assertEqual(entries[0]["id"], 25)
+            self.assertEqual(entries[0]["name"], "User0")
+            self.assertEqual(entries[0]["timestamp"], "2025-03-07 12:30:00")
+            self.assertEqual(entries[0]["display_date"], "07/03/2025")
+            self.assertEqual(entries[0]["display_time"], "12:30:00")
+            self.assertNotIn("display_date", migrations.columns(db.conn, "history"))
+            self.assertEqual(db.pool.pragma("user_version"), migrations.SCHEMA_VERSION)
+            # New rows continue after the migrated ids.
+            db.add_history_entry("T1", "User1")
+            self.assertEqual(db.get_history_entries()[0]["id"], 26)
+        finally:
+            db.close()
+
+    def test_batched_migration_is_resumable(self):
+        pool = ConnectionManager(self.tmp.name)
+        batches = []
+        with pool.write() as conn:
+            conn.execute(migrations.NAMES_TABLE)
+            conn.execute(migrations.HISTORY_TABLE.format(table="history_compact"))
+            # An earlier run that stopped after the first ten rows.
+            conn.execute("INSERT INTO history_compact (id, tag_id, ts) SELECT id, tag_id, 0 FROM history WHERE id <= 10")
+            conn.commit()
+        copied = migrations.migrate_history(pool, batch_size=4, progress=batches.append)
+        self.assertEqual(copied, 15)
+        self.assertEqual(batches, [4, 8, 12, 15])
+        count = pool.writer.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+        self.assertEqual(count, 25)
+        self.assertEqual(migrations.migrate_history(pool), 0)
+        pool.close()
+
 
 class TestImports(unittest.TestCase):
     """Verifica que os imports do pacote funcionam."""
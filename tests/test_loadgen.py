@@ -0,0 +1,74 @@
+"""
+Hack-n-TAP — Load Generator Tests
+Testes do gerador de carga (fluxo sintético pelo simulador de válvula).
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tap import loadgen
+
+try:
+    import serial  # noqa: F401
+    HAS_SERIAL = True
+except ImportError:
+    HAS_SERIAL = False
+
+
+class TestStreams(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_synthetic_is_reproducible(self):
+        tags = ["A", "B", "C"]
+        stream = loadgen.synthetic_stream(tags, 50, rate=10, invalid=0.2, duplicates=0.3, seed=3)
+        self.assertEqual(stream, loadgen.synthetic_stream(tags, 50, rate=10, invalid=0.2,
+                                                          duplicates=0.3, seed=3))
+        self.assertEqual(len(stream), 50)
+        self.assertEqual([t for t, _ in stream], sorted(t for t, _ in stream))
+        self.assertTrue(any(tag not in tags for _, tag in stream))
+
+    def test_recorded_round_trip(self):
+        path = os.path.join(self.dir, "stream.csv")
+        loadgen.write_stream(path, [(0.0, "A"), (1.5, "B")])
+        self.assertEqual(loadgen.read_stream(path), [(0.0, "A"), (1.5, "B")])
+
+        path = os.path.join(self.dir, "stream.jsonl")
+        with open(path, "w") as f:
+            f.write('{"time": 100.5, "tag_id": "B"}\n{"time": 100, "tag_id": "A"}\n')
+        self.assertEqual(loadgen.read_stream(path), [(0.0, "A"), (0.5, "B")])
+
+    def test_valve_timings(self):
+        commands = [("1", 1.0), ("1", 1.1), ("0", 2.0), ("0", 2.1), ("1", 3.0), ("0", 3.5)]
+        self.assertEqual(loadgen.valve_timings(commands), [1.0, 0.5])
+
+
+@unittest.skipUnless(HAS_SERIAL and hasattr(os, "openpty"), "needs pyserial and a pty")
+class TestReplay(unittest.TestCase):
+
+    def test_replay_through_simulator(self):
+        directory = tempfile.mkdtemp()
+        try:
+            db_file = loadgen.scratch_db(directory, tags=3)
+            tags = [f"LOADGEN{i:06d}" for i in range(3)]
+            stream = [(0.0, tags[0]), (0.01, tags[0]), (0.02, tags[1]), (0.03, "UNKNOWN"),
+                      (0.3, tags[2])]
+            report = loadgen.run(db_file, stream, pour_seconds=0.05)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.assertEqual(report["reads_seen"], 4)  # the repeated read is debounced
+        self.assertEqual(report["denied"], 1)
+        self.assertEqual(report["pours"], 3)
+        self.assertEqual(report["unfinished"], 0)
+        self.assertEqual(report["valve_error"]["n"], 3)
+        self.assertLess(abs(report["mean_valve_error_ms"]), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
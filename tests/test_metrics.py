@@ -0,0 +1,119 @@
+"""
+Hack-n-TAP — Metrics Tests
+Testes dos histogramas/contadores e da exportação no formato Prometheus.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+import urllib.request
+
+from tap import metrics
+from tap.engine import ValidationEngine
+from tap.model.database import SQLiteDatabase
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = metrics.Registry()
+        h = registry.histogram("x_seconds", "X.", ("tap",), buckets=(0.1, 1.0)).labels("bar")
+        for value in (0.05, 0.1, 0.5, 3.0):
+            h.observe(value)
+        text = registry.render()
+        self.assertIn('x_seconds_bucket{tap="bar",le="0.1"} 2', text)
+        self.assertIn('x_seconds_bucket{tap="bar",le="1.0"} 3', text)
+        self.assertIn('x_seconds_bucket{tap="bar",le="+Inf"} 4', text)
+        self.assertIn('x_seconds_count{tap="bar"} 4', text)
+        self.assertIn('x_seconds_sum{tap="bar"} 3.65', text)
+        self.assertIn("# TYPE x_seconds histogram", text)
+
+    def test_counter_labels_escaped(self):
+        registry = metrics.Registry()
+        registry.counter("c_total", "C.", ("tap",)).labels('a"b').inc(2)
+        self.assertIn('c_total{tap="a\\"b"} 2', registry.render())
+
+    def test_type_conflict(self):
+        registry = metrics.Registry()
+        registry.counter("m", "M.")
+        with self.assertRaises(ValueError):
+            registry.histogram("m", "M.")
+
+    def test_observe_is_cheap(self):
+        h = metrics.Registry().histogram("y_seconds", "Y.").labels()
+        start = time.perf_counter()
+        for _ in range(100_000):
+            h.observe(0.0003)
+        self.assertLess((time.perf_counter() - start) / 100_000, 5e-6)
+
+
+class TestExport(unittest.TestCase):
+
+    def test_http_and_textfile(self):
+        registry = metrics.Registry()
+        registry.counter("tap_reads_total", "Reads.").labels().inc()
+        server = metrics.serve_http(0, registry=registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/metrics"
+            body = urllib.request.urlopen(url, timeout=5).read().decode()
+            self.assertIn("tap_reads_total 1", body)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tap.prom")
+            metrics.write_textfile(path, registry)
+            with open(path, encoding="utf-8") as f:
+                self.assertIn("tap_reads_total 1", f.read())
+
+
+class TestEngineInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+        self.db.add_tag("T1", "Alice")
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+    def test_stages_recorded(self):
+        m = metrics.EngineMetrics("test", registry=metrics.Registry())
+        commands = []
+
+        def send(command):
+            commands.append(command)
+            if command == '0':
+                raise OSError("unplugged")
+
+        engine = ValidationEngine(self.db, send, pour_seconds=0.02, ui_interval=0.01, metrics=m)
+
+        async def scenario():
+            runner = asyncio.ensure_future(engine.run())
+            await asyncio.sleep(0)
+            engine.submit("T1")
+            engine.submit("NOPE")
+            await asyncio.sleep(0.1)
+            engine.stop()
+            await runner
+
+        asyncio.run(scenario())
+        self.assertEqual((m.reads.value, m.granted.value, m.denied.value, m.pours.value), (2, 1, 1, 1))
+        self.assertEqual(m.lookup.count, 2)
+        self.assertEqual(m.read_to_open.count, 1)
+        self.assertEqual(m.valve_open.count, 1)
+        self.assertEqual(m.history.count, 1)
+        self.assertEqual(m.pour.count, 1)
+        self.assertEqual(m.serial_errors.value, 1)
+        self.assertEqual(m.valve_close.count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
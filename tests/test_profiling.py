@@ -0,0 +1,98 @@
+"""
+Hack-n-TAP — Profiling Tests
+Testes do modo --profile: sessões do cProfile, memória e tempo por instrução SQL no pacote de relatório.
+"""
+
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import unittest
+
+from tap import profiling
+from tap.model import pool
+from tap.model.database import SQLiteDatabase
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_values_become_placeholders(self):
+        self.assertEqual(profiling.fingerprint("SELECT name FROM tags WHERE id = 'it''s'"),
+                         "SELECT name FROM tags WHERE id = ?")
+        self.assertEqual(profiling.fingerprint("INSERT INTO t VALUES (1, -2.5, X'00ff')"),
+                         "INSERT INTO t VALUES (?, ...)")
+        self.assertEqual(profiling.fingerprint("SELECT * FROM t2 WHERE a = :a\n  AND b = ?"),
+                         "SELECT * FROM t2 WHERE a = ? AND b = ?")
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.profiler = profiling.Profiler(self.dir).start()
+
+    def tearDown(self):
+        if self.profiler._previous_factory is not None:
+            self.profiler.close()
+        shutil.rmtree(self.dir)
+
+    def test_bundle(self):
+        self.profiler.toggle()
+        db = SQLiteDatabase(os.path.join(self.dir, "tap.db"))
+        try:
+            db.add_tag("T1", "Alice")
+            for _ in range(3):
+                db.validate_tag("T1")
+        finally:
+            db.close()
+        self.profiler.toggle()
+        archive = self.profiler.close()
+
+        self.assertIs(pool.connection_factory, sqlite3.Connection)
+        files = set(os.listdir(self.profiler.path))
+        self.assertTrue({"profile-1.txt", "profile-1.pstats", "memory-1.txt", "memory.txt",
+                         "sql.txt", "meta.json"} <= files)
+        with open(os.path.join(self.profiler.path, "profile-1.txt")) as f:
+            self.assertIn("validate_tag", f.read())
+        with open(os.path.join(self.profiler.path, "sql.txt")) as f:
+            sql = f.read()
+        self.assertIn("FROM tags", sql)
+        self.assertNotIn("Alice", sql)
+        with tarfile.open(archive) as tar:
+            self.assertIn(f"{self.profiler.stamp}/sql.txt", tar.getnames())
+
+    def test_engine_thread_is_profiled(self):
+        def engine_thread_work():
+            return sum(range(1000))
+
+        self.profiler.toggle()
+        thread = threading.Thread(target=self.profiler.thread(engine_thread_work))
+        thread.start()
+        thread.join()
+        self.profiler.toggle()
+        with open(os.path.join(self.profiler.path, "profile-1.txt")) as f:
+            self.assertIn("engine_thread_work", f.read())
+
+        # Finished outside any session: written as a last one at exit.
+        thread = threading.Thread(target=self.profiler.thread(engine_thread_work))
+        thread.start()
+        thread.join()
+        self.profiler.close()
+        with open(os.path.join(self.profiler.path, "profile-2.txt")) as f:
+            self.assertIn("engine_thread_work", f.read())
+
+    def test_statement_timing(self):
+        stats = self.profiler.sql
+        conn = sqlite3.connect(":memory:", factory=pool.connection_factory)
+        conn.execute("CREATE TABLE t (a)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(1,), (2,)])
+        self.assertEqual(len(conn.execute("SELECT a FROM t WHERE a > ?", (0,)).fetchall()), 2)
+        conn.close()
+        self.assertEqual(stats.timings["SELECT a FROM t WHERE a > ?"][0], 2)  # execute + fetchall
+        self.assertEqual(stats.traced["INSERT INTO t VALUES (?)"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
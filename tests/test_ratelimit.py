@@ -0,0 +1,106 @@
+"""
+Hack-n-TAP — Rate Limit Tests
+Testes do limitador por tag e da cota diária (memória + snapshot).
+"""
+
+import os
+import tempfile
+import unittest
+
+from tap.model.database import SQLiteDatabase
+from tap.ratelimit import QUOTA, RATE, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.day = "2025-01-01"
+
+    def __call__(self):
+        return self.now
+
+    def today(self):
+        return self.day
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiter(self, per_minute=0, daily_quota=0):
+        return RateLimiter(per_minute, daily_quota, clock=self.clock, today=self.clock.today)
+
+    def test_token_bucket(self):
+        limiter = self.limiter(per_minute=3)
+        self.assertEqual([limiter.acquire("T1") for _ in range(4)], [None, None, None, RATE])
+        self.assertIsNone(limiter.acquire("T2"))
+        self.clock.now += 20  # one token back
+        self.assertIsNone(limiter.acquire("T1"))
+        self.assertEqual(limiter.acquire("T1"), RATE)
+
+    def test_daily_quota(self):
+        limiter = self.limiter(daily_quota=2)
+        self.assertEqual([limiter.acquire("T1") for _ in range(3)], [None, None, QUOTA])
+        limiter.refund("T1")
+        self.assertIsNone(limiter.acquire("T1"))
+        self.clock.day = "2025-01-02"
+        self.assertEqual(limiter.doses_today("T1"), 0)
+        self.assertIsNone(limiter.acquire("T1"))
+
+    def test_disabled(self):
+        limiter = self.limiter()
+        self.assertFalse(limiter.enabled)
+        self.assertTrue(all(limiter.acquire("T1") is None for _ in range(1000)))
+
+    def test_full_buckets_are_pruned(self):
+        limiter = self.limiter(per_minute=60)
+        for i in range(100):
+            limiter.acquire(f"T{i}")
+        self.clock.now += 120
+        limiter.acquire("X")
+        self.assertEqual(list(limiter._buckets), ["X"])
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+    def limiter(self):
+        return RateLimiter(2, 3, clock=self.clock, today=self.clock.today)
+
+    def test_restart_keeps_limits(self):
+        before = self.limiter().start_snapshots(self.db, interval=60)
+        before.acquire("T1")
+        before.acquire("T1")
+        before.close()
+
+        after = self.limiter()
+        self.assertEqual(after.load(self.db), 1)
+        self.assertEqual(after.acquire("T1"), RATE)
+        self.assertEqual(after.doses_today("T1"), 2)
+
+    def test_yesterday_doses_dropped(self):
+        before = self.limiter()
+        before.acquire("T1")
+        before.save(self.db)
+        self.clock.day = "2025-01-02"
+        self.clock.now += 3600
+        after = self.limiter()
+        after.load(self.db)
+        self.assertEqual(after.doses_today("T1"), 0)
+        self.assertIsNone(after.acquire("T1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Hack-n-TAP — Reader Tests
+Testes de enquadramento, debounce e da thread do leitor serial.
+"""
+
+import queue
+import unittest
+
+import serial
+
+from tap.reader import (
+    Debouncer, FixedLengthFraming, LineFraming, SerialTagReader, StxEtxFraming, make_framing,
+)
+
+
+class TestFraming(unittest.TestCase):
+
+    def test_line_framing_across_chunks(self):
+        f = LineFraming()
+        self.assertEqual(f.feed(b"ABC1"), [])
+        self.assertEqual(f.feed(b"23\r\nDEF456\r\nGH"), ["ABC123", "DEF456"])
+        self.assertEqual(f.feed(b"I\n"), ["GHI"])
+
+    def test_stx_etx_framing_skips_noise(self):
+        f = StxEtxFraming()
+        self.assertEqual(f.feed(b"xx\x02ABC\x03yy\x02DE"), ["ABC"])
+        self.assertEqual(f.feed(b"F\x03"), ["DEF"])
+        # Truncated frame: the second STX starts over.
+        self.assertEqual(f.feed(b"\x02BAD\x02GOOD\x03"), ["GOOD"])
+
+    def test_fixed_length_framing(self):
+        f = FixedLengthFraming(4)
+        self.assertEqual(f.feed(b"AAAABB"), ["AAAA"])
+        self.assertEqual(f.feed(b"BBCCCC"), ["BBBB", "CCCC"])
+
+    def test_unknown_framing(self):
+        with self.assertRaises(ValueError):
+            make_framing("morse")
+
+
+class TestDebouncer(unittest.TestCase):
+
+    def test_repeated_reads_dropped_within_window(self):
+        now = [0.0]
+        d = Debouncer(window=1.0, clock=lambda: now[0])
+        self.assertTrue(d.accept("T1"))
+        now[0] = 0.5
+        self.assertFalse(d.accept("T1"))
+        self.assertTrue(d.accept("T2"))
+        now[0] = 1.2
+        # Still held on the reader: the last read was 0.7 s ago.
+        self.assertFalse(d.accept("T1"))
+        now[0] = 2.5
+        self.assertTrue(d.accept("T1"))
+        self.assertEqual(d.dropped, 2)
+
+
+class TestSerialTagReader(unittest.TestCase):
+
+    def test_reader_thread_delivers_debounced_tags(self):
+        conn = serial.serial_for_url("loop://", timeout=0.05)
+        tags = queue.Queue()
+        reader = SerialTagReader(conn, tags.put, framing=LineFraming(), debouncer=Debouncer(5.0))
+        reader.start()
+        try:
+            conn.write(b"T1\n" * 50 + b"T2\n")
+            self.assertEqual(tags.get(timeout=2), "T1")
+            self.assertEqual(tags.get(timeout=2), "T2")
+            self.assertTrue(tags.empty())
+        finally:
+            reader.stop()
+            conn.close()
+        self.assertEqual(reader.frames, 51)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Hack-n-TAP — Report Tests
+Testes dos agregados de consumo (rollups) e da API de relatórios.
+"""
+
+import csv
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from tap.model.database import SQLiteDatabase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class RollupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+        self.db.add_tag("T1", "Alice")
+        self.db.add_tag("T2", "Bob")
+        self.db.add_history_entries([
+            ("T1", "Alice", int(datetime(2025, 3, 1, 18, 5).timestamp())),
+            ("T1", "Alice", int(datetime(2025, 3, 1, 18, 40).timestamp())),
+            ("T2", "Bob", int(datetime(2025, 3, 1, 21, 0).timestamp())),
+            ("T1", "Alice", int(datetime(2025, 3, 2, 9, 0).timestamp())),
+            ("T2", "Bob", int(datetime(2025, 4, 1, 18, 0).timestamp())),
+        ])
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+
+class TestRollups(RollupTestCase):
+
+    def test_inserts_update_rollups(self):
+        hours = {b: n for b, t, n in self.db.get_rollups("hour")}
+        self.assertEqual(hours["2025-03-01 18"], 2)
+        months = {(b, t): n for b, t, n in self.db.get_rollups("month")}
+        self.assertEqual(months, {("2025-03", "T1"): 3, ("2025-03", "T2"): 1, ("2025-04", "T2"): 1})
+
+    def test_rebuild_matches_incremental(self):
+        before = {g: self.db.get_rollups(g) for g in ("hour", "day", "month")}
+        self.db.rebuild_rollups()
+        for grain, rows in before.items():
+            self.assertEqual([tuple(r) for r in self.db.get_rollups(grain)], [tuple(r) for r in rows])
+
+    def test_date_range(self):
+        days = self.db.get_rollups("day", since="2025-03-02", until="2025-04-01")
+        self.assertEqual([tuple(r) for r in days], [("2025-03-02", "T1", 1)])
+
+
+@unittest.skipUnless(numpy, "numpy não instalado")
+class TestReport(RollupTestCase):
+
+    def test_user_totals(self):
+        from tap import report
+        totals = report.user_totals(self.db)
+        self.assertEqual([(r["name"], r["pours"]) for r in totals], [("Alice", 3), ("Bob", 2)])
+        march = report.user_totals(self.db, since="2025-03-01", until="2025-04-01")
+        self.assertEqual([r["pours"] for r in march], [3, 1])
+        second = report.user_totals(self.db, since="2025-03-02", until="2025-04-02")
+        self.assertEqual([(r["name"], r["pours"]) for r in second], [("Alice", 1), ("Bob", 1)])
+
+    def test_peak_hours(self):
+        from tap import report
+        hours = report.peak_hours(self.db)
+        self.assertEqual(len(hours), 24)
+        self.assertEqual(int(hours[18]), 3)
+        self.assertEqual(int(hours.sum()), 5)
+
+    def test_csv_output(self):
+        from tap import report
+        path = self.tmp.name + ".csv"
+        try:
+            report.write_csv(path, report.user_totals(self.db))
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(rows[0], {"tag_id": "T1", "name": "Alice", "pours": "3"})
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
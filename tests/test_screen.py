@@ -0,0 +1,117 @@
+"""
+Hack-n-TAP — Screen Tests
+Testes do desenho em buffer: só as linhas alteradas vão ao terminal, numa única escrita.
+"""
+
+import io
+import os
+import unittest
+from unittest import mock
+
+from tap import screen as screen_module
+from tap.screen import Screen, visible_width
+
+
+class Output(io.StringIO):
+    """Counts the writes reaching the terminal."""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append(text)
+        return super().write(text)
+
+
+SIZE = os.terminal_size((80, 24))
+
+
+class TestScreen(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(screen_module, "terminal_size", return_value=SIZE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.out = Output()
+        self.screen = Screen(self.out, ansi=True)
+
+    def draw(self, lines):
+        self.screen.clear()
+        self.screen.extend(lines)
+        self.out.writes.clear()
+        self.screen.flush()
+        return "".join(self.out.writes)
+
+    def test_first_flush_repaints_everything(self):
+        written = self.draw(["a", "b"])
+        self.assertEqual(len(self.out.writes), 1)
+        self.assertTrue(written.startswith("\033[H\033[2J"))
+        self.assertIn("\033[1;1Ha\033[K", written)
+        self.assertIn("\033[2;1Hb\033[K", written)
+
+    def test_only_changed_lines_are_rewritten(self):
+        self.draw(["header", "  3.0s", "footer"])
+        written = self.draw(["header", "  2.9s", "footer"])
+        self.assertEqual(len(self.out.writes), 1)
+        self.assertIn("\033[2;1H  2.9s\033[K", written)
+        self.assertNotIn("header", written)
+        self.assertNotIn("footer", written)
+        self.assertNotIn("\033[2J", written)
+
+    def test_unchanged_frame_writes_nothing(self):
+        self.draw(["a", "b"])
+        self.assertEqual(self.draw(["a", "b"]), "")
+
+    def test_shorter_frame_erases_below(self):
+        self.draw(["a", "b", "c"])
+        written = self.draw(["a"])
+        self.assertIn("\033[2;1H\033[J", written)
+
+    def test_region_keeps_its_height(self):
+        self.draw(["top", "x", "y", "bottom"])
+        self.screen.region(1, 2, ["z"])
+        self.assertEqual(self.screen.lines, ["top", "z", "", "bottom"])
+
+    def test_resize_repaints(self):
+        self.draw(["a"])
+        self.screen.invalidate()
+        self.assertIn("\033[2J", self.draw(["a"]))
+
+    def test_ask_keeps_or_drops_the_line(self):
+        self.draw(["menu"])
+        self.assertEqual(self.screen.ask("Opção › ", read=lambda _: "2"), "2")
+        self.assertEqual(self.screen.lines, ["menu", "Opção › 2"])
+        self.screen.ask("Tag › ", read=lambda _: "T1", keep=False)
+        self.assertEqual(self.screen.lines, ["menu", "Opção › 2"])
+
+    def test_flush_while_asking_restores_the_cursor(self):
+        def read(_):
+            self.screen.region(0, 1, ["changed"])
+            self.out.writes.clear()
+            self.screen.flush()
+            return ""
+
+        self.draw(["menu"])
+        self.screen.ask("› ", read=read)
+        written = "".join(self.out.writes)
+        self.assertTrue(written.startswith("\0337") and written.endswith("\0338"))
+
+    def test_plain_output_has_no_escapes(self):
+        out = Output()
+        plain = Screen(out, ansi=False)
+        plain.extend(["\033[1mtitle\033[0m", "body"])
+        plain.flush()
+        self.assertEqual(out.getvalue(), "title\nbody\n")
+
+
+class TestVisibleWidth(unittest.TestCase):
+
+    def test_ignores_escapes(self):
+        self.assertEqual(visible_width("abc"), 3)
+        self.assertEqual(visible_width("\033[1m\033[92mabc\033[0m"), 3)
+        self.assertEqual(visible_width("✔ ok"), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Hack-n-TAP — Tag Snapshot Tests
+Testes do snapshot binário de tags (mmap + busca binária) e do modo degradado.
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from tap.model.database import SQLiteDatabase
+from tap.model.history import HistoryWriter
+from tap.model.snapshot import DatabaseUnavailable, FailoverDatabase, TagSnapshot, write_snapshot
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestTagSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix="-tags")
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_lookup(self):
+        rows = sorted([(f"T{i:05d}", f"User {i}", "2025-01-01 10:00:00") for i in range(1000)])
+        rows.append(("ÜNÏ", "Zoë", None))
+        self.assertEqual(write_snapshot(self.path, rows, 7), 1001)
+        snapshot = TagSnapshot(self.path)
+        self.assertEqual((len(snapshot), snapshot.version), (1001, 7))
+        self.assertEqual(snapshot.get("T00042"), {'name': "User 42", 'registered_at': "2025-01-01 10:00:00"})
+        self.assertEqual(snapshot.get("T00999")["name"], "User 999")
+        self.assertEqual(snapshot.get("ÜNÏ"), {'name': "Zoë", 'registered_at': None})
+        self.assertIsNone(snapshot.get("T1"))
+        self.assertIsNone(snapshot.get(""))
+        snapshot.close()
+
+    def test_empty_and_invalid_files(self):
+        write_snapshot(self.path, [], 0)
+        snapshot = TagSnapshot(self.path)
+        self.assertIsNone(snapshot.get("X"))
+        snapshot.close()
+        with open(self.path, "wb") as f:
+            f.write(b"not a snapshot at all")
+        self.assertIsNone(TagSnapshot.open(self.path))
+        self.assertIsNone(TagSnapshot.open(self.path + "-missing"))
+
+    def test_rewrite_keeps_open_map_valid(self):
+        write_snapshot(self.path, [("A", "Alice", None)], 1)
+        old = TagSnapshot(self.path)
+        write_snapshot(self.path, [("B", "Bob", None)], 2)
+        self.assertEqual(old.get("A")["name"], "Alice")
+        new = TagSnapshot(self.path)
+        self.assertIsNone(new.get("A"))
+        self.assertEqual(new.get("B")["name"], "Bob")
+        old.close()
+        new.close()
+
+
+class TestFailoverDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        db = SQLiteDatabase(db_file=self.tmp.name)
+        db.add_tag("A1", "Alice")
+        db.close()
+        write_snapshot(self.tmp.name + "-tags", [("A1", "Alice", None)], 0)
+        self.broken = True
+
+    def tearDown(self):
+        for suffix in ("", "-tags", "-spill", "-wal", "-shm"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+    def opener(self, path):
+        if self.broken:
+            raise sqlite3.OperationalError("disk I/O error")
+        return SQLiteDatabase(db_file=path)
+
+    def open(self):
+        db = FailoverDatabase(self.tmp.name, retry_seconds=0.05, check_interval=0.05, opener=self.opener)
+        self.addCleanup(db.close)
+        return db.open()
+
+    def test_validates_from_snapshot_until_database_opens(self):
+        db = self.open()
+        self.assertTrue(db.degraded)
+        self.assertEqual(db.validate_tag("A1")["name"], "Alice")
+        self.assertIsNone(db.validate_tag("B2"))
+        with self.assertRaises(DatabaseUnavailable):
+            db.get_all_tags()
+
+        self.broken = False
+        self.assertTrue(db.ready.wait(3))
+        self.assertFalse(db.degraded)
+        db.add_tag("B2", "Bob")
+        self.assertTrue(wait_for(lambda: db.snapshot.get("B2") is not None))
+        self.assertEqual(TagSnapshot(self.tmp.name + "-tags").get("B2")["name"], "Bob")
+
+    def test_history_waits_in_spill_until_database_recovers(self):
+        # A crash left "Carol" in the spill file only.
+        db = SQLiteDatabase(db_file=self.tmp.name)
+        writer = HistoryWriter(db, batch_size=2, flush_interval=3600)
+        writer.start()
+        for name in ("Alice", "Bob", "Carol"):
+            writer.submit("A1", name)
+        while writer.written < 2:
+            writer.join(0.01)
+        writer.spill.close()
+        db.close()
+
+        failover = self.open()
+        writer = HistoryWriter(failover, flush_interval=0.05)
+        writer.start()
+        writer.submit("A1", "Dave")
+        writer.flush()
+        self.assertEqual(writer.written, 0)
+
+        self.broken = False
+        self.assertTrue(failover.ready.wait(3))
+        self.assertTrue(wait_for(lambda: writer.written == 1))
+        writer.close()
+        self.assertEqual(writer.recovered, 1)
+        names = [e["name"] for e in failover.get_history_entries()]
+        self.assertEqual(names, ["Dave", "Carol", "Bob", "Alice"])
+        self.assertFalse(os.path.exists(self.tmp.name + "-spill"))
+
+
+if __name__ == "__main__":
+    unittest.main()
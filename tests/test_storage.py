@@ -0,0 +1,157 @@
+"""
+Hack-n-TAP — Storage Engine Tests
+Testes do contrato comum aos motores de armazenamento (SQLite, memória e servidor remoto).
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from tap import config
+from tap.model import storage
+from tap.model.database import SQLiteDatabase
+from tap.model.history import HistoryWriter
+from tap.model.memory import MemoryStorage
+from tap.model.remote import RemoteStorage, RemoteUnavailable
+
+
+class StorageContract:
+    """Run against every engine by the subclasses below."""
+
+    def open(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = self.open()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def test_tags(self):
+        self.assertEqual(self.db.add_tag("T1", "Alice Silva"), (True, "Tag cadastrada com sucesso!"))
+        self.assertFalse(self.db.add_tag("T1", "Outra")[0])
+        self.assertEqual(self.db.validate_tag("T1")['name'], "Alice Silva")
+        self.assertIsNone(self.db.validate_tag("T9"))
+        self.assertTrue(self.db.update_tag("T1", "Alice Souza")[0])
+        self.assertEqual(self.db.validate_tag("T1")['name'], "Alice Souza")
+        self.assertEqual(self.db.update_tag("T9", "X"), (False, "Tag não encontrada!"))
+        self.assertEqual(self.db.remove_tag("T9"), (False, "Tag não encontrada!"))
+        self.assertTrue(self.db.remove_tag("T1")[0])
+        self.assertIsNone(self.db.validate_tag("T1"))
+        self.assertEqual(self.db.get_all_tags(), {})
+
+    def test_search_pages_newest_first(self):
+        for i in range(5):
+            self.db.add_tag(f"T{i}", f"Member {i}")
+        self.db.add_tag("X1", "Alice Silva")
+        self.assertEqual([t['tag_id'] for t in self.db.search_tags("sil")], ["X1"])
+        first = self.db.search_tags("member", limit=3)
+        self.assertEqual([t['tag_id'] for t in first], ["T4", "T3", "T2"])
+        rest = self.db.search_tags("member", limit=3, before=first[-1]['rowid'])
+        self.assertEqual([t['tag_id'] for t in rest], ["T1", "T0"])
+        self.assertEqual(self.db.count_tags("member"), 5)
+        self.assertEqual(self.db.count_tags(), 6)
+
+    def test_import_and_export(self):
+        self.db.add_tag("A", "Alice", "2024-01-01 00:00:00")
+        counts = self.db.import_tags([("A", "Alice", None), ("B", "Bob", None), ("B", "Bobby", "2024-02-01 00:00:00"),
+                                      ("", "nobody", None), ("C", "Carla", None)], chunk_size=2)
+        self.assertEqual(counts, {'inserted': 2, 'updated': 1, 'unchanged': 1, 'rejected': 1})
+        exported = list(self.db.export_tags(batch_size=2))
+        self.assertEqual([row[:2] for row in exported], [("A", "Alice"), ("B", "Bobby"), ("C", "Carla")])
+        self.assertEqual(exported[0][2], "2024-01-01 00:00:00")
+        self.assertEqual(exported[1][2], "2024-02-01 00:00:00")
+
+    def test_import_past_the_sqlite_variable_limit(self):
+        conn = getattr(self.db, "conn", None)
+        if isinstance(conn, sqlite3.Connection):
+            conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)  # SQLite < 3.32
+        rows = [(f"T{i:04d}", f"User {i}", "2024-01-01 00:00:00") for i in range(2000)]
+        source = MemoryStorage()
+        source.import_tags(rows)
+        self.assertEqual(storage.copy(source, self.db), (2000, 0))
+        self.assertEqual(self.db.import_tags(rows, chunk_size=2000)['unchanged'], 2000)
+
+    def test_history(self):
+        self.db.add_history_entries([("T1", "Alice", 1700000000, None), ("T2", "Bob", 1700000100, "bar")],
+                                    spill=("gen", 42))
+        self.db.add_history_entry("T1", "Alice", timestamp=1700000200, ml=310.5)
+        self.assertEqual(self.db.history_spill_state(), ("gen", 42))
+        entries = self.db.get_history_entries()
+        self.assertEqual([e['ts'] for e in entries], [1700000200, 1700000100, 1700000000])
+        self.assertEqual([e['ml'] for e in entries], [310.5, None, None])
+        page = self.db.get_history_page(1, before_id=entries[0]['id'])
+        self.assertEqual(page[0]['name'], "Bob")
+        self.assertEqual([e['tap'] for e in self.db.get_history_page(tap="bar")], ["bar"])
+        self.assertEqual(len(self.db.get_history_page(tag_id="T1", since=1700000100)), 1)
+        self.assertEqual(len(list(self.db.iter_history(page_size=1, name="Alice"))), 2)
+        after = self.db.history_after(entries[-1]['id'], 10)
+        self.assertEqual([row[1] for row in after], ["T2", "T1"])
+
+    def test_copy_between_engines(self):
+        self.db.add_tag("T1", "Alice")
+        self.db.add_history_entries([("T1", "Alice", 1700000000 + i, None) for i in range(7)])
+        target = MemoryStorage()
+        self.assertEqual(storage.copy(self.db, target, batch_size=3), (1, 7))
+        self.assertEqual(target.validate_tag("T1")['name'], "Alice")
+        self.assertEqual([e['ts'] for e in target.get_history_entries()],
+                         [e['ts'] for e in self.db.get_history_entries()])
+
+
+class TestSQLiteStorage(StorageContract, unittest.TestCase):
+
+    def open(self):
+        return SQLiteDatabase(os.path.join(self.dir, "tap.db"))
+
+
+class TestMemoryStorage(StorageContract, unittest.TestCase):
+
+    def open(self):
+        return MemoryStorage()
+
+
+class TestRemoteStorage(StorageContract, unittest.TestCase):
+
+    def open(self):
+        return RemoteStorage("sqlite:///" + os.path.join(self.dir, "central.db"))
+
+    def test_reconnects_after_failure(self):
+        self.db.add_tag("T1", "Alice")
+        live, self.db.conn = self.db.conn, mock.Mock()
+        self.db.conn.cursor.side_effect = sqlite3.OperationalError("server has gone away")
+        self.addCleanup(live.close)
+        self.assertIsNone(self.db.validate_tag("T1"))  # refused, not raised
+        self.assertEqual(self.db.validate_tag("T1")['name'], "Alice")
+
+    def test_history_writer_spills_while_unreachable(self):
+        writer = HistoryWriter(self.db, flush_interval=0.01)
+        writer.start()
+        with mock.patch.object(self.db, "_connection", side_effect=storage_unavailable):
+            writer.submit("T1", "Alice", timestamp=1700000000)
+            writer.flush(timeout=1)
+        writer.close(timeout=5)
+        self.assertEqual([e['tag_id'] for e in self.db.get_history_entries()], ["T1"])
+
+
+def storage_unavailable():
+    raise RemoteUnavailable("connection refused")
+
+
+class TestOpenStorage(unittest.TestCase):
+
+    def test_engine_from_config(self):
+        with mock.patch.object(config, "STORAGE", "memory"):
+            self.assertIsInstance(storage.open_storage(), MemoryStorage)
+        with self.assertRaises(ValueError):
+            storage.open_storage("oracle")
+        with self.assertRaises(ValueError):
+            storage.open_storage("remote", "ftp://host/db")
+
+
+if __name__ == "__main__":
+    unittest.main()
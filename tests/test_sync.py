@@ -0,0 +1,168 @@
+"""
+Hack-n-TAP — Sync Tests
+Testes da sincronização com o servidor central (servidor substituto local).
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from tap.central import CentralStore, make_server
+from tap.model import changelog
+from tap.model.database import SQLiteDatabase
+from tap.model.snapshot import DatabaseUnavailable
+from tap.sync import SyncClient, SyncError, Syncer
+
+
+class TestSync(unittest.TestCase):
+
+    def setUp(self):
+        self.store = CentralStore()
+        self.server = make_server(self.store, token="s3cret")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.files = []
+        self.a = self.open_db()
+        self.b = self.open_db()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.store.close()
+        for db in (self.a, self.b):
+            db.close()
+        for path in self.files:
+            for suffix in ("", "-wal", "-shm", "-spill"):
+                if os.path.exists(path + suffix):
+                    os.unlink(path + suffix)
+
+    def open_db(self):
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        tmp.close()
+        self.files.append(tmp.name)
+        return SQLiteDatabase(db_file=tmp.name)
+
+    def syncer(self, db, url=None, **options):
+        return Syncer(db, SyncClient(url or self.url, token="s3cret", timeout=2), **options)
+
+    def pending(self, db):
+        with db.pool.read() as conn:
+            return changelog.pending(conn, 100)
+
+    def test_tags_shared_between_taps(self):
+        self.a.add_tag("T1", "Alice")
+        self.a.update_tag("T1", "Alice B.")
+        self.assertEqual(self.syncer(self.a).sync_once()["tags_pushed"], 2)
+        self.assertEqual(self.pending(self.a), [])
+
+        counts = self.syncer(self.b).sync_once()
+        self.assertEqual(counts["tags_pulled"], 1)
+        self.assertEqual(self.b.validate_tag("T1")["name"], "Alice B.")
+        # Pulled changes are not pushed back as local edits.
+        self.assertEqual(self.pending(self.b), [])
+        self.assertEqual(self.syncer(self.b).sync_once()["tags_pulled"], 0)
+
+        self.b.remove_tag("T1")
+        self.syncer(self.b).sync_once()
+        self.syncer(self.a).sync_once()
+        self.assertIsNone(self.a.validate_tag("T1"))
+
+    def test_pull_keeps_concurrent_local_edits(self):
+        # Another process (``tap import`` next to ``tap serve``) edits a tag
+        # while pulled changes are being applied.
+        other = SQLiteDatabase(db_file=self.a.db_file)
+        self.addCleanup(other.close)
+        edit = threading.Thread(target=other.add_tag, args=("T9", "Zoe"))
+
+        def changes():
+            edit.start()
+            time.sleep(0.2)
+            yield ("T1", "Alice", "2024-01-01 00:00:00", False)
+
+        self.a.apply_tag_changes(changes())
+        edit.join()
+        self.assertEqual([row[1] for row in self.pending(self.a)], ["T9"])
+
+    def test_pull_is_incremental(self):
+        self.a.import_tags((f"T{i}", f"User {i}", None) for i in range(1200))
+        self.syncer(self.a).sync_once()
+        self.assertEqual(self.syncer(self.b, batch_size=500).pull_tags(), 1200)
+        self.a.add_tag("NEW", "Newcomer")
+        self.syncer(self.a).sync_once()
+        with self.b.pool.read() as conn:
+            since = int(changelog.get_state(conn, "tags_seq"))
+        self.assertEqual(len(self.store.changes_since(since, 5000)["changes"]), 1)
+        self.assertEqual(self.syncer(self.b).pull_tags(), 1)
+        self.assertEqual(len(self.b.get_all_tags()), 1201)
+
+    def test_latest_edit_wins(self):
+        self.a.add_tag("T1", "Alice")
+        self.syncer(self.a).sync_once()
+        self.syncer(self.b).sync_once()
+        self.b.update_tag("T1", "Old edit")
+        time.sleep(0.01)
+        self.a.update_tag("T1", "New edit")
+        self.syncer(self.a).sync_once()
+        # B's edit is older than A's, so the server keeps A's.
+        self.syncer(self.b).sync_once()
+        self.assertEqual(self.b.validate_tag("T1")["name"], "New edit")
+
+    def test_history_pushed_once(self):
+        for i in range(5):
+            self.a.add_history_entry("T1", "Alice", timestamp=1_700_000_000 + i, tap="bar")
+        syncer = self.syncer(self.a, batch_size=2)
+        self.assertEqual(syncer.sync_once()["history_pushed"], 5)
+        self.assertEqual(syncer.sync_once()["history_pushed"], 0)
+        self.assertEqual(self.store.pour_count(), 5)
+
+        # A batch resent after a lost reply is not counted twice.
+        rows = [list(row) for row in self.a.history_after(0, 10)]
+        reply = syncer.client.push_history(syncer.node, rows)
+        self.assertEqual(reply, {"accepted": 0, "duplicates": 5})
+        self.assertEqual(self.store.pour_count(), 5)
+
+    def test_offline_keeps_backlog(self):
+        self.a.add_tag("T1", "Alice")
+        self.a.add_history_entry("T1", "Alice")
+        offline = self.syncer(self.a, url="http://127.0.0.1:9")
+        with self.assertRaises(SyncError):
+            offline.sync_once()
+        self.assertTrue(self.a.validate_tag("T1"))
+        counts = self.syncer(self.a).sync_once()
+        self.assertEqual((counts["tags_pushed"], counts["history_pushed"]), (1, 1))
+
+    def test_unavailable_database_backs_off_quietly(self):
+        # Started degraded: the database is not open yet (see FailoverDatabase).
+        syncer = self.syncer(self.a, interval=0.02)
+        with mock.patch.object(syncer, "sync_once", side_effect=DatabaseUnavailable("not open")) as sync_once, \
+                self.assertLogs("tap.sync", "WARNING") as logs:
+            syncer.start()
+            time.sleep(0.3)
+            syncer.stop(timeout=2)
+        self.assertLess(sync_once.call_count, 6)  # 0.02, 0.04, 0.08, 0.16 s apart
+        self.assertTrue(all(record.levelname == "WARNING" and not record.exc_info for record in logs.records))
+        self.assertEqual(syncer.last_error, "not open")
+
+    def test_token_required(self):
+        with self.assertRaises(SyncError):
+            Syncer(self.a, SyncClient(self.url, token="wrong", timeout=2)).sync_once()
+
+    def test_background_thread(self):
+        self.a.add_tag("T1", "Alice")
+        syncer = self.syncer(self.a, interval=0.05)
+        syncer.start()
+        try:
+            for _ in range(100):
+                if self.store.changes_since(0, 10)["changes"]:
+                    break
+                time.sleep(0.02)
+        finally:
+            syncer.stop(timeout=2)
+        self.assertEqual(self.store.changes_since(0, 10)["changes"][0][1], "T1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+Hack-n-TAP — Multi-Tap Tests
+Testes do modo com várias torneiras num único processo (sem hardware).
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from tap.model.database import SQLiteDatabase
+from tap.model.history import HistoryWriter
+from tap.taps import TapDaemon, parse_taps
+
+
+class FakeValve:
+    """Porta serial falsa; ``hang`` segura cada escrita até ser liberado."""
+
+    in_waiting = 0
+
+    def __init__(self, hang=None, fail=False):
+        self.hang = hang
+        self.fail = fail
+        self.is_open = True
+        self.writes = []
+
+    def read(self, size=1):
+        time.sleep(0.01)
+        return b""
+
+    def write(self, data):
+        if self.hang is not None:
+            self.hang.wait(5)
+        if self.fail:
+            raise OSError("write failed")
+        self.writes.append((data, time.monotonic()))
+
+    def close(self):
+        self.is_open = False
+
+
+class TestParseTaps(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_taps(" bar=/dev/ttyACM0, lab=loop:// ,"),
+                         [("bar", "/dev/ttyACM0"), ("lab", "loop://")])
+        self.assertEqual(parse_taps(""), [])
+
+    def test_invalid(self):
+        for spec in ("bar", "=/dev/x", "bar=", "a=1,a=2"):
+            with self.assertRaises(ValueError):
+                parse_taps(spec)
+
+
+class TestTapDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.tmp.close()
+        self.db = SQLiteDatabase(db_file=self.tmp.name)
+        self.db.add_tag("T1", "Alice")
+        self.db.add_tag("T2", "Bob")
+        self.history = HistoryWriter(self.db, flush_interval=0.01)
+        self.history.start()
+
+    def tearDown(self):
+        self.history.close()
+        self.db.close()
+        for suffix in ("", "-wal", "-shm", "-spill"):
+            if os.path.exists(self.tmp.name + suffix):
+                os.unlink(self.tmp.name + suffix)
+
+    def run_daemon(self, valves, reads, seconds=0.3, **options):
+        events = []
+        daemon = TapDaemon(
+            self.db, self.history, [(name, name) for name in valves],
+            on_event=lambda e, **d: events.append((e, d)),
+            opener=lambda port, baud: valves[port], pour_seconds=0.05, **options,
+        )
+        daemon.start()
+        for tap in daemon.taps:
+            self.assertTrue(tap.link.wait_connected(1))
+
+        async def scenario():
+            runner = asyncio.ensure_future(daemon.run())
+            await asyncio.sleep(0)
+            for tap, tag_id in reads:
+                daemon.submit(tag_id, tap=tap)
+            await asyncio.sleep(seconds)
+            daemon.stop()
+            await runner
+
+        asyncio.run(scenario())
+        return events
+
+    def test_history_records_tap(self):
+        valves = {"bar": FakeValve(), "lab": FakeValve()}
+        self.run_daemon(valves, [("bar", "T1"), ("lab", "T2"), ("lab", "X")])
+        self.history.flush()
+        rows = {(e['tag_id'], e['tap']) for e in self.db.get_history_entries()}
+        self.assertEqual(rows, {("T1", "bar"), ("T2", "lab")})
+        self.assertEqual([d for d, _ in valves["bar"].writes], [b"1", b"0"])
+        self.assertEqual(len(self.db.get_history_page(10, tap="lab")), 1)
+
+    def test_hung_valve_does_not_stall_other_taps(self):
+        hang = threading.Event()
+        valves = {"stuck": FakeValve(hang=hang), "ok": FakeValve()}
+        threading.Timer(0.5, hang.set).start()
+        events = self.run_daemon(valves, [("stuck", "T1"), ("ok", "T2")], seconds=0.2)
+        opened = [d['tap'] for e, d in events if e == 'open']
+        closed = [d['tap'] for e, d in events if e == 'closed']
+        self.assertEqual(opened, ["ok"])
+        self.assertEqual(closed, ["ok"])
+        self.assertEqual([d for d, _ in valves["ok"].writes], [b"1", b"0"])
+
+    def test_unavailable_port_is_retried(self):
+        attempts = []
+
+        def opener(port, baud):
+            attempts.append(port)
+            raise OSError("no such device")
+
+        daemon = TapDaemon(self.db, self.history, [("bar", "/dev/none")], opener=opener,
+                           reconnect_seconds=0.01)
+        tap = daemon["bar"]
+        daemon.start()
+        try:
+            start = time.monotonic()
+            with self.assertRaises(ConnectionError):
+                tap.link.send("1")
+            self.assertLess(time.monotonic() - start, 0.1)
+            time.sleep(0.1)
+            self.assertGreater(len(attempts), 2)
+            # A failed open is not re-applied once the valve comes back.
+            self.assertEqual(tap.link.desired, "0")
+        finally:
+            tap.close()
+
+    def test_reconnect_counted(self):
+        broken, valve = FakeValve(fail=True), FakeValve()
+        ports = [broken, valve]
+
+        tap = TapDaemon(self.db, self.history, [("recon", "/dev/x")],
+                        opener=lambda port, baud: ports.pop(0), reconnect_seconds=0.01)["recon"]
+        before = tap.metrics.reconnects.value
+        tap.start()
+        try:
+            self.assertTrue(tap.link.wait_connected(1))
+            with self.assertRaises(ConnectionError):
+                tap.link.send("0")
+            self.assertTrue(tap.link.wait_connected(1))
+            # The close requested while down is re-applied on reconnect.
+            deadline = time.monotonic() + 1
+            while not valve.writes and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(valve.writes[0][0], b"0")
+            self.assertEqual(tap.metrics.reconnects.value, before + 1)
+        finally:
+            tap.close()
+
+
+class TestServe(unittest.TestCase):
+    """Testa o modo ``tap serve`` sem terminal."""
+
+    def test_serve_does_not_import_ui_or_reports(self):
+        code = ("import sys, tap.cli, tap.serve, tap.taps, tap.model.database; "
+                "print(sorted(m for m in ('tap.main', 'tap.report', 'numpy') if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "[]")
+
+    def test_serve_stops_on_sigterm(self):
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        tmp.close()
+        env = dict(os.environ, TAP_TAPS="bar=loop://")
+        try:
+            proc = subprocess.Popen([sys.executable, "-m", "tap.cli", "--db", tmp.name, "serve"],
+                                    env=env, stderr=subprocess.PIPE, text=True)
+            lines = []
+            for line in proc.stderr:
+                lines.append(line)
+                if "ready:" in line:
+                    proc.terminate()
+            self.assertEqual(proc.wait(10), 0)
+            self.assertTrue(any("stopped" in line for line in lines), lines)
+        finally:
+            for suffix in ("", "-wal", "-shm", "-spill"):
+                if os.path.exists(tmp.name + suffix):
+                    os.unlink(tmp.name + suffix)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Hack-n-TAP — Valve Link Tests
+Testes do protocolo confirmado da válvula contra o simulador em pty.
+"""
+
+import os
+import time
+import unittest
+
+from tap.metrics import EngineMetrics, Registry
+from tap.valve import ValveError, ValveLink, decode, encode
+
+try:
+    import serial  # noqa: F401
+    HAS_SERIAL = True
+except ImportError:
+    HAS_SERIAL = False
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestFrames(unittest.TestCase):
+
+    def test_round_trip(self):
+        frame = encode(b">", 0x2A, "1")
+        self.assertEqual(frame[:6], b">2A 1 ")
+        self.assertEqual(decode(frame, b">"), (0x2A, "1"))
+
+    def test_corrupt_frames_rejected(self):
+        frame = encode(b"<", 7, "K")
+        self.assertIsNone(decode(frame.replace(b"K", b"N"), b"<"))
+        self.assertIsNone(decode(frame, b">"))
+        self.assertIsNone(decode(b"<07 K ZZ", b"<"))
+        self.assertIsNone(decode(b"garbage", b"<"))
+
+
+@unittest.skipUnless(HAS_SERIAL and hasattr(os, "openpty"), "needs pyserial and a pty")
+class TestValveLink(unittest.TestCase):
+
+    def setUp(self):
+        from tap.simulator import ValveSimulator
+
+        self.sim = ValveSimulator()
+        self.sim.start()
+        self.metrics = EngineMetrics("sim", registry=Registry())
+        self.tags = []
+        self.link = ValveLink(self.sim.port, protocol="framed", ack_timeout=0.05, retries=3,
+                              heartbeat=0.2, boot_seconds=1.0, max_backoff=0.1,
+                              on_data=self.tags.append, metrics=self.metrics)
+        self.link.start()
+        self.assertTrue(self.link.wait_connected(2))
+
+    def tearDown(self):
+        self.link.close()
+        self.sim.stop()
+
+    def test_acknowledged_commands(self):
+        self.link.send("1")
+        self.assertTrue(self.sim.valve)
+        self.link.send("0")
+        self.assertFalse(self.sim.valve)
+        self.assertEqual([c for c, _ in self.sim.commands], ["1", "0"])
+
+    def test_lost_ack_is_retried(self):
+        self.sim.drop_replies = 1
+        self.link.send("1")
+        self.assertTrue(self.sim.valve)
+        self.assertEqual(self.metrics.retries.value, 1)
+
+    def test_corrupt_reply_is_retried(self):
+        self.sim.corrupt_replies = 1
+        self.link.send("1")
+        self.assertTrue(self.sim.valve)
+        self.assertGreaterEqual(self.metrics.retries.value, 1)
+
+    def test_restart_reapplies_state(self):
+        self.link.send("1")
+        self.sim.restart()
+        # The restart closed the valve; the link opens it again.
+        self.assertTrue(wait_for(lambda: [c for c, _ in self.sim.commands] == ["1", "1"]))
+        self.assertTrue(self.sim.valve)
+        self.assertEqual(self.metrics.restarts.value, 1)
+
+    def test_silent_device_is_dropped_and_reconnected(self):
+        self.sim.muted = True
+        start = time.monotonic()
+        with self.assertRaises(ValveError):
+            self.link.send("1")
+        # Bounded by ack_timeout * (retries + 1), not by the reconnect.
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertFalse(self.link.connected.is_set())
+        with self.assertRaises(ValveError):
+            self.link.send("0")
+        self.sim.muted = False
+        self.assertTrue(self.link.wait_connected(2))
+        self.assertGreaterEqual(self.metrics.reconnects.value, 1)
+        self.assertEqual(self.link.desired, "0")
+
+    def test_heartbeat_keeps_link_alive(self):
+        frames = self.sim.frames
+        time.sleep(0.5)
+        self.assertGreater(self.sim.frames, frames)
+        self.assertTrue(self.link.connected.is_set())
+
+    def test_tags_pass_through(self):
+        self.sim.inject_tag("ABC123")
+        self.link.send("1")
+        self.assertTrue(wait_for(lambda: b"".join(self.tags) == b"ABC123\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()